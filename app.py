@@ -1,43 +1,105 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, send_file, stream_with_context, url_for
+import os
 import threading
 import time
+from functools import partial
+from services.startup_service import start_warmup, warmup_status
+from services.events_service import broker, publish, format_sse, TooManySubscribersError
+from services.job_queue_service import SyncJobQueue, SyncCancelledError
+from services.auction_config_service import get_auctions, get_auction, AuctionNotFoundError
+from services.quota_service import web_quota, bind_quota, quota_status
 
 app = Flask(__name__)
 
-# Global sync status
-sync_status = {
-    "running": False,
-    "last_run": None,
-    "last_result": None,
-    "current_step": None,
-    "error": None
-}
+def _new_sync_status(auction_name):
+    return {
+        "auction": auction_name,
+        "running": False,
+        "last_run": None,
+        "last_result": None,
+        "current_step": None,
+        "current_job": None,
+        "error": None
+    }
+
+# Sync status per auction
+sync_statuses = {auction.name: _new_sync_status(auction.name) for auction in get_auctions()}
 sync_lock = threading.Lock()
 
-def run_sync_background():
-    """Run sync in background thread"""
-    global sync_status
+SSE_KEEPALIVE_SECONDS = 15
+SSE_MAX_SECONDS = int(os.getenv('SSE_MAX_SECONDS', '300'))
+
+def run_sync_job(auction, job):
+    """Run one queued sync job on the auction's dispatcher thread"""
     from sync_handler import handle_sync_background
     
+    if job.dry_run:
+        # Plans write nothing, so the auction's sync status is left alone
+        from services.sync_plan_service import plan_sync
+        return plan_sync(auction, job.vehicle_ids)
+    
+    sync_status = sync_statuses[auction.name]
     with sync_lock:
         sync_status["running"] = True
+        sync_status["current_job"] = job.id
         sync_status["current_step"] = "Starting sync..."
         sync_status["error"] = None
+    publish('started', auction=auction.name, job_id=job.id, kind=job.kind, vehicle_ids=job.vehicle_ids)
     
     try:
-        result = handle_sync_background(sync_status)
+        result = handle_sync_background(sync_status, job.cancel_event, job.vehicle_ids, auction)
+        
+        # Serve the new data.csv to /data without waiting for the snapshot TTL
+        from services.snapshot_service import load_snapshot, invalidate_snapshot
+        try:
+            load_snapshot(auction.name)
+        except Exception as e:
+            print(f"Warning: Failed to reload {auction.name} data snapshot: {str(e)}")
+            invalidate_snapshot(auction.name)
         
         with sync_lock:
             sync_status["running"] = False
+            sync_status["current_job"] = None
             sync_status["last_run"] = time.time()
             sync_status["last_result"] = result
             sync_status["current_step"] = "Completed"
+        publish('completed', auction=auction.name, job_id=job.id, result=result)
+        return result
+    except SyncCancelledError as e:
+        with sync_lock:
+            sync_status["running"] = False
+            sync_status["current_job"] = None
+            sync_status["current_step"] = "Cancelled"
+        publish('cancelled', auction=auction.name, job_id=job.id)
+        raise
     except Exception as e:
         with sync_lock:
             sync_status["running"] = False
+            sync_status["current_job"] = None
             sync_status["last_run"] = time.time()
             sync_status["error"] = str(e)
             sync_status["current_step"] = "Failed"
+        publish('failed', auction=auction.name, job_id=job.id, error=str(e))
+        raise
+
+# One job queue (and dispatcher thread) per auction, so a long sync of one auction
+# does not hold up the others; they share the Drive request budget in quota_service
+sync_jobs = {
+    auction.name: SyncJobQueue(partial(run_sync_job, auction), name=auction.name)
+    for auction in get_auctions()
+}
+
+def _find_job(job_id):
+    for queue in sync_jobs.values():
+        job = queue.get(job_id)
+        if job is not None:
+            return queue, job
+    return None, None
+
+@app.before_request
+def use_web_quota():
+    # Drive calls made while serving a request draw from the share syncs can't use up
+    bind_quota(web_quota)
 
 @app.route('/')
 def index():
@@ -45,34 +107,27 @@ def index():
 
 @app.route('/data', methods=['GET'])
 def get_data():
-    from services.downloading_csv_service import find_folder_by_name, find_file_by_name, download_csv_as_dataframe
-    from services.oauth_service import get_drive_service, AuthenticationError, ConfigurationError
+    from services.snapshot_service import get_snapshot, SnapshotNotFoundError, SnapshotReadError
+    from services.oauth_service import AuthenticationError, ConfigurationError
     
     try:
-        service = get_drive_service()
-        
-        # Find Revive Auctions folder
-        root_folder_id = find_folder_by_name(service, 'Revive Auctions')
-        if not root_folder_id:
-            return jsonify({"error": "Revive Auctions folder not found"}), 404
-        
-        # Find data.csv
-        data_csv_id = find_file_by_name(service, 'data.csv', root_folder_id)
-        if not data_csv_id:
-            return jsonify({"error": "data.csv not found"}), 404
-        
-        # Download and parse data.csv
-        df = download_csv_as_dataframe(service, data_csv_id)
-        if df is None:
-            return jsonify({"error": "Failed to read data.csv"}), 500
-        
-        # Replace NaN with empty strings for JSON serialization
-        df = df.fillna('')
-        
-        # Convert to list of dictionaries
-        data = df.to_dict('records')
-        
-        return jsonify({"data": data}), 200
+        # ?auction=<name> serves one auction; otherwise every auction merged
+        snapshot = get_snapshot(request.args.get('auction'))
+        catalog = snapshot["catalog"]
+        # Encoded and compressed once per snapshot and reused by every request
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response = Response(catalog.data_json_gzip(), mimetype='application/json')
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = Response(catalog.data_json(), mimetype='application/json')
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response, 200
+    
+    except (SnapshotNotFoundError, AuctionNotFoundError) as e:
+        return jsonify({"error": str(e)}), 404
+    
+    except SnapshotReadError as e:
+        return jsonify({"error": str(e)}), 500
     
     except AuthenticationError as e:
         return jsonify({
@@ -91,40 +146,367 @@ def get_data():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/sync', methods=['POST'])
-def sync():
-    global sync_status
-    
-    with sync_lock:
-        if sync_status["running"]:
+def _int_arg(name, minimum=0):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    if not value.isdigit() or int(value) < minimum:
+        raise ValueError(f"{name} must be an integer >= {minimum}")
+    return int(value)
+
+@app.route('/export/<fmt>', methods=['GET'])
+def export_catalog(fmt):
+    """
+    Stream the served catalog as csv, ndjson or parquet (parquet needs pyarrow).
+      ?auction=<name>   one auction (default: every auction merged)
+      ?since=<version>  only vehicles added, changed or removed since that catalog
+                        version, with a CHANGE column (upsert/delete); needs an
+                        auction when several are configured
+      ?offset=&limit=   a range of rows
+      ?cursor=<token>   the next page, from the X-Next-Cursor header of the previous one
+    X-Catalog-Version is the version to pass as since= on the next pull.
+    """
+    from services.snapshot_service import (
+        get_snapshot, get_changes_since, SnapshotNotFoundError, SnapshotReadError, SnapshotVersionGoneError
+    )
+    from services.export_service import (
+        EXPORT_FORMATS, ExportFormatError, ExportCursorError, encode_cursor, decode_cursor,
+        delta_frame, iter_csv, iter_ndjson, parquet_bytes
+    )
+    from services.oauth_service import AuthenticationError, ConfigurationError
+
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"Unknown export format: {fmt} (use {', '.join(EXPORT_FORMATS)})"}), 404
+
+    auction_name = request.args.get('auction')
+    try:
+        limit = _int_arg('limit', minimum=1)
+        cursor_version = None
+        if request.args.get('cursor'):
+            cursor_version, offset, since = decode_cursor(request.args['cursor'])
+        else:
+            offset = _int_arg('offset') or 0
+            since = _int_arg('since')
+    except (ValueError, ExportCursorError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    if since is not None and auction_name is None and len(get_auctions()) > 1:
+        # Vehicle IDs are numbered per auction
+        return jsonify({"error": "auction is required with since"}), 400
+
+    try:
+        if since is not None:
+            snapshot, changed, removed = get_changes_since(auction_name, since)
+            frame = delta_frame(snapshot["catalog"].frame, changed, removed)
+        else:
+            snapshot = get_snapshot(auction_name)
+            frame = snapshot["catalog"].frame
+
+        version = snapshot["version"]
+        if cursor_version is not None and cursor_version != version:
             return jsonify({
-                "success": False,
-                "message": "Sync already in progress",
-                "current_step": sync_status["current_step"]
-            }), 409
+                "error": "The catalog changed while paging; restart the export",
+                "version": version
+            }), 410
+
+        page = frame.iloc[offset:offset + limit if limit else None]
+        if fmt == 'parquet':
+            body = parquet_bytes(page)
+        else:
+            body = stream_with_context((iter_csv if fmt == 'csv' else iter_ndjson)(page))
+
+    except (SnapshotNotFoundError, AuctionNotFoundError) as e:
+        return jsonify({"error": str(e)}), 404
+
+    except SnapshotVersionGoneError as e:
+        return jsonify({"error": str(e)}), 410
+
+    except ExportFormatError as e:
+        return jsonify({"error": str(e)}), 501
+
+    except SnapshotReadError as e:
+        return jsonify({"error": str(e)}), 500
+
+    except AuthenticationError as e:
+        return jsonify({
+            "error": "Authentication failed",
+            "message": str(e),
+            "error_code": "AUTH_ERROR"
+        }), 401
+
+    except ConfigurationError as e:
+        return jsonify({
+            "error": "Configuration error",
+            "message": str(e),
+            "error_code": "CONFIG_ERROR"
+        }), 500
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    response = Response(body, mimetype=EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename=catalog-{version}.{fmt}'
+    response.headers['X-Catalog-Version'] = str(version)
+    response.headers['X-Total-Count'] = str(len(frame))
+    if limit and offset + limit < len(frame):
+        response.headers['X-Next-Cursor'] = encode_cursor(version, offset + limit, since)
+    return response, 200
+
+@app.route('/vehicles/<int:vehicle_id>/images', methods=['GET'])
+def get_vehicle_images_endpoint(vehicle_id):
+    """
+    A vehicle's gallery from images.json. Each image gets a ready "url" for the
+    resizing proxy, versioned with ?v=<md5_checksum> so browsers cache it for good.
+    """
+    from services.snapshot_service import get_vehicle_images
     
-    # Start sync in background thread
-    thread = threading.Thread(target=run_sync_background, daemon=True)
-    thread.start()
+    auction_name = request.args.get('auction')
+    if auction_name is None and len(get_auctions()) > 1:
+        # Vehicle IDs are numbered per auction
+        return jsonify({"error": "auction is required"}), 400
+    try:
+        images = get_vehicle_images(vehicle_id, auction_name)
+    except AuctionNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    
+    if images is None:
+        return jsonify({"error": f"No images found for vehicle {vehicle_id}"}), 404
+    
+    images = [
+        dict(image, url=url_for(
+            'get_vehicle_image', vehicle_id=vehicle_id, n=n, v=image.get('md5_checksum'), auction=auction_name
+        ))
+        for n, image in enumerate(images)
+    ]
+    return jsonify({"vehicle_id": vehicle_id, "images": images}), 200
+
+@app.route('/images/<int:vehicle_id>/<int:n>', methods=['GET'])
+def get_vehicle_image(vehicle_id, n):
+    """
+    Serve image n of a vehicle's gallery as a resized WebP/JPEG from the local cache.
+    URLs carrying ?v=<md5_checksum> of the current image are cached by browsers forever.
+    """
+    from services.snapshot_service import get_vehicle_images
+    from services.image_cache_service import open_image_variant, pick_width, pick_format
+    
+    auction_name = request.args.get('auction')
+    if auction_name is None and len(get_auctions()) > 1:
+        # Vehicle IDs are numbered per auction
+        return jsonify({"error": "auction is required"}), 400
+    try:
+        images = get_vehicle_images(vehicle_id, auction_name) or []
+        if n < 0 or n >= len(images):
+            return jsonify({"error": f"Image {n} not found for vehicle {vehicle_id}"}), 404
+        
+        image = images[n]
+        fmt = pick_format(request.args.get('format'), request.headers.get('Accept'))
+        # Opened here, so a cache eviction before the response is sent can't fail it
+        variant_file, mimetype, key = open_image_variant(image, pick_width(request.args.get('w', type=int)), fmt)
+    except AuctionNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    
+    response = send_file(variant_file, mimetype=mimetype, etag=False)
+    response.headers['Vary'] = 'Accept'
+    version = image.get('md5_checksum')
+    if version and request.args.get('v') == version:
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        # Unversioned URLs point at whatever image is current after the next sync
+        response.headers['Cache-Control'] = 'public, max-age=3600'
+    response.set_etag(key)
+    return response
+
+def _queue_jobs(dry_run=False):
+    """
+    Queue the jobs a POST /sync or /sync/plan body asks for, one per targeted auction,
+    and build the 202 response (or the 4xx for an invalid body).
+    """
+    body = request.get_json(silent=True) or {}
+    auction_name = body.get("auction")
+    vehicle_ids = body.get("vehicle_ids")
+    priority = body.get("priority")
+    
+    if auction_name is not None and not isinstance(auction_name, str):
+        return jsonify({"success": False, "message": "auction must be a string"}), 400
+    if vehicle_ids is not None and (
+        not isinstance(vehicle_ids, list) or not all(isinstance(v, int) and not isinstance(v, bool) for v in vehicle_ids)
+    ):
+        return jsonify({"success": False, "message": "vehicle_ids must be a list of integers"}), 400
+    if priority is not None and (not isinstance(priority, int) or isinstance(priority, bool)):
+        return jsonify({"success": False, "message": "priority must be an integer"}), 400
+    
+    if auction_name is not None:
+        if auction_name not in sync_jobs:
+            return jsonify({"success": False, "message": f"Unknown auction: {auction_name}"}), 404
+        targets = [auction_name]
+    elif vehicle_ids and len(sync_jobs) > 1:
+        # Vehicle IDs are numbered per auction
+        return jsonify({"success": False, "message": "auction is required with vehicle_ids"}), 400
+    else:
+        targets = list(sync_jobs)
+    
+    jobs = []
+    for name in targets:
+        job, coalesced = sync_jobs[name].submit(vehicle_ids=vehicle_ids, priority=priority, dry_run=dry_run)
+        jobs.append(dict(job.to_dict(), auction=name, coalesced=coalesced, status_url=f"/sync/jobs/{job.id}"))
+    
+    label = "Dry run" if dry_run else "Sync"
+    if len(jobs) == 1:
+        job = jobs[0]
+        return jsonify({
+            "success": True,
+            "message": f"Matching {label.lower()} already queued" if job["coalesced"] else f"{label} queued",
+            "job": job,
+            "coalesced": job["coalesced"],
+            "status_url": job["status_url"]
+        }), 202
     
     return jsonify({
         "success": True,
-        "message": "Sync started in background",
-        "status_url": "/sync/status"
+        "message": f"{label} queued for {len(jobs)} auctions",
+        "jobs": jobs,
+        # Dry runs leave /sync/status alone; their plans are the jobs' results
+        "status_url": "/sync/jobs" if dry_run else "/sync/status"
     }), 202
 
+@app.route('/sync', methods=['POST'])
+def sync():
+    """
+    Queue a sync job. Optional JSON body:
+      {"auction": "hyderabad", "vehicle_ids": [3, 7], "priority": 100}
+    Without an auction a full sync of every auction is queued; auctions sync in parallel.
+    Without vehicle_ids a full sync is queued; a pending full sync is reused instead of queuing another.
+    """
+    return _queue_jobs()
+
+@app.route('/sync/plan', methods=['POST'])
+def sync_plan():
+    """
+    Queue a dry run of a sync: same body as POST /sync, but nothing is written to
+    Drive. The job runs on the auction's dispatcher like a sync, between syncs and
+    on the sync share of the Drive quota; when it succeeds its result (at the
+    status_url) is what the sync would do (rows added/removed/changed, images to
+    copy, folders to move or delete) and its estimated Drive calls and duration.
+    A pending dry run for the same vehicles is reused instead of queuing another.
+    """
+    return _queue_jobs(dry_run=True)
+
+@app.route('/sync/jobs', methods=['GET'])
+def list_sync_jobs():
+    """Jobs of ?auction=<name>, or of every auction keyed by name."""
+    auction_name = request.args.get('auction')
+    if auction_name is not None:
+        if auction_name not in sync_jobs:
+            return jsonify({"error": f"Unknown auction: {auction_name}"}), 404
+        return jsonify(sync_jobs[auction_name].list_jobs()), 200
+    return jsonify({
+        "auctions": {name: queue.list_jobs() for name, queue in sync_jobs.items()}
+    }), 200
+
+@app.route('/sync/jobs/<job_id>', methods=['GET'])
+def get_sync_job(job_id):
+    queue, job = _find_job(job_id)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found"}), 404
+    return jsonify(dict(job.to_dict(), auction=queue.name)), 200
+
+@app.route('/sync/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_sync_job(job_id):
+    queue, job = _find_job(job_id)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found"}), 404
+    queue.cancel(job_id)
+    return jsonify(dict(job.to_dict(), auction=queue.name)), 202
+
+def _status_snapshot():
+    with sync_lock:
+        statuses = {name: dict(status) for name, status in sync_statuses.items()}
+    for name, status in statuses.items():
+        status["queued_jobs"] = len(sync_jobs[name].list_jobs()["queued"])
+    return statuses
+
 @app.route('/sync/status', methods=['GET'])
 def sync_status_endpoint():
-    with sync_lock:
-        status_copy = sync_status.copy()
+    """
+    Status of every auction under "auctions". The top-level fields describe
+    ?auction=<name> (default: the first auction), except "running" which is
+    true while any auction syncs.
+    """
+    try:
+        auction = get_auction(request.args.get('auction'))
+    except AuctionNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    
+    statuses = _status_snapshot()
+    status_copy = statuses[auction.name]
     
     return jsonify({
-        "running": status_copy["running"],
+        "running": any(status["running"] for status in statuses.values()),
+        "auction": auction.name,
         "current_step": status_copy["current_step"],
         "last_run": status_copy["last_run"],
         "last_result": status_copy["last_result"],
-        "error": status_copy["error"]
+        "current_job": status_copy["current_job"],
+        "queued_jobs": status_copy["queued_jobs"],
+        "error": status_copy["error"],
+        "auctions": statuses,
+        "drive_quota": quota_status()
+    }), 200
+
+@app.route('/auctions', methods=['GET'])
+def list_auctions():
+    return jsonify({"auctions": [auction.to_dict() for auction in get_auctions()]}), 200
+
+@app.route('/sync/events', methods=['GET'])
+def sync_events():
+    """
+    Server-sent events stream of sync progress. Sends the current status first,
+    then started/step/vehicle/completed/failed events as they happen.
+    Meant for operators following a sync: each stream holds a worker thread, so
+    only SSE_MAX_SUBSCRIBERS may be open and the public catalog page doesn't subscribe.
+    """
+    try:
+        subscriber = broker.subscribe()
+    except TooManySubscribersError as e:
+        return jsonify({"error": str(e)}), 503
+    
+    statuses = _status_snapshot()
+    
+    def stream():
+        try:
+            yield format_sse('status', {"auctions": statuses})
+            # Bounded lifetime frees the worker thread; EventSource reconnects on its own
+            deadline = time.time() + SSE_MAX_SECONDS
+            while time.time() < deadline:
+                payload = subscriber.next(timeout=SSE_KEEPALIVE_SECONDS)
+                yield payload if payload else ': keep-alive\n\n'
+        finally:
+            broker.unsubscribe(subscriber)
+    
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/health', methods=['GET'])
+def health():
+    from services.drive_mirror_service import mirror_stats
+    from services.oauth_service import credential_manager
+    credentials = credential_manager.status()
+    return jsonify({
+        # Degraded while background token refreshes fail; requests still use the last good token
+        "status": "degraded" if credentials["error"] else "ok",
+        "warmup": warmup_status,
+        "credentials": credentials,
+        "drive_mirror": mirror_stats()
     }), 200
 
+# Warm heavy imports, auth and the data snapshot in the background after boot
+start_warmup()
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,70 @@
+"""
+Per-row memory of the served catalog, before and after the compact representation.
+
+  records  - data.csv as df.fillna('').to_dict('records'), what /data used to hold
+  compact  - Catalog.from_frame(df): categoricals and downcast ints
+  payload  - the pre-encoded, gzip-compressed /data body the compact catalog keeps and serves
+
+Memory is what stays allocated (tracemalloc) while the representation is held,
+after the parsed DataFrame it was built from is released. "encode" is the
+JSON serialization each /data request used to pay; the compact catalog pays it
+once per snapshot.
+
+Usage: python -m benchmarks.catalog_memory [--rows 1000 10000 100000]
+"""
+import io
+import gc
+import json
+import time
+import argparse
+import tracemalloc
+import pandas as pd
+from benchmarks import drive_stub
+from services.catalog_service import Catalog
+
+def retained_bytes(build, content):
+    """Allocations still held by build(df) once df itself is gone."""
+    gc.collect()
+    tracemalloc.start()
+    df = pd.read_csv(io.BytesIO(content))
+    held = build(df)
+    del df
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return held, retained
+
+def build_records(df):
+    return df.fillna('').to_dict('records')
+
+def build_compact(df):
+    return Catalog.from_frame(df)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>8}{'records':>14}{'compact':>14}{'saved':>8}{'+ payload':>14}{'encode/request':>16}{'encode once':>13}")
+    for rows in args.rows:
+        content = drive_stub.make_catalog_csv(rows)
+        records, records_bytes = retained_bytes(build_records, content)
+        catalog, compact_bytes = retained_bytes(build_compact, content)
+
+        start = time.perf_counter()
+        json.dumps({"data": records}, separators=(',', ':'))
+        encode_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        payload = catalog.data_json_gzip()
+        encode_once_seconds = time.perf_counter() - start
+        assert json.loads(catalog.data_json())["data"] == json.loads(json.dumps({"data": records}))["data"]
+
+        print(
+            f"{rows:>8}{records_bytes / rows:>10.0f} B/row{compact_bytes / rows:>10.0f} B/row"
+            f"{1 - compact_bytes / records_bytes:>8.0%}{len(payload) / rows:>10.0f} B/row"
+            f"{encode_seconds * 1000:>14.1f}ms{encode_once_seconds * 1000:>11.1f}ms"
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+Peak memory benchmark for chunked CSV processing.
+
+Each scenario runs in a fresh interpreter and performs the CSV-heavy sync work
+against a local Drive stub serving buffer.csv/data.csv from a file on disk:
+  compare   - compare_buffer_and_data_csv() (downloads both CSVs)
+  pipeline  - run_sync_pipeline() for a full sync, as sync_handler runs it: lists
+              every source folder, copies images, writes data.csv and images.json
+
+  whole    - CHUNKED_CSV=0, the parsed catalog is passed in and held whole
+  chunked  - CHUNKED_CSV=1, the pipeline streams buffer.csv in chunks
+
+Only every --copy-every'th source folder holds an image, so large catalogs run
+in reasonable time; the rest are listed and skipped like empty folders.
+Reported memory is peak RSS growth over the interpreter's RSS after imports,
+so it only counts what the sync steps themselves allocate.
+
+Usage: python -m benchmarks.chunked_memory [--rows 25000 100000 200000] [--ceiling-mb 16] [--copy-every 500]
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+from benchmarks import drive_stub
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class FileBackedStubHttp(drive_stub.StubHttp):
+    """StubHttp that serves CSV media from a file (with Range support) and accepts resumable uploads."""
+
+    def __init__(self, csv_path, copy_every=1):
+        super().__init__(b'', b'{}', latency_ms=0)
+        self.csv_path = csv_path
+        self.csv_size = os.path.getsize(csv_path)
+        self.copy_every = copy_every
+        self.uploaded_bytes = 0
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        headers = headers or {}
+        if 'alt=media' in uri and '/files/stub-images' not in uri:
+            return self._media(headers)
+        if 'uploadType=resumable' in uri:
+            response = drive_stub.StubResponse(200, 'application/json')
+            response['location'] = 'https://stub.invalid/upload/session'
+            return response, b''
+        if uri.startswith('https://stub.invalid/upload/session'):
+            return self._upload_chunk(body, headers)
+        if body:
+            self.uploaded_bytes += len(body)
+        return super().request(uri, method, body, headers, **kwargs)
+
+    def _media(self, headers):
+        byte_range = re.match(r'bytes=(\d+)-(\d+)', headers.get('range', headers.get('Range', '')))
+        with open(self.csv_path, 'rb') as csv_file:
+            if not byte_range:
+                return drive_stub.StubResponse(200, 'text/csv'), csv_file.read()
+            start, end = int(byte_range.group(1)), min(int(byte_range.group(2)), self.csv_size - 1)
+            csv_file.seek(start)
+            content = csv_file.read(end - start + 1)
+        response = drive_stub.StubResponse(206, 'text/csv')
+        response['content-range'] = f"bytes {start}-{end}/{self.csv_size}"
+        return response, content
+
+    def _upload_chunk(self, body, headers):
+        data = body.read() if hasattr(body, 'read') else body
+        self.uploaded_bytes += len(data or b'')
+        content_range = re.match(r'bytes (\d+)-(\d+)/(\d+)', headers.get('Content-Range', ''))
+        if content_range and int(content_range.group(2)) + 1 < int(content_range.group(3)):
+            response = drive_stub.StubResponse(308, 'text/plain')
+            response['range'] = f"bytes=0-{content_range.group(2)}"
+            return response, b''
+        return drive_stub.StubResponse(200, 'application/json'), b'{"id": "stub-file"}'
+
+    def _batch_response(self, body):
+        """Every part lists a source folder; only every copy_every'th one holds an image."""
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        boundary = 'stub_batch_boundary'
+        image = {'id': 'stub-source', 'name': 'IMG_000.jpg', 'mimeType': 'image/jpeg', 'size': '250000'}
+        parts = []
+        for content_id, folder in re.findall(r'Content-ID: <([^>]+)>.*?stub(\d+)', body, re.S):
+            listing = json.dumps({'files': [image] if int(folder) % self.copy_every == 0 else []})
+            parts.append(
+                f'--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n'
+                f'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n{listing}\r\n'
+            )
+        content = ''.join(parts) + f'--{boundary}--\r\n'
+        return drive_stub.StubResponse(200, f'multipart/mixed; boundary={boundary}'), content.encode('utf-8')
+
+def write_catalog(path, rows):
+    with open(path, 'w') as csv_file:
+        for line in drive_stub.iter_catalog_lines(rows):
+            csv_file.write(line + '\n')
+
+def run_scenario(rows, copy_every):
+    """Runs inside the child interpreter and prints one JSON result line."""
+    import services.media_io_service as media_io
+    import services.drive_mirror_service as drive_mirror_service
+    from services.downloading_csv_service import compare_buffer_and_data_csv, download_csv_as_dataframe
+    from services.pipeline_service import run_sync_pipeline
+    import services.oauth_service as oauth_service
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'catalog.csv')
+        write_catalog(csv_path, rows)
+
+        drive_stub.install(rows=0, latency_ms=0)
+        # Listings are mirrored on disk, as in production, not in this process' memory
+        drive_mirror_service.MIRROR_PATH = os.path.join(tmp, 'mirror.db')
+        stub = FileBackedStubHttp(csv_path, copy_every)
+        oauth_service.build_http = lambda: stub
+        folder_ids = {
+            'buffer_folder_id': 'stub-buffer', 'images_folder_id': 'stub-images-folder',
+            'buffer_csv_id': 'stub-buffer-csv', 'data_csv_id': 'stub-data-csv', 'images_json_id': 'stub-manifest'
+        }
+
+        baseline = peak_rss_mb()
+        start = time.perf_counter()
+        same = compare_buffer_and_data_csv()
+        compare_peak = peak_rss_mb()
+        # sync_handler hands the pipeline the parsed sheet, or nothing in chunked mode
+        df = None if media_io.CHUNKED_CSV else download_csv_as_dataframe(oauth_service.get_drive_service(), 'stub-buffer-csv')
+        counts = run_sync_pipeline(df, folder_ids)
+        elapsed = time.perf_counter() - start
+
+        print(json.dumps({
+            'chunked': media_io.CHUNKED_CSV,
+            'csv_mb': os.path.getsize(csv_path) / 1024 / 1024,
+            'same': same,
+            'counts': counts,
+            'compare_mb': compare_peak - baseline,
+            'pipeline_mb': peak_rss_mb() - baseline,
+            'uploaded_mb': stub.uploaded_bytes / 1024 / 1024,
+            'seconds': elapsed
+        }))
+
+def spawn(mode, rows, ceiling_mb, copy_every):
+    env = dict(
+        os.environ,
+        CHUNKED_CSV='1' if mode == 'chunked' else '0',
+        MEMORY_CEILING_MB=str(ceiling_mb),
+        WARMUP_ON_BOOT='0',
+        DRIVE_TRACING='0',
+        DRIVE_QPS='0'
+    )
+    output = subprocess.run(
+        [
+            sys.executable, '-m', 'benchmarks.chunked_memory', '--child',
+            '--rows', str(rows), '--copy-every', str(copy_every)
+        ],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[25000, 100000, 200000])
+    parser.add_argument('--ceiling-mb', type=int, default=16)
+    parser.add_argument('--copy-every', type=int, default=500)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_scenario(args.rows[0], args.copy_every)
+        return
+
+    print(f"memory_ceiling={args.ceiling_mb}MB (chunked mode only)")
+    print(f"{'mode':<10}{'rows':>10}{'csv':>10}{'compare':>12}{'pipeline':>12}{'copied':>8}{'time':>10}")
+    for mode in ('whole', 'chunked'):
+        for rows in args.rows:
+            result = spawn(mode, rows, args.ceiling_mb, args.copy_every)
+            assert result['same'], result
+            print(
+                f"{mode:<10}{rows:>10}{result['csv_mb']:>8.1f}MB{result['compare_mb']:>10.1f}MB"
+                f"{result['pipeline_mb']:>10.1f}MB{result['counts']['completed']:>8}{result['seconds']:>9.1f}s"
+            )
+
+if __name__ == '__main__':
+    main()
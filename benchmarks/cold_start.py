@@ -0,0 +1,92 @@
+"""
+Cold-start benchmark for the web process.
+
+Each scenario runs in a fresh interpreter, like a Render deploy or scale-up:
+  cold  - WARMUP_ON_BOOT=0, first /data pays imports, discovery, auth and download
+  warm  - WARMUP_ON_BOOT=1, first /data arrives after the background warm-up finished
+
+Drive is replaced by benchmarks/drive_stub.py with a fixed simulated latency.
+
+Usage: python -m benchmarks.cold_start [--runs 5] [--rows 500] [--latency-ms 80]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+def run_scenario(scenario, rows, latency_ms):
+    """Runs inside the child interpreter and prints one JSON result line."""
+    process_start = time.perf_counter()
+
+    if scenario == 'warm':
+        from benchmarks import drive_stub
+        drive_stub.install(rows, latency_ms)
+
+    import app as web
+    booted = time.perf_counter()
+
+    if scenario == 'warm':
+        from services.startup_service import start_warmup
+        start_warmup().join()
+    else:
+        from benchmarks import drive_stub
+    ready = time.perf_counter()
+
+    client = web.app.test_client()
+    request_start = time.perf_counter()
+    if scenario == 'cold':
+        # Patching pulls in the Drive client, which the real first request would import too
+        drive_stub.install(rows, latency_ms)
+    response = client.get('/data')
+    first_request = time.perf_counter()
+
+    second_start = time.perf_counter()
+    client.get('/data')
+    second_request = time.perf_counter()
+
+    print(json.dumps({
+        'status': response.status_code,
+        'vehicles': len(response.get_json().get('data', [])),
+        'boot_ms': (booted - process_start) * 1000,
+        'warmup_ms': (ready - booted) * 1000,
+        'first_data_ms': (first_request - request_start) * 1000,
+        'second_data_ms': (second_request - second_start) * 1000
+    }))
+
+def spawn(scenario, rows, latency_ms):
+    env = dict(os.environ, WARMUP_ON_BOOT='1' if scenario == 'warm' else '0')
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.cold_start', '--child', scenario,
+         '--rows', str(rows), '--latency-ms', str(latency_ms)],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=500)
+    parser.add_argument('--latency-ms', type=int, default=80)
+    parser.add_argument('--child', choices=['cold', 'warm'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_scenario(args.child, args.rows, args.latency_ms)
+        return
+
+    print(f"rows={args.rows} drive_latency={args.latency_ms}ms runs={args.runs}")
+    print(f"{'scenario':<10}{'boot':>10}{'warm-up':>10}{'1st /data':>12}{'2nd /data':>12}")
+    for scenario in ('cold', 'warm'):
+        results = [spawn(scenario, args.rows, args.latency_ms) for _ in range(args.runs)]
+        assert all(r['status'] == 200 for r in results), results
+        median = lambda key: statistics.median(r[key] for r in results)
+        print(
+            f"{scenario:<10}{median('boot_ms'):>8.0f}ms{median('warmup_ms'):>8.0f}ms"
+            f"{median('first_data_ms'):>10.0f}ms{median('second_data_ms'):>10.0f}ms"
+        )
+
+if __name__ == '__main__':
+    main()
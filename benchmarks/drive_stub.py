@@ -0,0 +1,138 @@
+"""
+Local stand-in for the Google Drive API used by the benchmarks.
+
+install() patches services.oauth_service so get_drive_service() returns a real
+Drive client whose transport answers from memory after a simulated round trip,
+instead of loading token.json and calling Google.
+"""
+import re
+import json
+import time
+import threading
+from urllib.parse import unquote
+from datetime import datetime, timedelta
+
+DEFAULT_LATENCY_MS = 80
+IMAGES_PER_FOLDER = 6
+
+def iter_catalog_lines(rows):
+    """Yield the lines of a data.csv payload with the columns the sync produces."""
+    yield 'ID,VEHICLE DETAILS,AUCTION STARTING PRICE,LOCATION,DRIVE LINK'
+    locations = ['HYDERABAD', 'BANGALORE', 'CHENNAI', 'MUMBAI', 'PUNE']
+    for i in range(1, rows + 1):
+        yield (
+            f'{i},MARUTI SWIFT VXI 2019 TS09AB{i:04d},{150000 + i * 10},'
+            f'{locations[i % len(locations)]},https://drive.google.com/drive/folders/stub{i}'
+        )
+
+def make_catalog_csv(rows):
+    """Build a data.csv payload with the columns the sync produces."""
+    return ('\n'.join(iter_catalog_lines(rows)) + '\n').encode('utf-8')
+
+def make_image_manifest(rows, images_per_vehicle=IMAGES_PER_FOLDER):
+    """Build an images.json payload matching the data.csv built by make_catalog_csv."""
+    vehicles = {
+        str(i): [
+            {
+                'position': n,
+                'file_id': f'stub-image-{i}-{n}',
+                'source_file_id': f'stub-source-{i}-{n}',
+                'name': f'IMG_{n:03d}.jpg',
+                'mime_type': 'image/jpeg',
+                'md5_checksum': f'{i:08x}{n:024x}',
+                'thumbnail_link': None,
+                'width': 1600,
+                'height': 1200
+            }
+            for n in range(images_per_vehicle)
+        ]
+        for i in range(1, rows + 1)
+    }
+    return json.dumps({'generated_at': time.time(), 'vehicles': vehicles}).encode('utf-8')
+
+class StubResponse(dict):
+    def __init__(self, status, content_type):
+        super().__init__({'status': str(status), 'content-type': content_type})
+        self.status = status
+        self.reason = 'OK'
+
+class StubHttp:
+    """httplib2.Http look-alike serving files.list and get_media from memory."""
+
+    def __init__(self, csv_content, manifest_content, latency_ms=DEFAULT_LATENCY_MS):
+        self.csv_content = csv_content
+        self.manifest_content = manifest_content
+        self.latency = latency_ms / 1000.0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+
+        if 'alt=media' in uri:
+            if '/files/stub-images' in uri:
+                return self._media_response('application/json', self.manifest_content, headers)
+            return self._media_response('text/csv', self.csv_content, headers)
+
+        if '/batch/' in uri:
+            return self._batch_response(body)
+
+        if '/changes' in uri:
+            # Nothing ever changes in the stub Drive
+            payload = {'startPageToken': '1', 'newStartPageToken': '1', 'changes': []}
+            return StubResponse(200, 'application/json'), json.dumps(payload).encode('utf-8')
+
+        if method == 'GET' and '/files' in uri:
+            file_id = 'stub-images' if 'images.json' in unquote(uri) else 'stub-file'
+            payload = {'files': [{'id': file_id, 'name': 'stub', 'mimeType': 'text/csv'}]}
+        else:
+            payload = {'id': 'stub-file'}
+        return StubResponse(200, 'application/json'), json.dumps(payload).encode('utf-8')
+
+    def _media_response(self, content_type, content, headers):
+        """Whole file, or the requested byte range of it with a Content-Range header."""
+        match = re.match(r'bytes=(\d+)-(\d+)', (headers or {}).get('range', ''))
+        if not match:
+            return StubResponse(200, content_type), content
+        if not content:
+            response = StubResponse(416, content_type)
+            response['content-range'] = 'bytes */0'
+            return response, b''
+        start, end = int(match.group(1)), min(int(match.group(2)), len(content) - 1)
+        response = StubResponse(206, content_type)
+        response['content-range'] = f'bytes {start}-{end}/{len(content)}'
+        return response, content[start:end + 1]
+
+    def _batch_response(self, body):
+        """Answer a batch request: every part lists a source folder of IMAGES_PER_FOLDER stub images."""
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        boundary = 'stub_batch_boundary'
+        listing = json.dumps({'files': [
+            {'id': f'stub-source-{n}', 'name': f'IMG_{n:03d}.jpg', 'mimeType': 'image/jpeg', 'size': '250000'}
+            for n in range(IMAGES_PER_FOLDER)
+        ]})
+        parts = []
+        for content_id in re.findall(r'Content-ID: <([^>]+)>', body):
+            parts.append(
+                f'--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n'
+                f'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n{listing}\r\n'
+            )
+        content = ''.join(parts) + f'--{boundary}--\r\n'
+        return StubResponse(200, f'multipart/mixed; boundary={boundary}'), content.encode('utf-8')
+
+def install(rows=500, latency_ms=DEFAULT_LATENCY_MS):
+    """Route get_drive_service() through StubHttp. Returns the stub for call counting."""
+    from google.oauth2.credentials import Credentials
+    import services.oauth_service as oauth_service
+    import services.drive_mirror_service as drive_mirror_service
+
+    stub = StubHttp(make_catalog_csv(rows), make_image_manifest(rows), latency_ms)
+    creds = Credentials(token='stub-token', expiry=datetime.utcnow() + timedelta(hours=1))
+    oauth_service._load_credentials = lambda: creds
+    oauth_service.build_http = lambda: stub
+    # Keep the stub's change tokens out of the real mirror database
+    drive_mirror_service.MIRROR_PATH = ':memory:'
+    return stub
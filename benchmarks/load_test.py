@@ -0,0 +1,358 @@
+"""
+Load test of the web tier: latency percentiles and throughput of /data,
+/sync/status and / while idle, while a sync runs, while operators hold
+progress streams open and while the data snapshot keeps expiring.
+
+The app runs as deployed (gunicorn, 1 worker, 16 threads) in a child process,
+with Drive replaced by benchmarks/drive_stub.py and the auction sheet by the
+stub catalog. The client is a pure-Python asyncio HTTP/1.1 client on keep-alive
+connections: each of --concurrency users sends its next request as soon as the
+previous one is answered, for --duration seconds per endpoint.
+
+  idle            - no sync queued
+  syncing         - a targeted sync of every vehicle (folder creation, image copies
+                    and publish against the stub, paced by DRIVE_QPS) is kept running
+  subscribers     - --subscribers /sync/events streams are held open (each holds a
+                    worker thread; the ones over SSE_MAX_SUBSCRIBERS are turned away)
+                    and --overload-concurrency users, more than the 16 threads, send requests
+  snapshot_expiry - /data only, on a second server started with SNAPSHOT_TTL set to
+                    --snapshot-ttl, so the run spans several expiries and their
+                    reloads show up in the tail latencies
+
+Results are printed and written as JSON (--output). Pass a previous report as
+--baseline to print the change in p95 and throughput next to each row;
+benchmarks/load_test_baseline.json is the checked-in reference.
+
+Usage: python -m benchmarks.load_test [--duration 10] [--concurrency 8] [--rows 500]
+           [--latency-ms 80] [--subscribers 8] [--overload-concurrency 32] [--snapshot-ttl 2]
+           [--output report.json] [--baseline benchmarks/load_test_baseline.json]
+"""
+import io
+import os
+import sys
+import json
+import time
+import socket
+import tempfile
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+import urllib.request
+
+ENDPOINTS = ['/data', '/sync/status', '/']
+CONDITIONS = ['idle', 'syncing', 'subscribers', 'snapshot_expiry']
+# Conditions measuring a single endpoint; the rest measure all of ENDPOINTS
+CONDITION_ENDPOINTS = {'snapshot_expiry': ['/data']}
+HOST = '127.0.0.1'
+# gunicorn threads, as in the Procfile and render.yaml
+THREADS = 16
+
+def load_app(rows, latency_ms):
+    """The Flask app with Drive and the sheet stubbed; runs inside the gunicorn worker."""
+    import pandas as pd
+    from benchmarks import drive_stub
+    drive_stub.install(rows, latency_ms)
+
+    # The sheet "download" is the stub catalog, so a sync has real rows to copy
+    import services.downloading_csv_service as downloading_csv_service
+    catalog = drive_stub.make_catalog_csv(rows)
+    downloading_csv_service.parse_sheet_out_of_process = lambda export_url: pd.read_csv(io.BytesIO(catalog))
+
+    import app as web
+    return web.app
+
+def serve(port, rows, latency_ms):
+    from gunicorn.app.base import BaseApplication
+
+    class StubbedApplication(BaseApplication):
+        def load_config(self):
+            # Same worker model as render.yaml
+            self.cfg.set('bind', f'{HOST}:{port}')
+            self.cfg.set('workers', 1)
+            self.cfg.set('threads', THREADS)
+            self.cfg.set('timeout', 600)
+
+        def load(self):
+            return load_app(rows, latency_ms)
+
+    StubbedApplication().run()
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+def start_server(rows, latency_ms, log_file, extra_env=None):
+    port = free_port()
+    env = dict(os.environ, WARMUP_ON_BOOT='1', PYTHONUNBUFFERED='1', SHEET_URL='https://docs.google.com/spreadsheets/d/stub/edit')
+    env.pop('AUCTIONS', None)
+    env.update(extra_env or {})
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.load_test', '--serve', str(port),
+         '--rows', str(rows), '--latency-ms', str(latency_ms)],
+        env=env, stdout=log_file, stderr=subprocess.STDOUT
+    )
+
+    # Ready once the worker answers and the background warm-up has loaded the snapshot
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with {process.returncode}; see {log_file.name}")
+        try:
+            health = http_json('GET', port, '/health')
+            if health['warmup']['finished_at']:
+                if health['warmup']['error']:
+                    raise RuntimeError(f"Warm-up failed: {health['warmup']['error']}")
+                return process, port
+        except OSError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Server did not become ready")
+
+def http_json(method, port, path, body=None):
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    request = urllib.request.Request(
+        f'http://{HOST}:{port}{path}', data=data, method=method, headers={'Content-Type': 'application/json'}
+    )
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+async def fetch(reader, writer, path):
+    """One GET on an open connection. Returns (status, keep_alive)."""
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: {HOST}\r\nAccept-Encoding: gzip\r\n\r\n'.encode('ascii'))
+    await writer.drain()
+
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ', 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip().lower()
+
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection') != 'close'
+
+async def user(port, path, deadline, latencies, errors):
+    """Closed-loop client: the next request goes out when the previous one is answered."""
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        if writer is None:
+            reader, writer = await asyncio.open_connection(HOST, port)
+        start = time.perf_counter()
+        try:
+            status, keep_alive = await fetch(reader, writer, path)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            errors.append(time.perf_counter())
+            writer.close()
+            writer = None
+            continue
+        latencies.append(time.perf_counter() - start)
+        if status >= 400:
+            errors.append(status)
+        if not keep_alive:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+async def run_endpoint(port, path, duration, concurrency):
+    latencies, errors = [], []
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(user(port, path, deadline, latencies, errors) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return summarize(latencies, errors, elapsed)
+
+def summarize(latencies, errors, elapsed):
+    if len(latencies) < 2:
+        return {'requests': len(latencies), 'errors': len(errors), 'rps': len(latencies) / elapsed}
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(cuts[49] * 1000, 2),
+        'p95_ms': round(cuts[94] * 1000, 2),
+        'p99_ms': round(cuts[98] * 1000, 2),
+        'max_ms': round(max(latencies) * 1000, 2)
+    }
+
+async def keep_syncing(port, rows, stop, samples):
+    """Queue a sync of every vehicle whenever none is running, and sample whether one is."""
+    vehicle_ids = list(range(1, rows + 1))
+    while not stop.is_set():
+        status = await asyncio.to_thread(http_json, 'GET', port, '/sync/status')
+        samples.append(status['running'])
+        if not status['running'] and not status['queued_jobs']:
+            await asyncio.to_thread(http_json, 'POST', port, '/sync', {'vehicle_ids': vehicle_ids})
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.5)
+        except asyncio.TimeoutError:
+            pass
+
+async def subscribe(port, stop, statuses):
+    """Hold one /sync/events stream open until stop, reading events as an operator's page would."""
+    reader, writer = await asyncio.open_connection(HOST, port)
+    try:
+        writer.write(f'GET /sync/events HTTP/1.1\r\nHost: {HOST}\r\n\r\n'.encode('ascii'))
+        await writer.drain()
+        head = await reader.readuntil(b'\r\n\r\n')
+        status = int(head.split(b' ', 2)[1])
+        statuses.append(status)
+        while status == 200 and not stop.is_set():
+            try:
+                if not await asyncio.wait_for(reader.read(4096), timeout=0.5):
+                    break
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        writer.close()
+
+async def run_condition(port, condition, args):
+    results = {}
+    stop = asyncio.Event()
+    samples = []
+    background = []
+    statuses = []
+    concurrency = args.concurrency
+    if condition == 'syncing':
+        background.append(asyncio.create_task(keep_syncing(port, args.rows, stop, samples)))
+        # Let the sync get past parsing and into folder creation and copies
+        await asyncio.sleep(2)
+    elif condition == 'subscribers':
+        background.extend(asyncio.create_task(subscribe(port, stop, statuses)) for _ in range(args.subscribers))
+        concurrency = args.overload_concurrency
+        # Let every stream be accepted (or turned away) before measuring
+        await asyncio.sleep(1)
+    try:
+        for path in CONDITION_ENDPOINTS.get(condition, ENDPOINTS):
+            results[path] = await run_endpoint(port, path, args.duration, concurrency)
+    finally:
+        stop.set()
+        await asyncio.gather(*background)
+    if samples:
+        results['sync_running_share'] = round(sum(samples) / len(samples), 2)
+    if statuses:
+        results['streams'] = {'open': statuses.count(200), 'rejected': len(statuses) - statuses.count(200)}
+    return results
+
+def run_conditions(conditions, args, log_file, extra_env=None):
+    """Start a server, run the conditions against it one after another and stop it."""
+    process, port = start_server(args.rows, args.latency_ms, log_file, extra_env)
+    try:
+        return {condition: asyncio.run(run_condition(port, condition, args)) for condition in conditions}
+    finally:
+        process.terminate()
+        process.wait()
+
+def print_report(report, baseline=None):
+    header = f"{'condition':<16}{'endpoint':<14}{'requests':>9}{'req/s':>9}{'p50':>10}{'p95':>10}{'p99':>10}{'errors':>8}"
+    if baseline:
+        header += f"{'p95 vs base':>13}{'req/s vs base':>15}"
+    print(header)
+    for condition in CONDITIONS:
+        if condition not in report['results']:
+            continue
+        for path in CONDITION_ENDPOINTS.get(condition, ENDPOINTS):
+            row = report['results'][condition][path]
+            line = (
+                f"{condition:<16}{path:<14}{row['requests']:>9}{row['rps']:>9.1f}"
+                f"{row.get('p50_ms', 0):>8.1f}ms{row.get('p95_ms', 0):>8.1f}ms{row.get('p99_ms', 0):>8.1f}ms"
+                f"{row['errors']:>8}"
+            )
+            base = (baseline or {}).get('results', {}).get(condition, {}).get(path)
+            if base and base.get('p95_ms') and base.get('rps'):
+                line += f"{row.get('p95_ms', 0) / base['p95_ms'] - 1:>+13.0%}{row['rps'] / base['rps'] - 1:>+15.0%}"
+            print(line)
+        share = report['results'][condition].get('sync_running_share')
+        if share is not None:
+            print(f"{'':<16}(a sync was running in {share:.0%} of status samples)")
+        streams = report['results'][condition].get('streams')
+        if streams is not None:
+            print(
+                f"{'':<16}({streams['open']} event streams held open, {streams['rejected']} turned away; "
+                f"{report['config']['overload_concurrency']} users)"
+            )
+        reloads = report['results'][condition].get('snapshot_reloads')
+        if reloads is not None:
+            print(f"{'':<16}({reloads} snapshot reloads, SNAPSHOT_TTL={report['config']['snapshot_ttl_s']}s)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=10, help='seconds per endpoint and condition')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rows', type=int, default=500)
+    parser.add_argument('--latency-ms', type=int, default=80)
+    parser.add_argument('--subscribers', type=int, default=8, help='event streams held open in the subscribers condition')
+    parser.add_argument(
+        '--overload-concurrency', type=int, default=2 * THREADS, help='users in the subscribers condition'
+    )
+    parser.add_argument('--snapshot-ttl', type=int, default=2, help='SNAPSHOT_TTL in the snapshot_expiry condition')
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--baseline', help='compare against a JSON report from an earlier run')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.rows, args.latency_ms)
+        return
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+
+    # Server output (sync progress, errors) goes to a temp file named in any failure
+    with tempfile.NamedTemporaryFile('w', prefix='load_test_server-', suffix='.log', delete=False) as log_file:
+        results = run_conditions(['idle', 'syncing', 'subscribers'], args, log_file)
+        log_file.flush()
+        log_start = os.path.getsize(log_file.name)
+        results.update(run_conditions(
+            ['snapshot_expiry'], args, log_file, {'SNAPSHOT_TTL': str(args.snapshot_ttl)}
+        ))
+        # The server logs every snapshot load; the first is the initial one, not a reload
+        with open(log_file.name, 'r') as server_log:
+            server_log.seek(log_start)
+            loads = sum('data snapshot v' in line for line in server_log)
+        results['snapshot_expiry']['snapshot_reloads'] = max(loads - 1, 0)
+
+    report = {
+        'config': {
+            'duration_s': args.duration,
+            'concurrency': args.concurrency,
+            'rows': args.rows,
+            'drive_latency_ms': args.latency_ms,
+            'subscribers': args.subscribers,
+            'overload_concurrency': args.overload_concurrency,
+            'snapshot_ttl_s': args.snapshot_ttl,
+            'server': f'gunicorn --workers 1 --threads {THREADS}',
+            'python': platform.python_version(),
+            'cpus': os.cpu_count()
+        },
+        'results': results
+    }
+    print(f"rows={args.rows} drive_latency={args.latency_ms}ms concurrency={args.concurrency} duration={args.duration}s")
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+        print(f"Report written to {args.output}")
+
+if __name__ == '__main__':
+    main()
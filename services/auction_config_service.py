@@ -0,0 +1,78 @@
+import os
+import json
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_AUCTION = 'default'
+DEFAULT_ROOT_FOLDER = 'Revive Auctions'
+
+_config_lock = threading.Lock()
+_auctions = None
+
+class AuctionNotFoundError(Exception):
+    pass
+
+class Auction:
+    """One configured auction: its source sheet and its own folder tree in Drive."""
+
+    def __init__(self, name, sheet_url, root_folder):
+        self.name = name
+        self.sheet_url = sheet_url
+        self.root_folder = root_folder
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "root_folder": self.root_folder
+        }
+
+def _parse_config(raw):
+    """
+    AUCTIONS is JSON (inline or a path to a .json file):
+      [{"name": "hyderabad", "sheet_url": "...", "root_folder": "Revive Auctions - Hyderabad"}, ...]
+    root_folder defaults to "Revive Auctions - <name>".
+    """
+    if raw.strip().endswith('.json') and os.path.exists(raw.strip()):
+        with open(raw.strip(), 'r') as config_file:
+            entries = json.load(config_file)
+    else:
+        entries = json.loads(raw)
+
+    auctions = []
+    for entry in entries:
+        if not entry.get('name') or not entry.get('sheet_url'):
+            raise ValueError("Each auction in AUCTIONS needs a name and a sheet_url")
+        root_folder = entry.get('root_folder') or f"{DEFAULT_ROOT_FOLDER} - {entry['name']}"
+        auctions.append(Auction(entry['name'], entry['sheet_url'], root_folder))
+
+    names = [auction.name for auction in auctions]
+    if len(set(names)) != len(names):
+        raise ValueError("Auction names in AUCTIONS must be unique")
+    return auctions
+
+def get_auctions():
+    """
+    All configured auctions, in configuration order. Without AUCTIONS, a single
+    'default' auction uses SHEET_URL and the 'Revive Auctions' folder as before.
+    """
+    global _auctions
+    with _config_lock:
+        if _auctions is None:
+            raw = os.getenv('AUCTIONS')
+            if raw:
+                _auctions = _parse_config(raw)
+            else:
+                _auctions = [Auction(DEFAULT_AUCTION, os.getenv('SHEET_URL'), DEFAULT_ROOT_FOLDER)]
+        return list(_auctions)
+
+def get_auction(name=None):
+    """Look up an auction by name; None means the first configured auction."""
+    auctions = get_auctions()
+    if name is None:
+        return auctions[0]
+    for auction in auctions:
+        if auction.name == name:
+            return auction
+    raise AuctionNotFoundError(f"Unknown auction: {name}")
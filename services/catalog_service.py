@@ -0,0 +1,116 @@
+import sys
+import gzip
+import threading
+import pandas as pd
+
+# Text columns whose distinct values are at most this share of the rows
+# (LOCATION, make/model, status, ...) are stored as categoricals
+CATEGORY_MAX_RATIO = 0.5
+
+def compact_frame(df):
+    """
+    Shrink a catalog DataFrame in place of the object/str columns read from CSV:
+    integer columns are downcast, repetitive text columns become categoricals
+    and column names are interned.
+    Values, column order and CSV output are unchanged.
+    """
+    df = df.copy()
+    df.columns = [sys.intern(str(col)) for col in df.columns]
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_integer_dtype(series.dtype):
+            df[col] = pd.to_numeric(series, downcast='integer')
+        elif pd.api.types.is_string_dtype(series.dtype) or series.dtype == object:
+            if len(series) and series.nunique(dropna=False) <= len(series) * CATEGORY_MAX_RATIO:
+                df[col] = series.astype('category')
+    return df
+
+class Catalog:
+    """
+    The served vehicle catalog: a compact DataFrame plus the /data JSON payload,
+    encoded (plain and gzip-compressed) once on first use instead of building
+    per-row dicts for every request.
+    """
+
+    __slots__ = ('frame', '_json', '_json_gzip', '_lock')
+
+    def __init__(self, frame):
+        self.frame = frame
+        self._json = None
+        self._json_gzip = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_frame(cls, df):
+        # Missing cells are served as empty strings
+        return cls(compact_frame(df.fillna('')))
+
+    def __len__(self):
+        return len(self.frame)
+
+    def records(self):
+        """Rows as dicts (allocates per call; prefer frame or data_json for bulk reads)."""
+        return self.frame.to_dict('records')
+
+    def with_column(self, name, value):
+        """Copy of the catalog with a constant column added (e.g. AUCTION in merged catalogs)."""
+        frame = self.frame.copy()
+        frame[name] = pd.Categorical([value] * len(frame))
+        return Catalog(frame)
+
+    def _encode_json(self):
+        # pandas' C encoder, without materializing a dict per row
+        rows = self.frame.to_json(orient='records', double_precision=15, date_format='iso')
+        return ('{"data":' + rows + '}').encode('utf-8')
+
+    def data_json_gzip(self):
+        """The gzip-compressed {"data": [...]} response body, encoded once per catalog."""
+        with self._lock:
+            if self._json_gzip is None:
+                body = self._json if self._json is not None else self._encode_json()
+                self._json_gzip = gzip.compress(body, compresslevel=6)
+            return self._json_gzip
+
+    def data_json(self):
+        """
+        The {"data": [...]} response body, for clients that don't accept gzip.
+        Encoded once on the first such request and kept, so only catalogs
+        that plain clients actually read hold the uncompressed copy.
+        """
+        with self._lock:
+            if self._json is None:
+                self._json = self._encode_json()
+            return self._json
+
+def merge_catalogs(named_catalogs):
+    """One catalog across auctions, with an AUCTION column since IDs repeat between auctions."""
+    frames = [catalog.with_column('AUCTION', name).frame for name, catalog in named_catalogs]
+    merged = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    # Auctions may have different columns; fill the gaps before re-categorizing
+    merged = merged.astype({
+        col: object for col in merged.columns if isinstance(merged[col].dtype, pd.CategoricalDtype)
+    })
+    return Catalog(compact_frame(merged.fillna('')))
+
+def diff_catalogs(old, new, key='ID'):
+    """
+    Row-level changes between two catalogs of the same auction, keyed on `key`:
+    (changed, removed) sets of keys, where changed covers added and modified rows.
+    Returns None when the catalogs cannot be compared row by row
+    (missing or duplicated keys).
+    """
+    old_frame, new_frame = old.frame, new.frame
+    for frame in (old_frame, new_frame):
+        if key not in frame.columns or frame[key].duplicated().any():
+            return None
+
+    # Compare as text so categoricals and downcast ints match their CSV values
+    columns = list(dict.fromkeys(list(old_frame.columns) + list(new_frame.columns)))
+    old_rows = old_frame.set_index(key).reindex(columns=[c for c in columns if c != key]).astype(str)
+    new_rows = new_frame.set_index(key).reindex(columns=[c for c in columns if c != key]).astype(str)
+
+    common = old_rows.index.intersection(new_rows.index)
+    modified = (old_rows.loc[common] != new_rows.loc[common]).any(axis=1)
+    changed = set(new_rows.index.difference(old_rows.index)) | set(common[modified.to_numpy()])
+    removed = set(old_rows.index.difference(new_rows.index))
+    return changed, removed
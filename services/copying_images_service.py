@@ -1,30 +1,33 @@
 import os
+import time
+import random
+import threading
 import pandas as pd
-from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
-import io
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import re
+from itertools import islice
+from contextlib import nullcontext
+from googleapiclient.errors import HttpError
 from services.oauth_service import get_drive_service
+from services.drive_mirror_service import (
+    find_folder_by_name, find_file_by_name, mirrored_children, track_folder, record_file, FILE_FIELDS
+)
+from services.media_io_service import download_csv, iter_csv_chunks, CHUNKED_CSV
+from services.quota_service import current_quota, bind_quota
+from services.tracing_service import current_trace, bind_trace
 
-def find_folder_by_name(service, folder_name, parent_id=None):
-    """Find a folder by name, optionally within a parent folder."""
-    query = f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
-    if parent_id:
-        query += f" and '{parent_id}' in parents"
-    
-    results = service.files().list(q=query, fields='files(id, name)').execute()
-    files = results.get('files', [])
-    return files[0]['id'] if files else None
-
-def find_file_by_name(service, file_name, parent_id=None):
-    """Find a file by name, optionally within a parent folder."""
-    query = f"name='{file_name}' and trashed=false"
-    if parent_id:
-        query += f" and '{parent_id}' in parents"
-    
-    results = service.files().list(q=query, fields='files(id, name)').execute()
-    files = results.get('files', [])
-    return files[0]['id'] if files else None
+# Source folders listed per batch request (Drive allows up to 100) and batches in flight
+SOURCE_BATCH_SIZE = int(os.getenv('SOURCE_BATCH_SIZE', '50'))
+SOURCE_LIST_WORKERS = int(os.getenv('SOURCE_LIST_WORKERS', '4'))
+# Listings Drive rejects for rate limits or server errors are sent again in a follow-up batch,
+# up to SOURCE_LIST_RETRIES times, after SOURCE_RETRY_SECONDS doubling (with jitter) per attempt
+SOURCE_LIST_RETRIES = int(os.getenv('SOURCE_LIST_RETRIES', '3'))
+SOURCE_RETRY_SECONDS = float(os.getenv('SOURCE_RETRY_SECONDS', '1'))
+RATE_LIMIT_REASONS = ('userRateLimitExceeded', 'rateLimitExceeded')
+# Images outside these sizes (bytes) are not copied; vehicles with fewer valid images are skipped
+MIN_IMAGE_BYTES = int(os.getenv('MIN_IMAGE_BYTES', '1024'))
+MAX_IMAGE_BYTES = int(os.getenv('MAX_IMAGE_BYTES', str(50 * 1024 * 1024)))
+MIN_IMAGES_PER_VEHICLE = int(os.getenv('MIN_IMAGES_PER_VEHICLE', '1'))
 
 def create_folder(service, folder_name, parent_id=None):
     """Create a folder in Google Drive."""
@@ -36,29 +39,194 @@ def create_folder(service, folder_name, parent_id=None):
         file_metadata['parents'] = [parent_id]
     
     folder = service.files().create(body=file_metadata, fields='id').execute()
+    record_file(dict(file_metadata, id=folder.get('id')))
     return folder.get('id')
 
+FOLDER_ID_PATTERN = r'/folders/([a-zA-Z0-9_-]+)'
+
 def extract_folder_id_from_url(url):
     """Extract folder ID from Google Drive URL."""
     if not url or pd.isna(url):
         return None
     
     # Pattern: /folders/FOLDER_ID
-    match = re.search(r'/folders/([a-zA-Z0-9_-]+)', str(url))
+    match = re.search(FOLDER_ID_PATTERN, str(url))
     if match:
         return match.group(1)
     return None
 
+def extract_folder_ids(drive_links):
+    """
+    Extract folder IDs from a Series of Google Drive URLs in one pass.
+    Returns a Series aligned with the input, None where no ID was found.
+    """
+    folder_ids = drive_links.astype('string').str.extract(FOLDER_ID_PATTERN, expand=False)
+    return folder_ids.astype(object).where(folder_ids.notna(), None)
+
+def build_vehicle_tasks(df):
+    """
+    Build (vehicle_index, source_folder_id) pairs for every row of buffer.csv.
+    Rows without a DRIVE LINK column get None and are skipped by process_vehicle.
+    """
+    if 'DRIVE LINK' in df.columns:
+        source_folder_ids = extract_folder_ids(df['DRIVE LINK']).tolist()
+    else:
+        source_folder_ids = [None] * len(df)
+    return list(zip(df.index.tolist(), source_folder_ids))
+
 def get_files_in_folder(service, folder_id):
-    """Get all files in a Google Drive folder."""
+    """Get all files in a Google Drive folder, sorted by name, with image metadata."""
+    # Source folders are mirrored on first listing and re-read only when they change
+    files = mirrored_children(service, folder_id)
+    if files is None:
+        files = track_folder(service, folder_id, 'source')
+    if files is not None:
+        return sorted(files, key=lambda f: f['name'])
+    
     query = f"'{folder_id}' in parents and trashed=false"
     results = service.files().list(
         q=query,
-        fields='files(id, name, mimeType)',
+        fields=f"files({FILE_FIELDS})",
+        orderBy='name',
         pageSize=1000
     ).execute()
     return results.get('files', [])
 
+def _list_folder_batch(service, folder_ids):
+    """List several folders in one batch request. Returns {folder_id: files, or the Exception listing it raised}."""
+    responses = {}
+    
+    def on_response(request_id, response, exception):
+        responses[request_id] = exception if exception is not None else response
+    
+    # files() builds its method table on every call, so build it once per batch
+    files_resource = service.files()
+    batch = service.new_batch_http_request(callback=on_response)
+    for folder_id in folder_ids:
+        batch.add(files_resource.list(
+            q=f"'{folder_id}' in parents and trashed=false",
+            fields=f"nextPageToken, files({FILE_FIELDS})",
+            pageSize=1000
+        ), request_id=folder_id)
+    
+    # Drive counts every request inside a batch against the quota; the transport draws one
+    for _ in range(len(folder_ids) - 1):
+        current_quota().acquire()
+    batch.execute()
+    
+    listings = {}
+    for folder_id in folder_ids:
+        response = responses.get(folder_id)
+        if response is None or isinstance(response, Exception):
+            listings[folder_id] = response or ValueError("No response in batch")
+            continue
+        files = response.get('files', [])
+        page_token = response.get('nextPageToken')
+        # Folders with more than a page of files are rare; finish them one request at a time
+        while page_token:
+            response = service.files().list(
+                q=f"'{folder_id}' in parents and trashed=false",
+                fields=f"nextPageToken, files({FILE_FIELDS})",
+                pageSize=1000,
+                pageToken=page_token
+            ).execute()
+            files.extend(response.get('files', []))
+            page_token = response.get('nextPageToken')
+        listings[folder_id] = files
+    return listings
+
+def _retryable(error):
+    """Whether a failed listing is worth another try: rate limits, server errors and dropped connections."""
+    if isinstance(error, HttpError):
+        status = error.resp.status
+        if status == 429 or status >= 500:
+            return True
+        content = error.content.decode('utf-8', 'replace') if isinstance(error.content, bytes) else str(error.content)
+        return status == 403 and any(reason in content for reason in RATE_LIMIT_REASONS)
+    return isinstance(error, OSError)
+
+_list_worker = threading.local()
+
+def _start_list_worker(trace, quota):
+    bind_trace(trace)
+    bind_quota(quota)
+    # Drive clients are not thread-safe, so every worker builds its own (once, not per batch)
+    _list_worker.service = get_drive_service()
+
+def source_list_executor():
+    """
+    Thread pool for list_source_folders(). Passes that list many windows of folders share
+    one, instead of starting SOURCE_LIST_WORKERS threads and Drive clients per window.
+    """
+    return ThreadPoolExecutor(
+        max_workers=SOURCE_LIST_WORKERS, initializer=_start_list_worker, initargs=(current_trace(), current_quota())
+    )
+
+def list_source_folders(folder_ids, executor=None):
+    """
+    Listings of many source folders at once: mirrored folders are answered locally,
+    the rest are listed SOURCE_BATCH_SIZE per batch request with SOURCE_LIST_WORKERS
+    batches in parallel (on executor, from source_list_executor(), when given), and
+    recorded in the mirror for the next sync. Listings that fail with a rate limit or
+    server error are retried in smaller follow-up batches before they count as errors.
+    Returns {folder_id: files, or the Exception listing it raised}.
+    """
+    service = get_drive_service()
+    listings = {}
+    missing = []
+    for folder_id in dict.fromkeys(folder_id for folder_id in folder_ids if folder_id):
+        files = mirrored_children(service, folder_id)
+        if files is None:
+            missing.append(folder_id)
+        else:
+            listings[folder_id] = files
+    
+    if not missing:
+        return listings
+    
+    def list_batch(batch_ids):
+        batch_service = _list_worker.service
+        batch_listings = {}
+        pending = batch_ids
+        for attempt in range(SOURCE_LIST_RETRIES + 1):
+            if attempt:
+                delay = SOURCE_RETRY_SECONDS * 2 ** (attempt - 1) * random.uniform(1, 1.5)
+                print(f"Retrying {len(pending)} source folder listings in {delay:.1f}s: {batch_listings[pending[0]]}")
+                time.sleep(delay)
+            try:
+                attempt_listings = _list_folder_batch(batch_service, pending)
+            except Exception as e:
+                attempt_listings = {folder_id: e for folder_id in pending}
+            batch_listings.update(attempt_listings)
+            pending = [folder_id for folder_id, files in attempt_listings.items() if _retryable(files)]
+            if not pending:
+                break
+        for folder_id, files in batch_listings.items():
+            if not isinstance(files, Exception):
+                track_folder(batch_service, folder_id, 'source', files=files)
+        return batch_listings
+    
+    batches = [missing[i:i + SOURCE_BATCH_SIZE] for i in range(0, len(missing), SOURCE_BATCH_SIZE)]
+    with source_list_executor() if executor is None else nullcontext(executor) as executor:
+        for batch_listings in executor.map(list_batch, batches):
+            listings.update(batch_listings)
+    return listings
+
+def build_image_entry(position, source_file, copied_file):
+    """Describe one copied image for the gallery manifest, using the source listing's metadata."""
+    metadata = source_file.get('imageMediaMetadata', {})
+    return {
+        'position': position,
+        'file_id': copied_file['id'],
+        'source_file_id': source_file['id'],
+        'name': source_file['name'],
+        'mime_type': source_file['mimeType'],
+        'md5_checksum': source_file.get('md5Checksum'),
+        'thumbnail_link': source_file.get('thumbnailLink'),
+        'width': metadata.get('width'),
+        'height': metadata.get('height')
+    }
+
 def copy_file(service, file_id, new_name, destination_folder_id):
     """Copy a file to a destination folder."""
     file_metadata = {
@@ -74,18 +242,90 @@ def copy_file(service, file_id, new_name, destination_folder_id):
     
     return copied_file
 
-def process_vehicle(vehicle_index, vehicle_row, buffer_folder_id, max_images=None):
-    """Process a single vehicle: create folder and copy images."""
+def _photo_order(file):
+    """Natural name order (photo 2 before photo 10), then ID, so every sync copies in the same order."""
+    parts = re.split(r'(\d+)', file['name'].lower())
+    return [int(part) if part.isdigit() else part for part in parts], file['id']
+
+def validate_image_files(files):
+    """
+    Split a folder listing into valid images, in photo order, and the number of rejected ones.
+    Non-images are ignored; images smaller than MIN_IMAGE_BYTES (empty or broken uploads)
+    or larger than MAX_IMAGE_BYTES are rejected. Files without a reported size are kept.
+    """
+    images = [f for f in files if f['mimeType'].startswith('image/')]
+    valid = [f for f in images if 'size' not in f or MIN_IMAGE_BYTES <= int(f['size']) <= MAX_IMAGE_BYTES]
+    return sorted(valid, key=_photo_order), len(images) - len(valid)
+
+def select_image_files(files, max_images=None):
+    """Keep only valid image files from a folder listing, in photo order, optionally limited to the first max_images."""
+    image_files, _ = validate_image_files(files)
+    
+    # Limit images for testing
+    if max_images:
+        image_files = image_files[:max_images]
+    return image_files
+
+def check_source(listing, max_images=None):
+    """
+    Decide what to copy for one vehicle from its source listing (or the Exception listing it raised):
+    {'status': 'ok', 'image_files': [...]}, {'status': 'skipped', 'reason': ...}
+    or {'status': 'error', 'error': ...}.
+    """
+    if isinstance(listing, Exception):
+        return {'status': 'error', 'error': str(listing)}
+    
+    image_files, rejected = validate_image_files(listing)
+    if len(image_files) < max(MIN_IMAGES_PER_VEHICLE, 1):
+        reason = f"{len(image_files)} valid images in source folder"
+        if rejected:
+            reason += f" ({rejected} rejected by size)"
+        return {'status': 'skipped', 'reason': reason}
+    return {'status': 'ok', 'image_files': image_files[:max_images] if max_images else image_files}
+
+def plan_vehicle_sources(tasks, max_images=None):
+    """
+    Source-side pre-pass over (vehicle_index, source_folder_id) tasks: lists the source
+    folders of a window of vehicles at a time with list_source_folders(), so listing runs
+    ahead of folder creation, and yields (vehicle_index, source_folder_id, source) with
+    source from check_source() (None for vehicles without a drive link).
+    """
+    window = SOURCE_BATCH_SIZE * SOURCE_LIST_WORKERS
+    tasks = iter(tasks)
+    with source_list_executor() as executor:
+        while True:
+            chunk = list(islice(tasks, window))
+            if not chunk:
+                return
+            listings = list_source_folders((folder_id for _, folder_id in chunk), executor)
+            for vehicle_index, source_folder_id in chunk:
+                source = check_source(listings[source_folder_id], max_images) if source_folder_id else None
+                yield vehicle_index, source_folder_id, source
+
+def copy_vehicle_images(service, image_files, vehicle_folder_id, stop=None):
+    """
+    Copy a vehicle's images into its Buffer folder and return their manifest entries.
+    Stops early once the optional stop event is set.
+    """
+    images = []
+    for file in image_files:
+        if stop is not None and stop.is_set():
+            break
+        copied_file = copy_file(service, file['id'], file['name'], vehicle_folder_id)
+        images.append(build_image_entry(len(images), file, copied_file))
+    return images
+
+def process_vehicle(vehicle_index, source_folder_id, buffer_folder_id, max_images=None, source=None):
+    """
+    Process a single vehicle: check its source folder, then create its folder and copy the images.
+    source is the vehicle's check_source() result from the pre-pass; without it the folder is listed here.
+    Vehicles whose source has no valid images are skipped without creating a folder.
+    """
     # Create a new service instance for this thread
     service = get_drive_service()
+    vehicle_num = vehicle_index + 1
     
     try:
-        vehicle_num = vehicle_index + 1
-        drive_link = vehicle_row.get('DRIVE LINK', '')
-        
-        # Extract folder ID from drive link
-        source_folder_id = extract_folder_id_from_url(drive_link)
-        
         if not source_folder_id:
             print(f"Vehicle {vehicle_num}: No valid drive link found")
             return {
@@ -94,40 +334,31 @@ def process_vehicle(vehicle_index, vehicle_row, buffer_folder_id, max_images=Non
                 'reason': 'No valid drive link'
             }
         
-        # Create vehicle folder in Buffer
-        vehicle_folder_name = str(vehicle_num)
-        vehicle_folder_id = create_folder(service, vehicle_folder_name, buffer_folder_id)
-        
-        # Get all files from source folder
-        files = get_files_in_folder(service, source_folder_id)
-        
-        if not files:
-            print(f"Vehicle {vehicle_num}: No files found in source folder")
+        if source is None:
+            source = check_source(get_files_in_folder(service, source_folder_id), max_images)
+        if source['status'] == 'error':
+            raise ValueError(f"Failed to list source folder: {source['error']}")
+        if source['status'] == 'skipped':
+            print(f"Vehicle {vehicle_num}: Skipped - {source['reason']}")
             return {
                 'vehicle_num': vehicle_num,
-                'status': 'completed',
-                'images_copied': 0,
-                'folder_id': vehicle_folder_id
+                'status': 'skipped',
+                'reason': source['reason']
             }
         
-        # Filter image files
-        image_files = [f for f in files if f['mimeType'].startswith('image/')]
-        
-        # Limit images for testing
-        if max_images:
-            image_files = image_files[:max_images]
+        # Create vehicle folder in Buffer
+        vehicle_folder_name = str(vehicle_num)
+        vehicle_folder_id = create_folder(service, vehicle_folder_name, buffer_folder_id)
         
-        # Copy each file
-        copied_count = 0
-        for file in image_files:
-            copy_file(service, file['id'], file['name'], vehicle_folder_id)
-            copied_count += 1
+        # Copy the images, keeping listing metadata for the image manifest
+        images = copy_vehicle_images(service, source['image_files'], vehicle_folder_id)
         
         return {
             'vehicle_num': vehicle_num,
             'status': 'completed',
-            'images_copied': copied_count,
-            'folder_id': vehicle_folder_id
+            'images_copied': len(images),
+            'folder_id': vehicle_folder_id,
+            'images': images
         }
         
     except Exception as e:
@@ -138,7 +369,18 @@ def process_vehicle(vehicle_index, vehicle_row, buffer_folder_id, max_images=Non
             'error': str(e)
         }
 
-def copy_images_from_buffer(parallel=True, max_workers=5, max_vehicles=None, max_images_per_vehicle=None):
+def _iter_vehicle_tasks(service, buffer_csv_id, max_vehicles=None):
+    """Vehicle tasks from buffer.csv, read chunk by chunk in chunked mode."""
+    if CHUNKED_CSV:
+        chunks = iter_csv_chunks(service, buffer_csv_id)
+    else:
+        chunks = [download_csv(service, buffer_csv_id)]
+    
+    tasks = (task for chunk in chunks for task in build_vehicle_tasks(chunk))
+    return islice(tasks, max_vehicles) if max_vehicles else tasks
+
+def copy_images_from_buffer(parallel=True, max_workers=5, max_vehicles=None, max_images_per_vehicle=None,
+                            root_folder_name='Revive Auctions'):
     """
     Load buffer.csv and copy images for each vehicle.
     
@@ -147,13 +389,14 @@ def copy_images_from_buffer(parallel=True, max_workers=5, max_vehicles=None, max
         max_workers: Number of parallel workers (default: 5)
         max_vehicles: Maximum number of vehicles to process (default: None for all)
         max_images_per_vehicle: Maximum images per vehicle (default: None for all)
+        root_folder_name: Auction root folder (default: Revive Auctions)
     """
     service = get_drive_service()
     
-    # Find Revive Auctions folder
-    root_folder_id = find_folder_by_name(service, 'Revive Auctions')
+    # Find the root folder
+    root_folder_id = find_folder_by_name(service, root_folder_name)
     if not root_folder_id:
-        raise ValueError("Revive Auctions folder not found")
+        raise ValueError(f"{root_folder_name} folder not found")
     
     # Find Buffer folder
     buffer_folder_id = find_folder_by_name(service, 'Buffer', root_folder_id)
@@ -165,38 +408,28 @@ def copy_images_from_buffer(parallel=True, max_workers=5, max_vehicles=None, max
     if not buffer_csv_id:
         raise ValueError("buffer.csv not found")
     
-    # Download buffer.csv
-    request = service.files().get_media(fileId=buffer_csv_id)
-    file_buffer = io.BytesIO()
-    downloader = MediaIoBaseDownload(file_buffer, request)
-    
-    done = False
-    while not done:
-        status, done = downloader.next_chunk()
-    
-    file_buffer.seek(0)
-    df = pd.read_csv(file_buffer)
-    
-    if max_vehicles:
-        df = df.head(max_vehicles)
-    
+    # Source folders are listed and checked ahead of the copy workers, a window at a time
+    tasks = plan_vehicle_sources(_iter_vehicle_tasks(service, buffer_csv_id, max_vehicles), max_images_per_vehicle)
     results = []
     
-    if parallel and len(df) > 1:
-        # Process in parallel
+    if parallel:
+        # Keep only a bounded number of vehicles in flight, so large catalogs
+        # don't queue a future (and its result) for every row up front
+        max_in_flight = max_workers * 2
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {
-                executor.submit(process_vehicle, idx, row, buffer_folder_id, max_images_per_vehicle): idx
-                for idx, row in df.iterrows()
-            }
-            
-            for future in as_completed(futures):
-                result = future.result()
-                results.append(result)
+            pending = set()
+            for idx, source_folder_id, source in tasks:
+                if len(pending) >= max_in_flight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    results.extend(future.result() for future in done)
+                pending.add(executor.submit(
+                    process_vehicle, idx, source_folder_id, buffer_folder_id, max_images_per_vehicle, source
+                ))
+            results.extend(future.result() for future in wait(pending).done)
     else:
         # Process sequentially
-        for idx, row in df.iterrows():
-            result = process_vehicle(idx, row, buffer_folder_id, max_images_per_vehicle)
+        for idx, source_folder_id, source in tasks:
+            result = process_vehicle(idx, source_folder_id, buffer_folder_id, max_images_per_vehicle, source)
             results.append(result)
     
     # Summary
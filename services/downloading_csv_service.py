@@ -1,58 +1,38 @@
 import os
-import pandas as pd
+import sys
+import pickle
+import subprocess
 from dotenv import load_dotenv
-from googleapiclient.http import MediaIoBaseUpload, MediaIoBaseDownload
-import io
 import warnings
+from itertools import zip_longest
 from services.oauth_service import get_drive_service
+from services.drive_mirror_service import find_folder_by_name, find_file_by_name
+from services.sheet_parsing_service import build_export_url, parse_vehicle_sheet
+from services.media_io_service import download_csv, upload_csv, iter_csv_chunks, CHUNKED_CSV, PROBE_ROWS
 
 # Suppress warnings
 warnings.filterwarnings('ignore')
 
 load_dotenv()
 
-def find_file_by_name(service, file_name, parent_id=None):
-    """Find a file by name, optionally within a parent folder."""
-    query = f"name='{file_name}' and trashed=false"
-    if parent_id:
-        query += f" and '{parent_id}' in parents"
-    
-    results = service.files().list(q=query, fields='files(id, name)').execute()
-    files = results.get('files', [])
-    return files[0]['id'] if files else None
-
-def find_folder_by_name(service, folder_name, parent_id=None):
-    """Find a folder by name, optionally within a parent folder."""
-    query = f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
-    if parent_id:
-        query += f" and '{parent_id}' in parents"
-    
-    results = service.files().list(q=query, fields='files(id, name)').execute()
-    files = results.get('files', [])
-    return files[0]['id'] if files else None
+# Parse the auction sheet in a child process (SHEET_PARSE_SUBPROCESS=0 parses in-process)
+SHEET_PARSE_SUBPROCESS = os.getenv('SHEET_PARSE_SUBPROCESS', '1') != '0'
+SHEET_PARSE_TIMEOUT = int(os.getenv('SHEET_PARSE_TIMEOUT', '300'))
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 def download_csv_as_dataframe(service, file_id):
     """Download a CSV file from Google Drive and return as DataFrame."""
-    request = service.files().get_media(fileId=file_id)
-    file_buffer = io.BytesIO()
-    downloader = MediaIoBaseDownload(file_buffer, request)
-    
-    done = False
-    while not done:
-        status, done = downloader.next_chunk()
-    
-    file_buffer.seek(0)
     try:
-        df = pd.read_csv(file_buffer)
+        df = download_csv(service, file_id)
         return df
     except:
         return None
 
-def compare_buffer_and_data_csv():
+def compare_buffer_and_data_csv(root_folder_name='Revive Auctions'):
     """Compare buffer.csv and data.csv (first 3 columns only) to check if they're the same."""
     service = get_drive_service()
     
-    root_folder_id = find_folder_by_name(service, 'Revive Auctions')
+    root_folder_id = find_folder_by_name(service, root_folder_name)
     if not root_folder_id:
         return False
     
@@ -62,6 +42,9 @@ def compare_buffer_and_data_csv():
     if not buffer_csv_id or not data_csv_id:
         return False
     
+    if CHUNKED_CSV:
+        return _compare_csv_chunks(service, buffer_csv_id, data_csv_id)
+    
     buffer_df = download_csv_as_dataframe(service, buffer_csv_id)
     data_df = download_csv_as_dataframe(service, data_csv_id)
     
@@ -75,88 +58,79 @@ def compare_buffer_and_data_csv():
     # Compare DataFrames
     return buffer_subset.equals(data_subset)
 
-def parse_and_load_vehicle_data():
+def _compare_csv_chunks(service, buffer_csv_id, data_csv_id, chunk_rows=PROBE_ROWS * 10):
+    """Chunked version of the comparison: both files are read chunk_rows at a time, side by side."""
+    # Empty or unreadable files never match, as in the whole-file comparison
+    compared = False
+    try:
+        pairs = zip_longest(
+            iter_csv_chunks(service, buffer_csv_id, chunk_rows),
+            iter_csv_chunks(service, data_csv_id, chunk_rows)
+        )
+        for buffer_chunk, data_chunk in pairs:
+            if buffer_chunk is None or data_chunk is None:
+                return False
+            if not buffer_chunk.iloc[:, :3].equals(data_chunk.iloc[:, :3]):
+                return False
+            compared = True
+    except:
+        return False
+    return compared
+
+def parse_sheet_out_of_process(export_url):
+    """
+    Run parse_vehicle_sheet() in a child interpreter and load the pickled frame it
+    returns. Falls back to parsing in this process when SHEET_PARSE_SUBPROCESS=0.
+    """
+    if not SHEET_PARSE_SUBPROCESS:
+        return parse_vehicle_sheet(export_url)
+    
+    result = subprocess.run(
+        [sys.executable, '-m', 'services.sheet_parsing_service', export_url],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        timeout=SHEET_PARSE_TIMEOUT
+    )
+    if result.returncode != 0:
+        errors = result.stderr.decode('utf-8', 'replace').strip().splitlines()
+        raise ValueError(f"Failed to parse sheet: {errors[-1] if errors else 'parser exited with ' + str(result.returncode)}")
+    return pickle.loads(result.stdout)
+
+def parse_and_load_vehicle_data(upload=True, sheet_url=None, root_folder_name='Revive Auctions'):
     """
-    Load and parse the Excel file from Google Sheets URL.
+    Load and parse the Excel file from Google Sheets URL (SHEET_URL unless given).
     Extracts only vehicle data, excluding the auction closing header.
-    Uploads the data to buffer.csv in Google Drive.
+    Uploads the data to buffer.csv in the root folder (unless upload=False)
+    and returns the parsed DataFrame.
     """
-    sheet_url = os.getenv('SHEET_URL')
+    sheet_url = sheet_url or os.getenv('SHEET_URL')
     
     if not sheet_url:
         raise ValueError("SHEET_URL not found in environment variables")
     
-    # Convert Google Sheets URL to export format
-    # Extract the document ID and gid if present
-    if '/d/' in sheet_url:
-        doc_id = sheet_url.split('/d/')[1].split('/')[0]
-        gid = '0'  # Default sheet
-        if 'gid=' in sheet_url:
-            gid = sheet_url.split('gid=')[1].split('&')[0].split('#')[0]
-        export_url = f'https://docs.google.com/spreadsheets/d/{doc_id}/export?format=xlsx&gid={gid}'
-    else:
-        raise ValueError("Invalid Google Sheets URL format")
-    
-    # Read the Excel file
-    df = pd.read_excel(export_url)
-    
-    # Find the row that contains "ONLINE AUCTION CLOSING" and skip it
-    # Look for the header row with vehicle details
-    header_keywords = ['VEHICLE DETAILS', 'LOCATION', 'DRIVE LINK']
-    
-    # Find the actual header row
-    header_row_idx = None
-    for idx, row in df.iterrows():
-        row_str = ' '.join([str(val).upper() for val in row if pd.notna(val)])
-        if any(keyword in row_str for keyword in header_keywords):
-            header_row_idx = idx
-            break
-    
-    if header_row_idx is not None:
-        # Set the correct header row
-        df.columns = df.iloc[header_row_idx]
-        # Keep only data after the header row
-        df = df.iloc[header_row_idx + 1:].reset_index(drop=True)
-    
-    # Remove any rows that contain "ONLINE AUCTION CLOSING"
-    df = df[~df.astype(str).apply(lambda row: row.str.contains('ONLINE AUCTION CLOSING', case=False, na=False).any(), axis=1)]
-    
-    # Remove completely empty rows
-    df = df.dropna(how='all')
-    
-    # Clean up column names - convert to string and strip
-    df.columns = [str(col).strip() if pd.notna(col) else f'Unnamed_{i}' for i, col in enumerate(df.columns)]
-    
-    # Remove any unnamed columns from source
-    df = df[[col for col in df.columns if not col.startswith('Unnamed')]]
-    
-    # Add ID column as the first column
-    df.insert(0, 'ID', range(1, len(df) + 1))
+    # Parse in a separate process so XLSX decompression and row matching
+    # don't hold the GIL of the worker serving web requests
+    df = parse_sheet_out_of_process(build_export_url(sheet_url))
+    
+    if not upload:
+        return df
     
     # Upload to buffer.csv in Google Drive
     service = get_drive_service()
     
-    # Find the Revive Auctions folder
-    root_folder_id = find_folder_by_name(service, 'Revive Auctions')
+    # Find the root folder
+    root_folder_id = find_folder_by_name(service, root_folder_name)
     if not root_folder_id:
-        raise ValueError("Revive Auctions folder not found in Google Drive")
+        raise ValueError(f"{root_folder_name} folder not found in Google Drive")
     
     # Find buffer.csv
     buffer_csv_id = find_file_by_name(service, 'buffer.csv', root_folder_id)
     if not buffer_csv_id:
-        raise ValueError("buffer.csv not found in Revive Auctions folder")
-    
-    # Convert DataFrame to CSV
-    csv_buffer = io.BytesIO()
-    df.to_csv(csv_buffer, index=False, encoding='utf-8')
-    csv_buffer.seek(0)
+        raise ValueError(f"buffer.csv not found in {root_folder_name} folder")
     
     # Upload to Google Drive
-    media = MediaIoBaseUpload(csv_buffer, mimetype='text/csv', resumable=True)
-    service.files().update(
-        fileId=buffer_csv_id,
-        media_body=media
-    ).execute()
+    upload_csv(service, buffer_csv_id, df)
+    return df
 
 if __name__ == '__main__':
     parse_and_load_vehicle_data()
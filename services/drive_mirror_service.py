@@ -0,0 +1,414 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Local SQLite mirror of the Drive folders the sync works in (auction trees and
+# vehicle source folders), kept current with the Drive Changes API. Lookups and
+# listings of mirrored folders are answered locally; anything not mirrored falls
+# back to the Drive API. DRIVE_MIRROR=0 turns it off.
+MIRROR_ENABLED = os.getenv('DRIVE_MIRROR', '1') != '0'
+MIRROR_PATH = os.getenv('DRIVE_MIRROR_PATH', '.drive_mirror.sqlite3')
+# Seconds between changes.list polls, made by a background thread; a sync forces one when it starts
+MIRROR_MAX_AGE = int(os.getenv('DRIVE_MIRROR_MAX_AGE', '10'))
+# Lookups fall back to the Drive API once the last successful poll is this old (the poller is failing)
+MIRROR_STALE_AFTER = int(os.getenv('DRIVE_MIRROR_STALE_AFTER', str(3 * MIRROR_MAX_AGE)))
+# First retry delay after a failed poll; doubles up to MIRROR_RETRY_MAX_SECONDS
+MIRROR_RETRY_SECONDS = int(os.getenv('DRIVE_MIRROR_RETRY_SECONDS', '10'))
+MIRROR_RETRY_MAX_SECONDS = int(os.getenv('DRIVE_MIRROR_RETRY_MAX_SECONDS', '300'))
+# Source folder listings are re-read after this long, since thumbnailLink URLs expire
+SOURCE_LISTING_TTL = int(os.getenv('DRIVE_MIRROR_SOURCE_TTL', '3600'))
+
+FOLDER_MIME = 'application/vnd.google-apps.folder'
+FILE_FIELDS = 'id, name, mimeType, parents, trashed, size, md5Checksum, modifiedTime, thumbnailLink, imageMediaMetadata(width, height)'
+CHANGE_FIELDS = f"nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}))"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    mime_type TEXT,
+    parent TEXT,
+    md5 TEXT,
+    modified_time TEXT,
+    resource TEXT
+);
+CREATE INDEX IF NOT EXISTS files_parent ON files (parent, name);
+CREATE TABLE IF NOT EXISTS folders (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    kind TEXT,
+    listed_at REAL
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+class DriveMirror:
+    """
+    Folders in the `folders` table have their complete child listing in `files`.
+    Children of other folders are unknown, and lookups there return None.
+    Changes are applied by a daemon thread every MIRROR_MAX_AGE seconds, so lookups
+    (which run on request threads) never wait on the Changes API.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._refreshed_at = 0.0
+        self._poller = None
+        self._poller_lock = threading.Lock()
+        self.refresh_error = None
+        self.hits = 0
+        self.misses = 0
+
+    # Changes feed
+
+    def start_poller(self):
+        """Start the background changes poller once per process."""
+        with self._poller_lock:
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name='drive-mirror-poller', daemon=True)
+                self._poller.start()
+
+    def _poll(self):
+        from services.oauth_service import get_drive_service
+        retry_delay = MIRROR_RETRY_SECONDS
+        service = None
+        while True:
+            try:
+                if service is None:
+                    service = get_drive_service()
+                self.refresh(service)
+                self.refresh_error = None
+                retry_delay = MIRROR_RETRY_SECONDS
+                time.sleep(MIRROR_MAX_AGE)
+            except Exception as e:
+                self.refresh_error = str(e)
+                logger.warning(f"Drive mirror poll failed, retrying in {retry_delay}s: {str(e)}")
+                time.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, MIRROR_RETRY_MAX_SECONDS)
+
+    def is_fresh(self):
+        return time.time() - self._refreshed_at < MIRROR_STALE_AFTER
+
+    def refresh(self, service, force=False):
+        """Apply pending Drive changes. Polls at most every MIRROR_MAX_AGE seconds unless forced."""
+        with self._refresh_lock:
+            if not force and time.time() - self._refreshed_at < MIRROR_MAX_AGE:
+                return
+            token = self._ensure_token(service)
+            applied = 0
+            while token:
+                try:
+                    response = service.changes().list(
+                        pageToken=token,
+                        fields=CHANGE_FIELDS,
+                        pageSize=1000,
+                        includeRemoved=True,
+                        spaces='drive'
+                    ).execute()
+                except Exception as e:
+                    if 'pageToken' in str(e) or 'Invalid Value' in str(e):
+                        logger.warning(f"Drive change token rejected, rebuilding mirror: {str(e)}")
+                        self.reset()
+                        self._ensure_token(service)
+                        return
+                    raise
+
+                changes = response.get('changes', [])
+                token = response.get('nextPageToken')
+                with self._lock:
+                    self._conn.execute('BEGIN')
+                    try:
+                        for change in changes:
+                            self._apply_change(change)
+                        self._set_state('page_token', token or response.get('newStartPageToken'))
+                        self._conn.execute('COMMIT')
+                    except Exception:
+                        self._conn.execute('ROLLBACK')
+                        raise
+                applied += len(changes)
+            self._refreshed_at = time.time()
+            if applied:
+                logger.debug(f"Applied {applied} Drive changes to the mirror")
+
+    def _ensure_token(self, service):
+        """The page token must exist before anything is listed, so no change is missed in between."""
+        with self._lock:
+            token = self._get_state('page_token')
+        if token is None:
+            token = service.changes().getStartPageToken().execute()['startPageToken']
+            with self._lock:
+                self._set_state('page_token', token)
+        return token
+
+    def _apply_change(self, change):
+        file_id = change.get('fileId')
+        resource = change.get('file')
+        if change.get('removed') or resource is None or resource.get('trashed'):
+            self._delete_tree([file_id])
+            return
+
+        if resource.get('mimeType') == FOLDER_MIME:
+            self._conn.execute('UPDATE folders SET name = ? WHERE id = ?', (resource.get('name'), file_id))
+
+        parent = self._tracked_parent(resource.get('parents') or [])
+        if parent:
+            self._upsert(resource, parent)
+        elif self._conn.execute('SELECT 1 FROM files WHERE id = ?', (file_id,)).fetchone():
+            # Moved out of every mirrored folder (auction roots stay tracked wherever they live)
+            self._conn.execute('DELETE FROM files WHERE id = ?', (file_id,))
+            if not self._conn.execute("SELECT 1 FROM folders WHERE id = ? AND kind = 'root'", (file_id,)).fetchone():
+                self._delete_tree([file_id])
+
+    def _tracked_parent(self, parents):
+        for parent in parents:
+            if self._conn.execute('SELECT 1 FROM folders WHERE id = ?', (parent,)).fetchone():
+                return parent
+        return None
+
+    def _upsert(self, resource, parent):
+        self._conn.execute(
+            'INSERT OR REPLACE INTO files (id, name, mime_type, parent, md5, modified_time, resource) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (
+                resource['id'], resource.get('name'), resource.get('mimeType'), parent,
+                resource.get('md5Checksum'), resource.get('modifiedTime'), json.dumps(resource)
+            )
+        )
+
+    def _delete_tree(self, file_ids):
+        """Forget files, and for folders everything mirrored below them."""
+        pending = list(file_ids)
+        while pending:
+            file_id = pending.pop()
+            pending.extend(row[0] for row in self._conn.execute('SELECT id FROM files WHERE parent = ?', (file_id,)))
+            self._conn.execute('DELETE FROM files WHERE id = ?', (file_id,))
+            self._conn.execute('DELETE FROM folders WHERE id = ?', (file_id,))
+
+    def _get_state(self, key):
+        row = self._conn.execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key, value):
+        self._conn.execute('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)', (key, value))
+
+    def reset(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM files')
+            self._conn.execute('DELETE FROM folders')
+            self._conn.execute('DELETE FROM state')
+
+    # Mirroring folders
+
+    def track_folder(self, service, folder_id, kind='folder', name=None, files=None):
+        """
+        Mirror a folder's children. Lists them from Drive unless the caller already
+        has a complete listing (files with at least FILE_FIELDS). Returns the children.
+        """
+        self._ensure_token(service)
+        if files is None:
+            files = []
+            page_token = None
+            while True:
+                response = service.files().list(
+                    q=f"'{folder_id}' in parents and trashed=false",
+                    fields=f"nextPageToken, files({FILE_FIELDS})",
+                    pageSize=1000,
+                    pageToken=page_token
+                ).execute()
+                files.extend(response.get('files', []))
+                page_token = response.get('nextPageToken')
+                if not page_token:
+                    break
+
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                self._conn.execute('DELETE FROM files WHERE parent = ?', (folder_id,))
+                for resource in files:
+                    self._upsert(resource, folder_id)
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO folders (id, name, kind, listed_at) VALUES (?, ?, ?, ?)',
+                    (folder_id, name, kind, time.time())
+                )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return files
+
+    def is_tracked(self, folder_id):
+        with self._lock:
+            row = self._conn.execute('SELECT kind, listed_at FROM folders WHERE id = ?', (folder_id,)).fetchone()
+        if row is None:
+            return False
+        kind, listed_at = row
+        return kind != 'source' or time.time() - listed_at < SOURCE_LISTING_TTL
+
+    # Local queries
+
+    def children(self, service, folder_id, folders_only=False):
+        """
+        Children of a mirrored folder ordered by name, or None if the folder is not mirrored
+        or the mirror has not caught up with Drive within MIRROR_STALE_AFTER seconds.
+        """
+        self.start_poller()
+        if not self.is_fresh() or not self.is_tracked(folder_id):
+            self.misses += 1
+            return None
+        query = 'SELECT resource FROM files WHERE parent = ?'
+        if folders_only:
+            query += f" AND mime_type = '{FOLDER_MIME}'"
+        with self._lock:
+            rows = self._conn.execute(query + ' ORDER BY name', (folder_id,)).fetchall()
+        self.hits += 1
+        return [json.loads(row[0]) for row in rows]
+
+    def find_child(self, service, parent_id, name, folders_only=False):
+        """
+        Returns (known, file_id). known is False when parent_id is not mirrored;
+        file_id is None when the mirror knows there is no such child.
+        """
+        files = self.children(service, parent_id, folders_only)
+        if files is None:
+            return False, None
+        match = next((f['id'] for f in files if f['name'] == name), None)
+        return True, match
+
+    def find_root(self, name):
+        """ID of a mirrored auction root folder by name, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM folders WHERE kind = 'root' AND name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    # Write-through for the sync's own changes, so reads within a sync see them
+    # before they come back through the changes feed
+
+    def record_file(self, resource):
+        with self._lock:
+            parent = self._tracked_parent(resource.get('parents') or [])
+            if parent:
+                self._upsert(resource, parent)
+
+    def record_move(self, file_id, new_parent_id):
+        with self._lock:
+            if self._tracked_parent([new_parent_id]):
+                self._conn.execute('UPDATE files SET parent = ? WHERE id = ?', (new_parent_id, file_id))
+            else:
+                self._delete_tree([file_id])
+
+    def record_delete(self, file_ids):
+        with self._lock:
+            self._delete_tree(list(file_ids))
+
+    def stats(self):
+        with self._lock:
+            files = self._conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+            folders = self._conn.execute('SELECT COUNT(*) FROM folders').fetchone()[0]
+        return {
+            "path": self.path,
+            "files": files,
+            "folders": folders,
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshed_at": self._refreshed_at or None,
+            "refresh_error": self.refresh_error
+        }
+
+_mirror_lock = threading.Lock()
+_mirror = None
+
+def get_mirror():
+    """The process-wide mirror, or None when disabled."""
+    global _mirror
+    if not MIRROR_ENABLED:
+        return None
+    with _mirror_lock:
+        if _mirror is None:
+            _mirror = DriveMirror(MIRROR_PATH)
+        return _mirror
+
+def _safely(action, default=None):
+    """Run a mirror operation; on any error log it and let the caller use the Drive API."""
+    mirror = get_mirror()
+    if mirror is None:
+        return default
+    try:
+        return action(mirror)
+    except Exception as e:
+        logger.warning(f"Drive mirror unavailable, using the Drive API: {str(e)}")
+        return default
+
+def mirrored_children(service, folder_id, folders_only=False):
+    """Children of folder_id from the mirror, or None if the caller must list Drive."""
+    return _safely(lambda mirror: mirror.children(service, folder_id, folders_only))
+
+def mirrored_find(service, name, parent_id=None, folders_only=False):
+    """(known, file_id) for a named child of parent_id (or an auction root when parent_id is None)."""
+    def find(mirror):
+        if parent_id is None:
+            root_id = mirror.find_root(name) if folders_only else None
+            return (root_id is not None), root_id
+        return mirror.find_child(service, parent_id, name, folders_only)
+    return _safely(find, (False, None))
+
+def find_by_name(service, name, parent_id=None, folders_only=False):
+    """ID of a named file (or folder) within parent_id, from the mirror when it knows, otherwise from Drive."""
+    known, file_id = mirrored_find(service, name, parent_id, folders_only)
+    if known:
+        return file_id
+    
+    query = f"name='{name}' and trashed=false"
+    if folders_only:
+        query += f" and mimeType='{FOLDER_MIME}'"
+    if parent_id:
+        query += f" and '{parent_id}' in parents"
+    
+    results = service.files().list(q=query, fields='files(id, name)').execute()
+    files = results.get('files', [])
+    return files[0]['id'] if files else None
+
+def find_folder_by_name(service, folder_name, parent_id=None):
+    """Find a folder by name, optionally within a parent folder."""
+    return find_by_name(service, folder_name, parent_id, folders_only=True)
+
+def find_file_by_name(service, file_name, parent_id=None):
+    """Find a file by name, optionally within a parent folder."""
+    return find_by_name(service, file_name, parent_id)
+
+def track_folder(service, folder_id, kind='folder', name=None, files=None):
+    """Mirror a folder's children and return them, or None when the mirror is off or failing."""
+    return _safely(lambda mirror: mirror.track_folder(service, folder_id, kind, name, files))
+
+def ensure_tracked(service, folder_id, kind='folder', name=None):
+    """Mirror a folder unless it already is (one listing the first time, nothing after)."""
+    def ensure(mirror):
+        if not mirror.is_tracked(folder_id):
+            mirror.track_folder(service, folder_id, kind, name)
+    _safely(ensure)
+
+def refresh_mirror(service, force=True):
+    _safely(lambda mirror: mirror.refresh(service, force))
+
+def record_file(resource):
+    _safely(lambda mirror: mirror.record_file(resource))
+
+def record_move(file_id, new_parent_id):
+    _safely(lambda mirror: mirror.record_move(file_id, new_parent_id))
+
+def record_delete(file_ids):
+    _safely(lambda mirror: mirror.record_delete(file_ids))
+
+def mirror_stats():
+    return _safely(lambda mirror: mirror.stats())
@@ -0,0 +1,94 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+
+# Events buffered per client; a slow client loses the oldest ones and is told how many
+SUBSCRIBER_BUFFER = int(os.getenv('SSE_SUBSCRIBER_BUFFER', '100'))
+# Every open stream holds one of gunicorn's worker threads (--threads 16 in the Procfile)
+# for up to SSE_MAX_SECONDS, so this stays well below the thread count; the rest serve /data
+MAX_SUBSCRIBERS = int(os.getenv('SSE_MAX_SUBSCRIBERS', '4'))
+
+class TooManySubscribersError(Exception):
+    pass
+
+def format_sse(event_type, data, event_id=None):
+    """Encode one server-sent event."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return '\n'.join(lines) + '\n\n'
+
+class Subscriber:
+    """Bounded mailbox of encoded events for one connected client."""
+
+    def __init__(self, max_events):
+        self._events = deque(maxlen=max_events)
+        self._condition = threading.Condition()
+        self.dropped = 0
+
+    def push(self, payload):
+        with self._condition:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append(payload)
+            self._condition.notify()
+
+    def next(self, timeout):
+        """Wait up to timeout seconds for the next event. Returns None on timeout."""
+        with self._condition:
+            if not self._events:
+                self._condition.wait(timeout)
+            if not self._events:
+                return None
+            payload = self._events.popleft()
+            if self.dropped:
+                payload = format_sse('lagged', {'dropped': self.dropped}) + payload
+                self.dropped = 0
+            return payload
+
+class EventBroker:
+    """In-process broadcast channel: every published event is encoded once and fanned out to all subscribers."""
+
+    def __init__(self, max_subscribers=MAX_SUBSCRIBERS, buffer_size=SUBSCRIBER_BUFFER):
+        self.max_subscribers = max_subscribers
+        self.buffer_size = buffer_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._next_id = 1
+
+    def subscribe(self):
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribersError(f"Too many event subscribers (limit {self.max_subscribers})")
+            subscriber = Subscriber(self.buffer_size)
+            self._subscribers.add(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event_type, data=None):
+        data = dict(data or {}, time=time.time())
+        with self._lock:
+            event_id = self._next_id
+            self._next_id += 1
+            subscribers = list(self._subscribers)
+
+        payload = format_sse(event_type, data, event_id)
+        for subscriber in subscribers:
+            subscriber.push(payload)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+# Sync events: started, step, vehicle, completed, failed
+broker = EventBroker()
+
+def publish(event_type, **data):
+    broker.publish(event_type, data)
@@ -0,0 +1,81 @@
+import os
+import io
+import json
+import base64
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401 - pandas' Parquet engine; optional, only /export/parquet needs it
+except ImportError:
+    pyarrow = None
+
+# Rows encoded per streamed chunk of a CSV/NDJSON export
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', '5000'))
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+class ExportFormatError(Exception):
+    pass
+
+class ExportCursorError(Exception):
+    pass
+
+def encode_cursor(version, offset, since=None):
+    """Opaque next-page token: the catalog version being paged, the next row and the delta base."""
+    payload = json.dumps({'v': version, 'o': offset, 's': since}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Return (version, offset, since) from a cursor made by encode_cursor()."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        version, offset, since = int(payload['v']), int(payload['o']), payload['s']
+    except Exception:
+        raise ExportCursorError("Invalid cursor")
+    if offset < 0 or (since is not None and not isinstance(since, int)):
+        raise ExportCursorError("Invalid cursor")
+    return version, offset, since
+
+def delta_frame(frame, changed, removed):
+    """
+    Incremental export rows: the current rows of changed (added or modified) vehicles,
+    then one row per removed vehicle with only its ID. The CHANGE column says which.
+    """
+    upserts = frame[frame['ID'].isin(changed)].assign(CHANGE='upsert')
+    deletes = pd.DataFrame('', index=range(len(removed)), columns=frame.columns)
+    deletes['ID'] = sorted(removed)
+    deletes['CHANGE'] = 'delete'
+    if deletes.empty:
+        return upserts.reset_index(drop=True)
+    return pd.concat([upserts, deletes], ignore_index=True)
+
+def iter_csv(frame, chunk_rows=None):
+    """Stream a frame as CSV, encoding chunk_rows rows at a time."""
+    chunk_rows = chunk_rows or EXPORT_CHUNK_ROWS
+    yield frame.iloc[:0].to_csv(index=False)
+    for start in range(0, len(frame), chunk_rows):
+        yield frame.iloc[start:start + chunk_rows].to_csv(index=False, header=False)
+
+def iter_ndjson(frame, chunk_rows=None):
+    """Stream a frame as newline-delimited JSON objects, chunk_rows rows at a time."""
+    chunk_rows = chunk_rows or EXPORT_CHUNK_ROWS
+    for start in range(0, len(frame), chunk_rows):
+        lines = frame.iloc[start:start + chunk_rows].to_json(
+            orient='records', lines=True, double_precision=15, date_format='iso'
+        )
+        yield lines if lines.endswith('\n') else lines + '\n'
+
+def parquet_bytes(frame):
+    """
+    Encode a frame as one Parquet file. Not streamed: the footer is written last,
+    so page with limit/cursor to bound the response size.
+    """
+    if pyarrow is None:
+        raise ExportFormatError("Parquet export requires pyarrow; use csv or ndjson")
+    buffer = io.BytesIO()
+    frame.to_parquet(buffer, index=False)
+    return buffer.getvalue()
@@ -1,27 +1,8 @@
-from googleapiclient.http import MediaFileUpload
-import io
-from googleapiclient.http import MediaIoBaseUpload
 from services.oauth_service import get_drive_service
-
-def find_folder_by_name(service, folder_name, parent_id=None):
-    """Find a folder by name, optionally within a parent folder."""
-    query = f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
-    if parent_id:
-        query += f" and '{parent_id}' in parents"
-    
-    results = service.files().list(q=query, fields='files(id, name)').execute()
-    files = results.get('files', [])
-    return files[0]['id'] if files else None
-
-def find_file_by_name(service, file_name, parent_id=None):
-    """Find a file by name, optionally within a parent folder."""
-    query = f"name='{file_name}' and trashed=false"
-    if parent_id:
-        query += f" and '{parent_id}' in parents"
-    
-    results = service.files().list(q=query, fields='files(id, name)').execute()
-    files = results.get('files', [])
-    return files[0]['id'] if files else None
+from services.drive_mirror_service import (
+    find_folder_by_name, find_file_by_name, record_file, refresh_mirror, ensure_tracked
+)
+from services.media_io_service import build_media
 
 def create_folder(service, folder_name, parent_id=None):
     """Create a folder in Google Drive."""
@@ -33,40 +14,42 @@ def create_folder(service, folder_name, parent_id=None):
         file_metadata['parents'] = [parent_id]
     
     folder = service.files().create(body=file_metadata, fields='id').execute()
+    record_file(dict(file_metadata, id=folder.get('id')))
     return folder.get('id')
 
-def create_csv_file(service, file_name, parent_id=None):
-    """Create an empty CSV file in Google Drive."""
+def create_csv_file(service, file_name, parent_id=None, mimetype='text/csv'):
+    """Create an empty CSV (or other text) file in Google Drive."""
     file_metadata = {
         'name': file_name,
-        'mimeType': 'text/csv'
+        'mimeType': mimetype
     }
     if parent_id:
         file_metadata['parents'] = [parent_id]
     
     # Create empty CSV content
-    csv_content = io.BytesIO(b'')
-    media = MediaIoBaseUpload(csv_content, mimetype='text/csv', resumable=True)
-    
-    file = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
+    file = service.files().create(body=file_metadata, media_body=build_media(b'', mimetype), fields='id').execute()
+    record_file(dict(file_metadata, id=file.get('id')))
     return file.get('id')
 
-def create_folders():
+def create_folders(root_folder_name='Revive Auctions'):
     """
     Create the folder structure in Google Drive:
-    - Revive Auctions/
+    - Revive Auctions/ (or root_folder_name)
       - Buffer/
       - Images/
       - buffer.csv
       - data.csv
-      - source.csv
+      - images.json
     
     If the structure already exists, it won't recreate it.
     """
     service = get_drive_service()
     
+    # Bring the local Drive mirror up to date before checking what exists
+    refresh_mirror(service)
+    
     # Check if root folder exists
-    root_folder_id = find_folder_by_name(service, 'Revive Auctions')
+    root_folder_id = find_folder_by_name(service, root_folder_name)
     
     if root_folder_id:
         # Check if subfolders exist
@@ -74,6 +57,7 @@ def create_folders():
         images_folder_id = find_folder_by_name(service, 'Images', root_folder_id)
         buffer_csv_id = find_file_by_name(service, 'buffer.csv', root_folder_id)
         data_csv_id = find_file_by_name(service, 'data.csv', root_folder_id)
+        images_json_id = find_file_by_name(service, 'images.json', root_folder_id)
         
         # Create missing subfolders
         if not buffer_folder_id:
@@ -88,9 +72,12 @@ def create_folders():
         
         if not data_csv_id:
             data_csv_id = create_csv_file(service, 'data.csv', root_folder_id)
+        
+        if not images_json_id:
+            images_json_id = create_csv_file(service, 'images.json', root_folder_id, 'application/json')
     else:
         # Create entire structure from scratch
-        root_folder_id = create_folder(service, 'Revive Auctions')
+        root_folder_id = create_folder(service, root_folder_name)
         
         # Create subfolders
         buffer_folder_id = create_folder(service, 'Buffer', root_folder_id)
@@ -99,13 +86,20 @@ def create_folders():
         # Create CSV files
         buffer_csv_id = create_csv_file(service, 'buffer.csv', root_folder_id)
         data_csv_id = create_csv_file(service, 'data.csv', root_folder_id)
+        images_json_id = create_csv_file(service, 'images.json', root_folder_id, 'application/json')
+    
+    # Mirror the auction tree, so later lookups and Buffer/Images listings are local queries
+    ensure_tracked(service, root_folder_id, 'root', root_folder_name)
+    ensure_tracked(service, buffer_folder_id, 'folder', 'Buffer')
+    ensure_tracked(service, images_folder_id, 'folder', 'Images')
     
     return {
         'root_folder_id': root_folder_id,
         'buffer_folder_id': buffer_folder_id or find_folder_by_name(service, 'Buffer', root_folder_id),
         'images_folder_id': images_folder_id or find_folder_by_name(service, 'Images', root_folder_id),
         'buffer_csv_id': buffer_csv_id or find_file_by_name(service, 'buffer.csv', root_folder_id),
-        'data_csv_id': data_csv_id or find_file_by_name(service, 'data.csv', root_folder_id)
+        'data_csv_id': data_csv_id or find_file_by_name(service, 'data.csv', root_folder_id),
+        'images_json_id': images_json_id or find_file_by_name(service, 'images.json', root_folder_id)
     }
 
 if __name__ == '__main__':
@@ -0,0 +1,167 @@
+import os
+import io
+import threading
+import logging
+from collections import OrderedDict
+from PIL import Image, ImageOps
+from services.oauth_service import get_drive_service
+from services.media_io_service import download_bytes
+
+logger = logging.getLogger(__name__)
+
+IMAGE_CACHE_DIR = os.getenv('IMAGE_CACHE_DIR', '.image_cache')
+IMAGE_CACHE_MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_MB', '512')) * 1024 * 1024
+
+# Variants looked up again when evicted between lookup and open (only under heavy cache churn)
+OPEN_ATTEMPTS = 3
+
+# Requested widths are rounded up to one of these so each image has a handful of variants.
+VARIANT_WIDTHS = [320, 640, 1280]
+DEFAULT_WIDTH = 640
+
+FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg')
+}
+
+_index_lock = threading.Lock()
+_index = None
+_index_bytes = 0
+_key_locks = {}
+
+def pick_width(requested):
+    """Round a requested width up to the nearest variant width."""
+    if not requested:
+        return DEFAULT_WIDTH
+    for width in VARIANT_WIDTHS:
+        if requested <= width:
+            return width
+    return VARIANT_WIDTHS[-1]
+
+def pick_format(requested, accept_header):
+    """Use the requested format if known, otherwise WebP when the client accepts it."""
+    if requested in FORMATS:
+        return requested
+    return 'webp' if 'image/webp' in (accept_header or '') else 'jpeg'
+
+def variant_key(image, width, fmt):
+    """Cache key for a resized variant: content hash (or file ID when Drive gave none), width and format."""
+    source = image.get('md5_checksum') or image['file_id']
+    return f"{source}_{width}.{fmt}"
+
+def _load_index():
+    """Scan the cache directory once, oldest-used first."""
+    global _index, _index_bytes
+    os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+    entries = []
+    for name in os.listdir(IMAGE_CACHE_DIR):
+        path = os.path.join(IMAGE_CACHE_DIR, name)
+        if name.endswith('.tmp') or not os.path.isfile(path):
+            continue
+        stat = os.stat(path)
+        entries.append((stat.st_mtime, name, stat.st_size))
+
+    _index = OrderedDict((name, size) for _, name, size in sorted(entries))
+    _index_bytes = sum(_index.values())
+
+def _touch(key):
+    """Mark a cached variant as most recently used. Returns False if it is not cached."""
+    with _index_lock:
+        if _index is None:
+            _load_index()
+        if key not in _index:
+            return False
+        _index.move_to_end(key)
+
+    try:
+        os.utime(os.path.join(IMAGE_CACHE_DIR, key))
+    except FileNotFoundError:
+        return False
+    return True
+
+def _add(key, size):
+    """Record a new variant and evict least recently used ones until under the size cap."""
+    global _index_bytes
+    evicted = []
+    with _index_lock:
+        if _index is None:
+            _load_index()
+        _index_bytes += size - _index.pop(key, 0)
+        _index[key] = size
+        while _index_bytes > IMAGE_CACHE_MAX_BYTES and len(_index) > 1:
+            old_key, old_size = _index.popitem(last=False)
+            _index_bytes -= old_size
+            evicted.append(old_key)
+
+    for old_key in evicted:
+        try:
+            os.remove(os.path.join(IMAGE_CACHE_DIR, old_key))
+        except FileNotFoundError:
+            pass
+    if evicted:
+        logger.info(f"Evicted {len(evicted)} cached image variants")
+
+def render_variant(content, width, fmt):
+    """Resize original image bytes to at most `width` pixels wide and encode them."""
+    pil_format, _ = FORMATS[fmt]
+    with Image.open(io.BytesIO(content)) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.width > width:
+            height = round(image.height * width / image.width)
+            image = image.resize((width, height), Image.LANCZOS)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        output = io.BytesIO()
+        image.save(output, pil_format, quality=80, optimize=True)
+        return output.getvalue()
+
+def get_image_variant(image, width, fmt):
+    """
+    Return (path, mimetype) of a resized variant of a manifest image.
+    The first request downloads the original from Drive and renders the variant;
+    later requests are served from the on-disk cache.
+    """
+    key = variant_key(image, width, fmt)
+    path = os.path.join(IMAGE_CACHE_DIR, key)
+    mimetype = FORMATS[fmt][1]
+
+    if _touch(key):
+        return path, mimetype
+
+    # One download per variant even when several requests miss at once
+    with _index_lock:
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+
+    with key_lock:
+        if _touch(key):
+            return path, mimetype
+
+        service = get_drive_service()
+        rendered = render_variant(download_bytes(service, image['file_id']), width, fmt)
+
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as variant_file:
+            variant_file.write(rendered)
+        os.replace(temp_path, path)
+        _add(key, len(rendered))
+
+    with _index_lock:
+        _key_locks.pop(key, None)
+
+    return path, mimetype
+
+def open_image_variant(image, width, fmt):
+    """
+    Return (file, mimetype, key) for a resized variant, with the file already open so
+    an eviction before the response is sent can't remove it from under the caller.
+    A variant evicted between lookup and open is rendered again.
+    """
+    for attempt in range(OPEN_ATTEMPTS):
+        path, mimetype = get_image_variant(image, width, fmt)
+        try:
+            return open(path, 'rb'), mimetype, os.path.basename(path)
+        except FileNotFoundError:
+            if attempt == OPEN_ATTEMPTS - 1:
+                raise
+            logger.info(f"Cached image variant {os.path.basename(path)} was evicted before it was sent; rendering again")
@@ -0,0 +1,192 @@
+import os
+import time
+import uuid
+import heapq
+import itertools
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FULL_PRIORITY = 0
+DEFAULT_TARGETED_PRIORITY = 10
+# Jobs at or above this priority cancel a running lower-priority job, which is re-queued
+URGENT_PRIORITY = int(os.getenv('SYNC_URGENT_PRIORITY', '100'))
+# Finished jobs kept for GET /sync/jobs
+JOB_HISTORY = 50
+
+class SyncCancelledError(Exception):
+    pass
+
+def raise_if_cancelled(cancel_event):
+    """Cooperative cancellation point for sync steps and worker threads."""
+    if cancel_event is not None and cancel_event.is_set():
+        raise SyncCancelledError("Sync cancelled")
+
+class SyncJob:
+    """A queued full sync, or a targeted sync of specific vehicle IDs; dry_run jobs only plan one."""
+
+    def __init__(self, vehicle_ids=None, priority=None, dry_run=False):
+        self.id = uuid.uuid4().hex[:12]
+        self.vehicle_ids = sorted(set(vehicle_ids)) if vehicle_ids else None
+        self.kind = 'vehicles' if self.vehicle_ids else 'full'
+        self.dry_run = dry_run
+        if priority is None:
+            priority = DEFAULT_TARGETED_PRIORITY if self.vehicle_ids else DEFAULT_FULL_PRIORITY
+        self.priority = priority
+        self.state = 'queued'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.requeue = False
+        self.cancel_event = threading.Event()
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "dry_run": self.dry_run,
+            "vehicle_ids": self.vehicle_ids,
+            "priority": self.priority,
+            "state": self.state,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error
+        }
+
+class SyncJobQueue:
+    """
+    Priority queue of sync jobs executed one at a time by a dispatcher thread.
+    Pending full syncs are coalesced, and an urgent job preempts a running
+    lower-priority one.
+    """
+
+    def __init__(self, run_job, name='default'):
+        self._run_job = run_job
+        self.name = name
+        self._heap = []
+        self._jobs = {}
+        self._finished = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._running = None
+        self._dispatcher = None
+
+    def submit(self, vehicle_ids=None, priority=None, dry_run=False):
+        """Queue a job. Returns (job, coalesced) where coalesced means an existing pending job was reused."""
+        job = SyncJob(vehicle_ids, priority, dry_run)
+        with self._condition:
+            pending = self._find_pending(job)
+            if pending:
+                if job.priority > pending.priority:
+                    pending.priority = job.priority
+                    self._reheap()
+                # A pending job raised to urgent preempts like a new urgent job would
+                self._preempt_for(pending)
+                return pending, True
+
+            self._push(job)
+            self._preempt_for(job)
+            self._ensure_dispatcher()
+            self._condition.notify()
+        return job, False
+
+    def _preempt_for(self, job):
+        """Cancel (and later re-queue) the running job when job is urgent and outranks it."""
+        running = self._running
+        if not running or running.cancel_event.is_set() or job.dry_run:
+            return
+        if job.priority >= URGENT_PRIORITY and running.priority < job.priority:
+            logger.info(f"Job {job.id} preempts running job {running.id}")
+            running.requeue = True
+            running.cancel_event.set()
+
+    def cancel(self, job_id):
+        """Cancel a queued job, or ask a running job to stop. Returns the job or None."""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job.state == 'queued':
+                job.state = 'cancelled'
+                job.finished_at = time.time()
+                self._heap = [entry for entry in self._heap if entry[2] is not job]
+                heapq.heapify(self._heap)
+                self._retire(job)
+            elif job.state == 'running':
+                job.requeue = False
+                job.state = 'cancelling'
+                job.cancel_event.set()
+            return job
+
+    def get(self, job_id):
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self):
+        with self._condition:
+            queued = [entry[2] for entry in sorted(self._heap)]
+            return {
+                "running": self._running.to_dict() if self._running else None,
+                "queued": [job.to_dict() for job in queued],
+                "finished": [job.to_dict() for job in reversed(self._finished)]
+            }
+
+    def _find_pending(self, job):
+        for _, _, pending in self._heap:
+            if pending.vehicle_ids == job.vehicle_ids and pending.dry_run == job.dry_run:
+                return pending
+        return None
+
+    def _push(self, job):
+        self._jobs[job.id] = job
+        heapq.heappush(self._heap, (-job.priority, next(self._counter), job))
+
+    def _reheap(self):
+        self._heap = [(-job.priority, seq, job) for _, seq, job in self._heap]
+        heapq.heapify(self._heap)
+
+    def _retire(self, job):
+        self._finished.append(job)
+        while len(self._finished) > JOB_HISTORY:
+            self._jobs.pop(self._finished.pop(0).id, None)
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None or not self._dispatcher.is_alive():
+            self._dispatcher = threading.Thread(target=self._dispatch, name=f"sync-{self.name}-dispatcher", daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                while not self._heap:
+                    self._condition.wait()
+                _, _, job = heapq.heappop(self._heap)
+                job.state = 'running'
+                job.started_at = time.time()
+                self._running = job
+
+            try:
+                job.result = self._run_job(job)
+                state = 'succeeded'
+            except SyncCancelledError as e:
+                job.error = str(e)
+                state = 'cancelled'
+            except Exception as e:
+                job.error = str(e)
+                state = 'failed'
+
+            with self._condition:
+                job.state = state
+                job.finished_at = time.time()
+                self._running = None
+                self._retire(job)
+                if state == 'cancelled' and job.requeue:
+                    retry = SyncJob(job.vehicle_ids, job.priority, job.dry_run)
+                    if not self._find_pending(retry):
+                        self._push(retry)
+                        logger.info(f"Re-queued preempted job {job.id} as {retry.id}")
@@ -0,0 +1,313 @@
+import os
+import io
+import gzip
+import json
+import tempfile
+import threading
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
+from services.oauth_service import get_drive_service
+from services.tracing_service import current_trace, bind_trace
+from services.quota_service import current_quota, bind_quota
+
+# Payloads below this size go up in a single simple upload request instead of
+# a resumable session (which costs an extra round trip to open).
+SIMPLE_UPLOAD_MAX_BYTES = 5 * 1024 * 1024
+
+# Resumable chunks must be a multiple of 256 KB.
+RESUMABLE_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Downloads are fetched in byte ranges of RESUMABLE_CHUNK_SIZE (smaller in chunked
+# mode); ranges after the first are requested this many at a time.
+DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', '4'))
+
+# Store CSVs gzip-compressed in Drive. Reads detect compression automatically,
+# so this can be switched on or off without migrating existing files.
+CSV_GZIP = os.getenv('CSV_GZIP', '0') == '1'
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Compressed CSVs keep the text/csv type in Drive; this app property records the encoding
+CONTENT_ENCODING_PROPERTY = 'contentEncoding'
+
+# Chunked mode for very large catalogs: CSVs are streamed through temporary files
+# and parsed/written about MEMORY_CEILING_MB of rows at a time instead of being
+# held in memory whole (raw bytes, parsed frame and encoded output at once).
+CHUNKED_CSV = os.getenv('CHUNKED_CSV', '0') == '1'
+MEMORY_CEILING_MB = int(os.getenv('MEMORY_CEILING_MB', '32'))
+
+# Rows parsed up front to estimate how many rows fit in the memory ceiling
+PROBE_ROWS = 1000
+
+# Resumable chunks and download ranges are multiples of this size
+CHUNK_ALIGNMENT = 256 * 1024
+
+def transfer_chunk_size():
+    """
+    Bytes per download range and resumable upload chunk. In chunked mode this shrinks
+    so the DOWNLOAD_WORKERS ranges in flight stay within half the memory ceiling.
+    """
+    if not CHUNKED_CSV:
+        return RESUMABLE_CHUNK_SIZE
+    share = MEMORY_CEILING_MB * 1024 * 1024 // (2 * max(DOWNLOAD_WORKERS, 1))
+    return min(max(share // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT, CHUNK_ALIGNMENT), RESUMABLE_CHUNK_SIZE)
+
+def _get_range(service, file_id, start, end):
+    """
+    GET bytes start..end of a Drive file's content.
+    Returns (file size, content); servers that ignore the range send the whole file.
+    """
+    request = service.files().get_media(fileId=file_id)
+    headers = dict(request.headers, range=f'bytes={start}-{end}')
+    resp, content = request.http.request(request.uri, method='GET', headers=headers)
+    if resp.status == 416 and resp.get('content-range') == 'bytes */0':
+        return 0, b''
+    if resp.status >= 300:
+        raise HttpError(resp, content, uri=request.uri)
+    if resp.status == 206 and 'content-range' in resp:
+        return int(resp['content-range'].rsplit('/', 1)[1]), content
+    return len(content), content
+
+def _fetch_ranges(file_id, start, size, write, range_size=RESUMABLE_CHUNK_SIZE):
+    """
+    Fetch bytes start..size-1 of a Drive file in range_size ranges,
+    DOWNLOAD_WORKERS at a time, passing each to write(offset, content) as it arrives.
+    """
+    trace = current_trace()
+    quota = current_quota()
+    
+    def fetch(offset):
+        bind_trace(trace)
+        bind_quota(quota)
+        # Drive clients are not thread-safe, so every worker builds its own
+        range_service = get_drive_service()
+        end = min(offset + range_size, size) - 1
+        _, content = _get_range(range_service, file_id, offset, end)
+        if len(content) != end - offset + 1:
+            raise IOError(f"Short read of {file_id} at byte {offset}: {len(content)} bytes")
+        write(offset, content)
+    
+    offsets = range(start, size, range_size)
+    if not offsets:
+        return
+    with ThreadPoolExecutor(max_workers=min(DOWNLOAD_WORKERS, len(offsets))) as executor:
+        for _ in executor.map(fetch, offsets):
+            pass
+
+def download_bytes(service, file_id):
+    """
+    Download a Drive file's content. Files up to RESUMABLE_CHUNK_SIZE take one request;
+    larger ones are fetched as parallel byte ranges into one preallocated buffer.
+    """
+    size, first = _get_range(service, file_id, 0, RESUMABLE_CHUNK_SIZE - 1)
+    if len(first) >= size:
+        return first
+    
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    view[:len(first)] = first
+    del first
+    
+    def write(offset, content):
+        # Ranges are disjoint, so workers fill the buffer without a lock
+        view[offset:offset + len(content)] = content
+    
+    _fetch_ranges(file_id, RESUMABLE_CHUNK_SIZE, size, write)
+    return buffer
+
+class _BufferReader(io.RawIOBase):
+    """Read-only file over a bytearray, so pandas parses it in place instead of from a copy."""
+    
+    def __init__(self, buffer):
+        self._view = memoryview(buffer)
+        self._position = 0
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, target):
+        count = min(len(target), len(self._view) - self._position)
+        target[:count] = self._view[self._position:self._position + count]
+        self._position += count
+        return count
+
+def read_csv_bytes(content):
+    """Parse CSV (plain or gzip-compressed) bytes into a DataFrame without copying the payload."""
+    compression = 'gzip' if content[:2] == GZIP_MAGIC else None
+    # BytesIO shares a bytes object's memory, but would copy a bytearray
+    file_obj = io.BytesIO(content) if isinstance(content, bytes) else io.BufferedReader(_BufferReader(content))
+    return pd.read_csv(file_obj, compression=compression)
+
+def download_to_file(service, file_id, file_obj):
+    """Download a Drive file into file_obj in parallel transfer_chunk_size() ranges and rewind it."""
+    range_size = transfer_chunk_size()
+    size, first = _get_range(service, file_id, 0, range_size - 1)
+    file_obj.write(first)
+    if len(first) < size:
+        lock = threading.Lock()
+        
+        def write(offset, content):
+            with lock:
+                file_obj.seek(offset)
+                file_obj.write(content)
+        
+        _fetch_ranges(file_id, range_size, size, write, range_size)
+    file_obj.seek(0)
+    return file_obj
+
+def _csv_compression(file_obj):
+    compression = 'gzip' if file_obj.read(2) == GZIP_MAGIC else None
+    file_obj.seek(0)
+    return compression
+
+def download_csv(service, file_id):
+    """Download a CSV file from Google Drive and parse it into a DataFrame."""
+    if not CHUNKED_CSV:
+        return read_csv_bytes(download_bytes(service, file_id))
+    
+    # Parse from disk so the raw payload is never in memory next to the frame
+    with tempfile.TemporaryFile() as file_obj:
+        download_to_file(service, file_id, file_obj)
+        return pd.read_csv(file_obj, compression=_csv_compression(file_obj))
+
+def rows_per_chunk(sample, memory_ceiling_mb=None):
+    """Rows of a frame like sample that fit in the memory ceiling (at least one probe's worth)."""
+    if memory_ceiling_mb is None:
+        memory_ceiling_mb = MEMORY_CEILING_MB
+    if len(sample) == 0:
+        return PROBE_ROWS
+    bytes_per_row = max(sample.memory_usage(index=True, deep=True).sum() / len(sample), 1)
+    return max(int(memory_ceiling_mb * 1024 * 1024 / bytes_per_row), PROBE_ROWS)
+
+def iter_csv_chunks(service, file_id, chunk_rows=None, memory_ceiling_mb=None):
+    """
+    Yield a Drive CSV as DataFrame chunks. The file is streamed to a temporary file
+    first; chunk_rows defaults to as many rows as fit in the memory ceiling.
+    Index labels continue across chunks, as with pd.read_csv(chunksize=...).
+    """
+    with tempfile.TemporaryFile() as file_obj:
+        download_to_file(service, file_id, file_obj)
+        if file_obj.read(1) == b'':
+            return
+        file_obj.seek(0)
+        
+        reader = pd.read_csv(file_obj, compression=_csv_compression(file_obj), iterator=True)
+        with reader:
+            try:
+                chunk = reader.get_chunk(chunk_rows or PROBE_ROWS)
+            except StopIteration:
+                return
+            size = chunk_rows or rows_per_chunk(chunk, memory_ceiling_mb)
+            while True:
+                yield chunk
+                try:
+                    chunk = reader.get_chunk(size)
+                except StopIteration:
+                    return
+
+def split_frame(df, memory_ceiling_mb=None):
+    """Yield consecutive row slices of df sized to the memory ceiling."""
+    size = rows_per_chunk(df.head(PROBE_ROWS), memory_ceiling_mb)
+    for start in range(0, max(len(df), 1), size):
+        yield df.iloc[start:start + size]
+
+def build_file_media(file_obj, size, mimetype='text/csv'):
+    """Build a media body from a seekable file: simple upload when small, chunked resumable upload otherwise."""
+    chunk_size = transfer_chunk_size()
+    # A simple upload sends the whole payload in one request body, so it is capped like a chunk
+    if size <= min(SIMPLE_UPLOAD_MAX_BYTES, chunk_size):
+        return MediaIoBaseUpload(file_obj, mimetype=mimetype, resumable=False)
+    return MediaIoBaseUpload(file_obj, mimetype=mimetype, chunksize=chunk_size, resumable=True)
+
+def build_media(content, mimetype='text/csv'):
+    """Build a media body: simple upload for small payloads, chunked resumable upload otherwise."""
+    return build_file_media(io.BytesIO(content), len(content), mimetype)
+
+def csv_metadata(compressed):
+    """
+    File metadata for a CSV upload: the type stays text/csv either way and
+    compression is flagged in an app property (None removes it).
+    """
+    return {
+        'mimeType': 'text/csv',
+        'appProperties': {CONTENT_ENCODING_PROPERTY: 'gzip' if compressed else None}
+    }
+
+def encode_csv(df, compress=None):
+    """Serialize a DataFrame to CSV bytes, gzip-compressed when enabled."""
+    if compress is None:
+        compress = CSV_GZIP
+    content = df.to_csv(index=False).encode('utf-8')
+    if compress:
+        content = gzip.compress(content, compresslevel=6)
+    return content
+
+def upload_csv_chunks(service, file_id, chunks, compress=None):
+    """
+    Overwrite a Drive CSV file with DataFrame chunks, encoding them one at a time
+    into a temporary file that is then uploaded in transfer_chunk_size() pieces.
+    Returns the number of rows written.
+    """
+    if compress is None:
+        compress = CSV_GZIP
+    
+    rows = 0
+    with tempfile.TemporaryFile() as file_obj:
+        writer = gzip.GzipFile(fileobj=file_obj, mode='wb', compresslevel=6) if compress else file_obj
+        header = True
+        for chunk in chunks:
+            writer.write(chunk.to_csv(index=False, header=header).encode('utf-8'))
+            header = False
+            rows += len(chunk)
+        if compress:
+            writer.close()
+        upload_file(service, file_id, file_obj, 'text/csv', csv_metadata(compress))
+    return rows
+
+def upload_file(service, file_id, file_obj, mimetype, body=None):
+    """Overwrite a Drive file with everything written to file_obj so far."""
+    size = file_obj.tell()
+    file_obj.seek(0)
+    service.files().update(
+        fileId=file_id,
+        body=body,
+        media_body=build_file_media(file_obj, size, mimetype)
+    ).execute()
+
+def upload_csv(service, file_id, df, compress=None):
+    """Overwrite a Drive CSV file with the contents of a DataFrame."""
+    if CHUNKED_CSV:
+        upload_csv_chunks(service, file_id, split_frame(df), compress)
+        return
+    
+    content = encode_csv(df, compress)
+    service.files().update(
+        fileId=file_id,
+        body=csv_metadata(content[:2] == GZIP_MAGIC),
+        media_body=build_media(content)
+    ).execute()
+
+def download_json(service, file_id):
+    """Download a JSON file from Google Drive. Empty files read as None."""
+    content = download_bytes(service, file_id)
+    if not content:
+        return None
+    return json.loads(content)
+
+def upload_json(service, file_id, obj):
+    """Overwrite a Drive JSON file with a serialized object."""
+    content = json.dumps(obj, separators=(',', ':')).encode('utf-8')
+    service.files().update(
+        fileId=file_id,
+        media_body=build_media(content, 'application/json')
+    ).execute()
+
+def clear_csv(service, file_id):
+    """Truncate a Drive CSV file to zero bytes with a single simple upload."""
+    service.files().update(
+        fileId=file_id,
+        body=csv_metadata(False),
+        media_body=build_media(b'')
+    ).execute()
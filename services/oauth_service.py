@@ -1,19 +1,33 @@
 import os
 import json
+import time
 import threading
 import logging
+from collections import namedtuple
 from datetime import datetime, timedelta
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
 from google.auth.exceptions import RefreshError
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import build_http, HttpRequest
+from google_auth_httplib2 import AuthorizedHttp
+from services.tracing_service import TRACING_ENABLED, InstrumentedHttp, TracingHttpRequest
+from services.quota_service import QuotaLimitedHttp
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-_refresh_lock = threading.RLock()
+_discovery_lock = threading.Lock()
+_discovery_document = None
 SCOPES = ['https://www.googleapis.com/auth/drive']
 
+# The background refresher renews the token this many seconds before it expires
+TOKEN_REFRESH_MARGIN = int(os.getenv('TOKEN_REFRESH_MARGIN', '900'))
+# First retry delay after a failed background refresh; doubles up to TOKEN_RETRY_MAX_SECONDS
+TOKEN_RETRY_SECONDS = int(os.getenv('TOKEN_RETRY_SECONDS', '30'))
+TOKEN_RETRY_MAX_SECONDS = int(os.getenv('TOKEN_RETRY_MAX_SECONDS', '600'))
+
 class AuthenticationError(Exception):
     pass
 
@@ -131,7 +145,6 @@ def _refresh_credentials(creds):
                     f"Token refresh failed (attempt {attempt + 1}): {error_msg}. "
                     f"Retrying in {delay} seconds..."
                 )
-                import time
                 time.sleep(delay)
             else:
                 raise AuthenticationError(
@@ -146,7 +159,6 @@ def _refresh_credentials(creds):
                     f"Token refresh error (attempt {attempt + 1}): {str(e)}. "
                     f"Retrying in {delay} seconds..."
                 )
-                import time
                 time.sleep(delay)
             else:
                 raise AuthenticationError(
@@ -154,16 +166,165 @@ def _refresh_credentials(creds):
                     f"Error: {str(e)}"
                 )
 
+def get_discovery_document():
+    """
+    Return the parsed Drive v3 discovery document, loading it once per process.
+    The client library ships the document on local disk; keeping the parsed copy
+    avoids re-reading and re-parsing it on every get_drive_service() call.
+    """
+    global _discovery_document
+    with _discovery_lock:
+        if _discovery_document is None:
+            doc = get_static_doc('drive', 'v3')
+            if doc:
+                _discovery_document = json.loads(doc)
+        return _discovery_document
+
+class CredentialSnapshot(namedtuple('CredentialSnapshot', [
+    'token', 'refresh_token', 'token_uri', 'client_id', 'client_secret', 'scopes', 'expiry'
+])):
+    """
+    Immutable copy of the OAuth token, published by CredentialManager and read without locking.
+    Every Drive client gets its own Credentials built from it, so nothing a client does
+    (including a refresh of its own after a 401) is seen by other threads.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_credentials(cls, creds):
+        return cls(
+            creds.token, creds.refresh_token, creds.token_uri, creds.client_id,
+            creds.client_secret, tuple(creds.scopes or ()), creds.expiry
+        )
+
+    def credentials(self):
+        return Credentials(
+            token=self.token,
+            refresh_token=self.refresh_token,
+            token_uri=self.token_uri,
+            client_id=self.client_id,
+            client_secret=self.client_secret,
+            scopes=list(self.scopes) or None,
+            expiry=self.expiry
+        )
+
+class CredentialManager:
+    """
+    Keeps a fresh token published for get_drive_service(). Only the first call loads
+    token.json (refreshing it if already expired); after that a daemon thread refreshes
+    TOKEN_REFRESH_MARGIN seconds before expiry and swaps in a new snapshot, and readers
+    never wait on a refresh. Refresh failures are retried with backoff and reported by status().
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        # Serializes the first load and background refreshes; never taken by current() once loaded
+        self._lock = threading.Lock()
+        self._thread = None
+        self.refreshes = 0
+        self.last_refresh = None
+        self.error = None
+        self.failed_at = None
+        self.consecutive_failures = 0
+
+    def current(self):
+        """The published credential snapshot (loads token.json on first use)."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self._load()
+        return snapshot
+
+    def _load(self):
+        with self._lock:
+            if self._snapshot is None:
+                creds = _load_credentials()
+                if _needs_refresh(creds):
+                    logger.info("Token expired or expiring soon, refreshing...")
+                    creds = _refresh_credentials(creds)
+                    _save_credentials(creds)
+                    self._record_refresh()
+                self._snapshot = CredentialSnapshot.from_credentials(creds)
+                self._start()
+            return self._snapshot
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='token-refresher', daemon=True)
+            self._thread.start()
+
+    def _seconds_until_refresh(self):
+        expiry = self._snapshot.expiry
+        if expiry is None:
+            # Tokens without a known expiry are only checked hourly
+            return 3600
+        remaining = (expiry - datetime.utcnow()).total_seconds() - TOKEN_REFRESH_MARGIN
+        return max(remaining, 0)
+
+    def _run(self):
+        retry_delay = TOKEN_RETRY_SECONDS
+        while True:
+            time.sleep(self._seconds_until_refresh())
+            try:
+                self.refresh()
+                retry_delay = TOKEN_RETRY_SECONDS
+            except Exception as e:
+                with self._lock:
+                    self.error = str(e)
+                    self.failed_at = time.time()
+                    self.consecutive_failures += 1
+                logger.warning(f"Background token refresh failed, retrying in {retry_delay}s: {str(e)}")
+                time.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, TOKEN_RETRY_MAX_SECONDS)
+
+    def refresh(self):
+        """Refresh the token now (if it is within the margin) and publish it."""
+        with self._lock:
+            # Re-read token.json so a re-authentication is picked up
+            creds = _load_credentials()
+            if _needs_refresh(creds, threshold_minutes=TOKEN_REFRESH_MARGIN / 60):
+                creds = _refresh_credentials(creds)
+                _save_credentials(creds)
+                self._record_refresh()
+            self._snapshot = CredentialSnapshot.from_credentials(creds)
+            self.error = None
+            self.consecutive_failures = 0
+
+    def _record_refresh(self):
+        self.refreshes += 1
+        self.last_refresh = time.time()
+
+    def status(self):
+        """Token expiry and refresher health, for /health. Never loads or refreshes."""
+        snapshot = self._snapshot
+        expiry = snapshot.expiry if snapshot else None
+        return {
+            "loaded": snapshot is not None,
+            "expires_at": expiry.isoformat() + 'Z' if expiry else None,
+            "expires_in_seconds": round((expiry - datetime.utcnow()).total_seconds()) if expiry else None,
+            "refresher_running": self._thread is not None and self._thread.is_alive(),
+            "refreshes": self.refreshes,
+            "last_refresh": self.last_refresh,
+            "error": self.error,
+            "failed_at": self.failed_at,
+            "consecutive_failures": self.consecutive_failures
+        }
+
+credential_manager = CredentialManager()
+
 def get_drive_service():
-    with _refresh_lock:
-        creds = _load_credentials()
-        
-        if _needs_refresh(creds):
-            logger.info("Token expired or expiring soon, refreshing...")
-            creds = _refresh_credentials(creds)
-            _save_credentials(creds)
-        else:
-            logger.debug("Token is valid, no refresh needed")
-        
-        service = build('drive', 'v3', credentials=creds)
-        return service
+    # A private Credentials per client, from the snapshot the refresher keeps fresh
+    creds = credential_manager.current().credentials()
+    
+    # All Drive clients share one request budget, however many auctions sync at once
+    http = QuotaLimitedHttp(AuthorizedHttp(creds, http=build_http()))
+    request_builder = HttpRequest
+    if TRACING_ENABLED:
+        http = InstrumentedHttp(http)
+        request_builder = TracingHttpRequest
+    
+    document = get_discovery_document()
+    if document is None:
+        return build('drive', 'v3', http=http, requestBuilder=request_builder)
+    
+    service = build_from_document(document, http=http, requestBuilder=request_builder)
+    return service
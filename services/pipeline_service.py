@@ -0,0 +1,327 @@
+import queue
+import threading
+import pandas as pd
+from services.oauth_service import get_drive_service
+from services.copying_images_service import (
+    create_folder, copy_vehicle_images, build_vehicle_tasks, extract_folder_ids, plan_vehicle_sources
+)
+from services.transfer_data_service import (
+    list_folder_contents, delete_files, delete_all_files_in_folder, publish_vehicle_folder,
+    publish_data_csv, publish_data_csv_chunks, publish_vehicle_rows, prepare_catalog, clear_csv_file,
+    SpilledImageResults
+)
+from services.downloading_csv_service import download_csv_as_dataframe
+from services.media_io_service import iter_csv_chunks, CHUNKED_CSV
+from services.job_queue_service import raise_if_cancelled
+from services.tracing_service import current_trace, bind_trace
+
+# Bound on items waiting between two stages, so a fast stage cannot run far ahead
+QUEUE_SIZE = 20
+
+_DONE = object()
+
+class _Stage:
+    """A pool of worker threads reading from one bounded queue and writing to the next."""
+
+    def __init__(self, name, workers, handler, inbox, outbox, stop):
+        self.name = name
+        self.handler = handler
+        self.inbox = inbox
+        self.outbox = outbox
+        self.stop = stop
+        self.error = None
+        self.trace = current_trace()
+        self._remaining = workers
+        self._lock = threading.Lock()
+        self.threads = [
+            threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def _run(self):
+        bind_trace(self.trace)
+        try:
+            # Drive clients are not thread-safe, so every worker builds its own
+            service = get_drive_service()
+            while True:
+                item = _get(self.inbox, self.stop)
+                if item is _DONE:
+                    # Pass the end marker on to the sibling workers of this stage
+                    _put(self.inbox, _DONE, self.stop)
+                    break
+                _put(self.outbox, self.handler(service, item), self.stop)
+        except Exception as e:
+            self.error = e
+            self.stop.set()
+        finally:
+            # The last worker to finish tells the next stage there is nothing more coming
+            with self._lock:
+                self._remaining -= 1
+                last = self._remaining == 0
+            if last:
+                _put(self.outbox, _DONE, self.stop)
+
+def _put(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            continue
+    return _DONE
+
+def _create_vehicle_folder(buffer_folder_id):
+    """Stage 2: create the vehicle's Buffer folder, for sources the pre-pass found images in."""
+    def handle(service, task):
+        vehicle_index, source_folder_id, source = task
+        vehicle_num = vehicle_index + 1
+        if not source_folder_id:
+            print(f"Vehicle {vehicle_num}: No valid drive link found")
+            return {'vehicle_num': vehicle_num, 'status': 'skipped', 'reason': 'No valid drive link'}
+        if source['status'] == 'error':
+            print(f"Vehicle {vehicle_num}: Error - Failed to list source folder: {source['error']}")
+            return {'vehicle_num': vehicle_num, 'status': 'error', 'error': f"Failed to list source folder: {source['error']}"}
+        if source['status'] == 'skipped':
+            # No empty folders for vehicles without usable images
+            print(f"Vehicle {vehicle_num}: Skipped - {source['reason']}")
+            return {'vehicle_num': vehicle_num, 'status': 'skipped', 'reason': source['reason']}
+
+        try:
+            vehicle_folder_id = create_folder(service, str(vehicle_num), buffer_folder_id)
+            return {
+                'vehicle_num': vehicle_num,
+                'status': 'copying',
+                'folder_id': vehicle_folder_id,
+                'image_files': source['image_files']
+            }
+        except Exception as e:
+            print(f"Vehicle {vehicle_num}: Error - {str(e)}")
+            return {'vehicle_num': vehicle_num, 'status': 'error', 'error': str(e)}
+    return handle
+
+def _copy_images(stop):
+    """Stage 3: copy a vehicle's images into its Buffer folder."""
+    def handle(service, result):
+        if result['status'] != 'copying':
+            return result
+        return _copy_vehicle(service, result, stop)
+    return handle
+
+def _copy_vehicle(service, result, stop):
+    vehicle_num = result['vehicle_num']
+    try:
+        images = copy_vehicle_images(service, result.pop('image_files'), result['folder_id'], stop)
+        result.update({'status': 'completed', 'images_copied': len(images), 'images': images})
+    except Exception as e:
+        print(f"Vehicle {vehicle_num}: Error - {str(e)}")
+        result = {'vehicle_num': vehicle_num, 'status': 'error', 'error': str(e)}
+    return result
+
+def _previous_vehicle_folders(service, data_csv_id, vehicle_ids):
+    """(vehicle ID, Images folder ID) pairs that data.csv currently links for the given vehicles."""
+    if CHUNKED_CSV:
+        chunks = iter_csv_chunks(service, data_csv_id)
+    else:
+        chunks = [download_csv_as_dataframe(service, data_csv_id)]
+    
+    folders = []
+    empty = True
+    for chunk in chunks:
+        if chunk is None:
+            break
+        empty = False
+        if 'ID' not in chunk.columns or 'DRIVE LINK' not in chunk.columns:
+            return []
+        row_ids = pd.to_numeric(chunk['ID'], errors='coerce')
+        rows = row_ids.isin(vehicle_ids)
+        folder_ids = extract_folder_ids(chunk.loc[rows, 'DRIVE LINK'])
+        folders.extend(
+            (int(vehicle_id), folder_id) for vehicle_id, folder_id in zip(row_ids[rows], folder_ids) if folder_id
+        )
+    if empty:
+        raise ValueError("data.csv is empty or unreadable; run a full sync before syncing single vehicles")
+    return folders
+
+def _catalog_chunks(service, buffer_csv_id, max_vehicles=None):
+    """buffer.csv one chunk at a time, cut off after max_vehicles rows."""
+    remaining = max_vehicles
+    for chunk in iter_csv_chunks(service, buffer_csv_id):
+        if remaining is not None:
+            chunk = chunk.head(remaining)
+            remaining -= len(chunk)
+        if len(chunk):
+            yield chunk
+        if remaining == 0:
+            return
+
+def run_sync_pipeline(df, folder_ids, folder_workers=3, copy_workers=5, max_vehicles=None,
+                      max_images_per_vehicle=None, on_progress=None, vehicle_ids=None, cancel_event=None):
+    """
+    Copy and publish vehicle images as a staged pipeline instead of steps 3 and 4 in sequence:
+
+        list and check sources -> create vehicle folders -> copy images -> publish
+
+    Stages run concurrently and are connected by bounded queues, so a vehicle is
+    moved into Images as soon as its copies finish. data.csv and images.json are
+    written once every vehicle has been published; the previous Images contents
+    are deleted only after that, so live drive links never point at deleted folders.
+
+    With df=None (full syncs in chunked mode) the catalog is streamed from buffer.csv
+    instead: the producer reads it a chunk at a time, copy results for images.json
+    are spilled to a temporary file and data.csv is written with upload_csv_chunks.
+
+    Args:
+        df: Parsed catalog (as uploaded to buffer.csv), or None to stream buffer.csv
+        folder_ids: Folder and file IDs returned by create_folders()
+        folder_workers: Threads creating vehicle folders (default: 3)
+        copy_workers: Threads copying images (default: 5)
+        max_vehicles: Maximum number of vehicles to process (default: None for all)
+        max_images_per_vehicle: Maximum images per vehicle (default: None for all)
+        on_progress: Optional callback(done, total, result) after each published vehicle;
+            total is None while buffer.csv is streamed
+        vehicle_ids: Only sync these vehicle IDs and merge them into the published
+            data.csv/images.json instead of replacing the catalog (default: None for all)
+        cancel_event: Optional threading.Event; when set, workers stop and
+            SyncCancelledError is raised before anything is published to data.csv
+
+    Returns:
+        Vehicle counts by result status, e.g. {'completed': 10, 'skipped': 2, 'error': 0}
+    """
+    service = get_drive_service()
+    buffer_folder_id = folder_ids['buffer_folder_id']
+    images_folder_id = folder_ids['images_folder_id']
+    buffer_csv_id = folder_ids['buffer_csv_id']
+
+    streaming = df is None
+    if streaming:
+        if vehicle_ids:
+            raise ValueError("Targeted syncs need the parsed catalog")
+        total = None
+    else:
+        df = prepare_catalog(df)
+        if vehicle_ids:
+            df = df[pd.to_numeric(df['ID'], errors='coerce').isin(vehicle_ids)]
+        if max_vehicles:
+            df = df.head(max_vehicles)
+        total = len(df)
+
+    # Leftovers from an interrupted sync would otherwise be published too
+    delete_all_files_in_folder(service, buffer_folder_id)
+
+    stop = threading.Event()
+    folder_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    copy_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    publish_queue = queue.Queue(maxsize=QUEUE_SIZE)
+
+    producer_errors = []
+    trace = current_trace()
+
+    def produce():
+        # Stage 1: list the source folders ahead of folder creation, in parallel batches
+        bind_trace(trace)
+        try:
+            if streaming:
+                # Drive clients are not thread-safe, so the producer builds its own
+                chunks = _catalog_chunks(get_drive_service(), buffer_csv_id, max_vehicles)
+                tasks = (task for chunk in chunks for task in build_vehicle_tasks(chunk))
+            else:
+                tasks = build_vehicle_tasks(df)
+            for task in plan_vehicle_sources(tasks, max_images_per_vehicle):
+                _put(folder_queue, task, stop)
+        except Exception as e:
+            producer_errors.append(e)
+            stop.set()
+        _put(folder_queue, _DONE, stop)
+
+    stages = [
+        _Stage('folders', folder_workers, _create_vehicle_folder(buffer_folder_id), folder_queue, copy_queue, stop),
+        _Stage('copy', copy_workers, _copy_images(stop), copy_queue, publish_queue, stop)
+    ]
+    producer = threading.Thread(target=produce, name='rows', daemon=True)
+    producer.start()
+    for stage in stages:
+        stage.start()
+
+    # Stage 4 runs here: publish each finished vehicle, then the catalog
+    results = SpilledImageResults() if streaming else []
+    counts = {'completed': 0, 'skipped': 0, 'error': 0}
+    folder_map = {}
+    try:
+        try:
+            try:
+                if vehicle_ids:
+                    previous_images = _previous_vehicle_folders(service, folder_ids['data_csv_id'], vehicle_ids)
+                else:
+                    previous_images = list_folder_contents(service, images_folder_id)
+                while True:
+                    if stop.is_set() or (cancel_event is not None and cancel_event.is_set()):
+                        break
+                    try:
+                        result = publish_queue.get(timeout=0.5)
+                    except queue.Empty:
+                        continue
+                    if result is _DONE:
+                        break
+                    if result['status'] == 'completed':
+                        publish_vehicle_folder(service, result['folder_id'], images_folder_id, buffer_folder_id)
+                        folder_map[result['vehicle_num']] = result['folder_id']
+                    results.append(result)
+                    counts[result['status']] += 1
+                    if on_progress:
+                        on_progress(sum(counts.values()), total, result)
+            finally:
+                stop.set()
+
+            raise_if_cancelled(cancel_event)
+            if producer_errors:
+                raise producer_errors[0]
+            for stage in stages:
+                if stage.error:
+                    raise stage.error
+        except BaseException:
+            # Folders already moved to Images are not linked from data.csv yet; targeted
+            # syncs never list Images, so nothing else would clean them up
+            delete_files(service, [{'id': folder_id} for folder_id in folder_map.values()])
+            raise
+
+        if vehicle_ids:
+            # Only vehicles that were copied, or that left the sheet, are replaced; one whose copy
+            # failed or was skipped keeps its published row, gallery and Images folder
+            row_ids = pd.to_numeric(df['ID'], errors='coerce')
+            removed_ids = sorted(set(vehicle_ids) - set(row_ids.dropna().astype(int)))
+            if removed_ids:
+                print(f"Vehicles {removed_ids} are no longer in the sheet; removing them from data.csv")
+            publish_vehicle_rows(
+                service, df[row_ids.isin(list(folder_map))], folder_map, folder_ids['data_csv_id'],
+                folder_ids.get('images_json_id'), results, removed_ids=removed_ids
+            )
+            replaced_ids = set(folder_map) | set(removed_ids)
+            previous_images = [
+                {'id': folder_id} for vehicle_id, folder_id in previous_images if vehicle_id in replaced_ids
+            ]
+        elif streaming:
+            publish_data_csv_chunks(
+                service, _catalog_chunks(service, buffer_csv_id, max_vehicles), folder_map,
+                folder_ids['data_csv_id'], folder_ids.get('images_json_id'), results
+            )
+        else:
+            publish_data_csv(service, df, folder_map, folder_ids['data_csv_id'], folder_ids.get('images_json_id'), results)
+    finally:
+        if streaming:
+            results.close()
+    delete_files(service, previous_images)
+    if not vehicle_ids:
+        # Targeted syncs leave buffer.csv alone; it belongs to full syncs
+        clear_csv_file(service, buffer_csv_id)
+    return counts
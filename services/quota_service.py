@@ -0,0 +1,96 @@
+import os
+import time
+import threading
+
+# Drive requests per second for this whole process. DRIVE_QPS=0 turns the limit off.
+DRIVE_QPS = float(os.getenv('DRIVE_QPS', '20'))
+DRIVE_BURST = int(os.getenv('DRIVE_BURST', '40'))
+
+# Share of DRIVE_QPS reserved for web requests (/data snapshot reloads, image
+# proxy), so a sync can't throttle them. Syncs get the rest. DRIVE_WEB_QPS=0
+# puts web requests in the sync bucket.
+DRIVE_WEB_QPS = float(os.getenv('DRIVE_WEB_QPS', '4'))
+DRIVE_WEB_BURST = int(os.getenv('DRIVE_WEB_BURST', '10'))
+
+WEB_RESERVED = DRIVE_QPS > 0 and DRIVE_WEB_QPS > 0
+SYNC_QPS = max(DRIVE_QPS - DRIVE_WEB_QPS, 1) if WEB_RESERVED else DRIVE_QPS
+
+class TokenBucket:
+    """Thread-safe token bucket: acquire() blocks until a request may be sent."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited_seconds = 0.0
+        self.requests = 0
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    self.requests += 1
+                    self.waited_seconds += now - start
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def status(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                "qps": self.rate,
+                "burst": self.capacity,
+                "available": round(self._tokens, 1),
+                "requests": self.requests,
+                "waited_seconds": round(self.waited_seconds, 1)
+            }
+
+# Shared by every sync and its worker threads
+drive_quota = TokenBucket(SYNC_QPS, DRIVE_BURST)
+# Reserved for threads serving web requests
+web_quota = TokenBucket(min(DRIVE_WEB_QPS, DRIVE_QPS), DRIVE_WEB_BURST) if WEB_RESERVED else drive_quota
+
+_local = threading.local()
+
+def current_quota():
+    """The bucket this thread draws from: drive_quota unless bind_quota() said otherwise."""
+    return getattr(_local, 'bucket', None) or drive_quota
+
+def bind_quota(bucket):
+    """Make this thread's Drive requests draw from bucket (e.g. web_quota in request handlers)."""
+    _local.bucket = bucket
+
+def quota_status():
+    if web_quota is drive_quota:
+        return {"sync": drive_quota.status()}
+    return {"sync": drive_quota.status(), "web": web_quota.status()}
+
+class QuotaLimitedHttp:
+    """
+    Wraps a Drive HTTP transport so every attempt, including retries, draws a token:
+    from bucket when given, otherwise from the calling thread's current_quota().
+    """
+
+    def __init__(self, http, bucket=None):
+        self._http = http
+        self._bucket = bucket
+
+    def request(self, *args, **kwargs):
+        (self._bucket or current_quota()).acquire()
+        return self._http.request(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._http, name)
@@ -0,0 +1,72 @@
+"""
+Vehicle sheet parsing, kept free of Drive/Flask imports so it can run in a
+separate process: `python -m services.sheet_parsing_service <export_url>`
+writes the parsed, compacted DataFrame to stdout as a pickle.
+"""
+import sys
+import pickle
+import warnings
+import pandas as pd
+from services.catalog_service import compact_frame
+
+# Suppress warnings
+warnings.filterwarnings('ignore')
+
+HEADER_KEYWORDS = ['VEHICLE DETAILS', 'LOCATION', 'DRIVE LINK']
+
+def build_export_url(sheet_url):
+    """Convert a Google Sheets URL to its XLSX export URL (keeping the gid if present)."""
+    # Extract the document ID and gid if present
+    if '/d/' in sheet_url:
+        doc_id = sheet_url.split('/d/')[1].split('/')[0]
+        gid = '0'  # Default sheet
+        if 'gid=' in sheet_url:
+            gid = sheet_url.split('gid=')[1].split('&')[0].split('#')[0]
+        return f'https://docs.google.com/spreadsheets/d/{doc_id}/export?format=xlsx&gid={gid}'
+    raise ValueError("Invalid Google Sheets URL format")
+
+def parse_vehicle_sheet(source):
+    """
+    Read the auction workbook (export URL, path or file object) and extract only
+    vehicle data, excluding the auction closing header. Adds the ID column.
+    """
+    # Read the Excel file
+    df = pd.read_excel(source)
+
+    # Find the row that contains "ONLINE AUCTION CLOSING" and skip it
+    # Look for the header row with vehicle details
+    header_row_idx = None
+    for idx, row in df.iterrows():
+        row_str = ' '.join([str(val).upper() for val in row if pd.notna(val)])
+        if any(keyword in row_str for keyword in HEADER_KEYWORDS):
+            header_row_idx = idx
+            break
+
+    if header_row_idx is not None:
+        # Set the correct header row
+        df.columns = df.iloc[header_row_idx]
+        # Keep only data after the header row
+        df = df.iloc[header_row_idx + 1:].reset_index(drop=True)
+
+    # Remove any rows that contain "ONLINE AUCTION CLOSING" (matched column by column, not row by row)
+    closing = df.astype(str).apply(lambda col: col.str.contains('ONLINE AUCTION CLOSING', case=False, na=False))
+    df = df[~closing.any(axis=1)]
+
+    # Remove completely empty rows
+    df = df.dropna(how='all')
+
+    # Clean up column names - convert to string and strip
+    df.columns = [str(col).strip() if pd.notna(col) else f'Unnamed_{i}' for i, col in enumerate(df.columns)]
+
+    # Remove any unnamed columns from source
+    df = df[[col for col in df.columns if not col.startswith('Unnamed')]]
+
+    # Add ID column as the first column
+    df.insert(0, 'ID', range(1, len(df) + 1))
+
+    # Categoricals/downcast ints for the rest of the sync; CSV output is unchanged
+    return compact_frame(df)
+
+if __name__ == '__main__':
+    frame = parse_vehicle_sheet(sys.argv[1])
+    pickle.dump(frame, sys.stdout.buffer, protocol=pickle.HIGHEST_PROTOCOL)
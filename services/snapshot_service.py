@@ -0,0 +1,262 @@
+import os
+import time
+import threading
+import logging
+from services.oauth_service import get_drive_service
+from services.downloading_csv_service import find_folder_by_name, find_file_by_name, download_csv_as_dataframe
+from services.media_io_service import download_json
+from services.auction_config_service import get_auction, get_auctions
+from services.catalog_service import Catalog, merge_catalogs, diff_catalogs
+from services.quota_service import web_quota, bind_quota
+
+logger = logging.getLogger(__name__)
+
+# Seconds a loaded data.csv snapshot is served before /data reloads it from Drive.
+SNAPSHOT_TTL = int(os.getenv('SNAPSHOT_TTL', '300'))
+# Catalog versions per auction for which /export can still answer since=<version>
+SNAPSHOT_DELTA_HISTORY = int(os.getenv('SNAPSHOT_DELTA_HISTORY', '50'))
+# Seconds between background reload attempts after one fails; the stale snapshot is served meanwhile
+SNAPSHOT_RETRY_SECONDS = int(os.getenv('SNAPSHOT_RETRY_SECONDS', '30'))
+
+_snapshot_lock = threading.Lock()
+# Auction name -> snapshot; each auction is loaded and expires on its own
+_snapshots = {}
+_merged = None
+# Auction name -> (version, catalog) last served; kept across invalidate_snapshot to diff the next load
+_versions = {}
+# Auction name -> [{'from', 'version', 'changed', 'removed'}, ...] oldest first
+_deltas = {}
+# Auction name -> _Reload in flight, and the time of its last failed background reload
+_reloads = {}
+_failed_at = {}
+
+class SnapshotNotFoundError(Exception):
+    pass
+
+class SnapshotReadError(Exception):
+    pass
+
+class SnapshotVersionGoneError(Exception):
+    pass
+
+def _fetch_snapshot(auction):
+    service = get_drive_service()
+
+    # Find the auction's root folder
+    root_folder_id = find_folder_by_name(service, auction.root_folder)
+    if not root_folder_id:
+        raise SnapshotNotFoundError(f"{auction.root_folder} folder not found")
+
+    # Find data.csv
+    data_csv_id = find_file_by_name(service, 'data.csv', root_folder_id)
+    if not data_csv_id:
+        raise SnapshotNotFoundError("data.csv not found")
+
+    # Download and parse data.csv
+    df = download_csv_as_dataframe(service, data_csv_id)
+    if df is None:
+        raise SnapshotReadError("Failed to read data.csv")
+
+    return {
+        'catalog': Catalog.from_frame(df),
+        'images': _fetch_image_manifest(service, root_folder_id),
+        'loaded_at': time.time()
+    }
+
+def _fetch_image_manifest(service, root_folder_id):
+    """Load images.json (vehicle ID -> ordered images). Missing or unreadable manifests serve no galleries."""
+    images_json_id = find_file_by_name(service, 'images.json', root_folder_id)
+    if not images_json_id:
+        return {}
+
+    try:
+        manifest = download_json(service, images_json_id)
+    except Exception as e:
+        logger.warning(f"Failed to read images.json: {str(e)}")
+        return {}
+
+    return (manifest or {}).get('vehicles', {})
+
+def get_vehicle_images(vehicle_id, auction_name=None):
+    """
+    Return the ordered image entries for one vehicle, or None if it has no gallery.
+    Vehicle IDs repeat between auctions, so callers name the auction when there are several.
+    """
+    return get_snapshot(get_auction(auction_name).name)['images'].get(str(vehicle_id))
+
+def load_snapshot(auction_name=None):
+    """Download an auction's data.csv from Drive and make it the served snapshot."""
+    auction = get_auction(auction_name)
+    snapshot = _fetch_snapshot(auction)
+    with _snapshot_lock:
+        previous = _versions.get(auction.name)
+    delta = diff_catalogs(previous[1], snapshot['catalog']) if previous else None
+
+    with _snapshot_lock:
+        if previous is not None and _versions.get(auction.name) is previous and delta == (set(), set()):
+            # Unchanged data.csv keeps its version, so incremental exports stay empty
+            snapshot['version'] = previous[0]
+        else:
+            # Millisecond clock versions stay unique across restarts
+            snapshot['version'] = max(int(time.time() * 1000), previous[0] + 1 if previous else 0)
+            history = _deltas.setdefault(auction.name, [])
+            if delta is None or _versions.get(auction.name) is not previous:
+                # No row-level diff (first load, unkeyed rows or a concurrent load): older versions are gone
+                history.clear()
+            else:
+                history.append({
+                    'from': previous[0],
+                    'version': snapshot['version'],
+                    'changed': delta[0],
+                    'removed': delta[1]
+                })
+                del history[:-SNAPSHOT_DELTA_HISTORY]
+        _versions[auction.name] = (snapshot['version'], snapshot['catalog'])
+        _snapshots[auction.name] = snapshot
+    logger.info(f"Loaded {auction.name} data snapshot v{snapshot['version']} with {len(snapshot['catalog'])} vehicles")
+    return snapshot
+
+def get_changes_since(auction_name, version):
+    """
+    Vehicle IDs changed (added or modified) and removed in an auction's catalog
+    since `version`, across every load recorded in between.
+    Raises SnapshotVersionGoneError when that version is unknown or too old.
+    """
+    auction_name = get_auction(auction_name).name
+    snapshot = get_snapshot(auction_name)
+    if version == snapshot['version']:
+        return snapshot, set(), set()
+
+    with _snapshot_lock:
+        history = list(_deltas.get(auction_name, []))
+    for start, delta in enumerate(history):
+        if delta['from'] == version:
+            break
+    else:
+        raise SnapshotVersionGoneError(f"Catalog version {version} is no longer available; export the full catalog")
+    if history[-1]['version'] != snapshot['version']:
+        raise SnapshotVersionGoneError(f"Catalog version {version} is no longer available; export the full catalog")
+
+    touched = set()
+    for delta in history[start:]:
+        touched |= delta['changed'] | delta['removed']
+    current = set(snapshot['catalog'].frame['ID'])
+    return snapshot, touched & current, touched - current
+
+class _Reload:
+    """One in-flight load_snapshot(); concurrent readers wait on it instead of loading again."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.snapshot = None
+        self.error = None
+
+def _claim_reload(auction_name):
+    """Return (reload, owner): the auction's in-flight reload, or a new one the caller must run."""
+    with _snapshot_lock:
+        reload = _reloads.get(auction_name)
+        if reload is not None:
+            return reload, False
+        reload = _reloads[auction_name] = _Reload()
+        return reload, True
+
+def _run_reload(auction_name, reload):
+    try:
+        reload.snapshot = load_snapshot(auction_name)
+    except Exception as e:
+        reload.error = e
+    finally:
+        with _snapshot_lock:
+            del _reloads[auction_name]
+            if reload.error is None:
+                _failed_at.pop(auction_name, None)
+            else:
+                _failed_at[auction_name] = time.time()
+        reload.done.set()
+
+def _refresh_in_background(auction_name, reload):
+    # Reloads serve /data, so they draw from the web share of the Drive quota
+    bind_quota(web_quota)
+    _run_reload(auction_name, reload)
+    if reload.error is not None:
+        logger.warning(f"Serving the stale {auction_name} snapshot; reload failed: {str(reload.error)}")
+
+def _get_auction_snapshot(auction_name):
+    """
+    The auction's snapshot. Only the very first read waits for Drive (once, however many
+    requests arrive meanwhile); after SNAPSHOT_TTL the stale snapshot keeps being served
+    while a single background thread reloads it.
+    """
+    with _snapshot_lock:
+        snapshot = _snapshots.get(auction_name)
+        failed_at = _failed_at.get(auction_name, 0)
+
+    if snapshot is None:
+        reload, owner = _claim_reload(auction_name)
+        if owner:
+            _run_reload(auction_name, reload)
+        else:
+            reload.done.wait()
+        if reload.error is not None:
+            raise reload.error
+        return reload.snapshot
+
+    now = time.time()
+    if now - snapshot['loaded_at'] > SNAPSHOT_TTL and now - failed_at > SNAPSHOT_RETRY_SECONDS:
+        reload, owner = _claim_reload(auction_name)
+        if owner:
+            threading.Thread(
+                target=_refresh_in_background, args=(auction_name, reload),
+                name=f"snapshot-{auction_name}", daemon=True
+            ).start()
+    return snapshot
+
+def _merge_snapshots(snapshots):
+    """One catalog across auctions; rows are tagged with their AUCTION since IDs repeat between auctions."""
+    return {
+        'catalog': merge_catalogs([(name, snapshot['catalog']) for name, snapshot in snapshots]),
+        'images': {},
+        'loaded_at': min(snapshot['loaded_at'] for _, snapshot in snapshots),
+        # Changes whenever one of the auctions gets a new version
+        'version': max(snapshot['version'] for _, snapshot in snapshots)
+    }
+
+def get_snapshot(auction_name=None):
+    """
+    Return the current snapshot, loading it when missing and refreshing it in the
+    background when older than SNAPSHOT_TTL. With several auctions configured and no auction_name, returns the merged catalog;
+    auctions whose data.csv does not exist yet are left out of it.
+    """
+    global _merged
+    auctions = get_auctions()
+    if auction_name is not None or len(auctions) == 1:
+        return _get_auction_snapshot(get_auction(auction_name).name)
+
+    snapshots = []
+    for auction in auctions:
+        try:
+            snapshots.append((auction.name, _get_auction_snapshot(auction.name)))
+        except SnapshotNotFoundError as e:
+            logger.warning(f"Leaving {auction.name} out of the merged catalog: {str(e)}")
+    if not snapshots:
+        raise SnapshotNotFoundError("No auction has published a data.csv yet")
+
+    # Rebuild the merged rows only when one of the auctions gets a new version
+    key = tuple((name, snapshot['version']) for name, snapshot in snapshots)
+    with _snapshot_lock:
+        merged = _merged
+    if merged is None or merged[0] != key:
+        merged = (key, _merge_snapshots(snapshots))
+        with _snapshot_lock:
+            _merged = merged
+    return merged[1]
+
+def invalidate_snapshot(auction_name=None):
+    """Drop the cached snapshot (all auctions when auction_name is None) so the next read goes to Drive."""
+    global _merged
+    with _snapshot_lock:
+        if auction_name is None:
+            _snapshots.clear()
+        else:
+            _snapshots.pop(auction_name, None)
+        _merged = None
@@ -0,0 +1,69 @@
+import os
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Set WARMUP_ON_BOOT=0 to skip background warm-up (e.g. for one-off scripts).
+WARMUP_ON_BOOT = os.getenv('WARMUP_ON_BOOT', '1') != '0'
+
+warmup_status = {
+    "started_at": None,
+    "finished_at": None,
+    "timings": {},
+    "error": None
+}
+_warmup_lock = threading.Lock()
+_warmup_thread = None
+
+def _timed(name, func):
+    start = time.perf_counter()
+    func()
+    warmup_status["timings"][name] = round((time.perf_counter() - start) * 1000, 1)
+
+def _import_heavy_modules():
+    import pandas
+    import googleapiclient.discovery
+    import services.downloading_csv_service
+
+def _load_discovery_document():
+    from services.oauth_service import get_discovery_document
+    get_discovery_document()
+
+def _authenticate():
+    from services.oauth_service import get_drive_service
+    get_drive_service()
+
+def _preload_snapshot():
+    from services.snapshot_service import load_snapshot
+    from services.auction_config_service import get_auctions
+    for auction in get_auctions():
+        load_snapshot(auction.name)
+
+def warm_up():
+    """
+    Pay the cold-start costs of the first /data request up front:
+    heavy imports, Drive discovery document, token load/refresh and the data snapshot.
+    """
+    warmup_status["started_at"] = time.time()
+    try:
+        _timed("imports", _import_heavy_modules)
+        _timed("discovery", _load_discovery_document)
+        _timed("auth", _authenticate)
+        _timed("snapshot", _preload_snapshot)
+        logger.info(f"Warm-up complete: {warmup_status['timings']}")
+    except Exception as e:
+        warmup_status["error"] = str(e)
+        logger.warning(f"Warm-up stopped early: {str(e)}")
+    finally:
+        warmup_status["finished_at"] = time.time()
+
+def start_warmup():
+    """Start warm-up in a daemon thread once per process."""
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is None and WARMUP_ON_BOOT:
+            _warmup_thread = threading.Thread(target=warm_up, name='warmup', daemon=True)
+            _warmup_thread.start()
+        return _warmup_thread
@@ -0,0 +1,242 @@
+import io
+import os
+import math
+import pandas as pd
+from services.oauth_service import get_drive_service
+from services.downloading_csv_service import (
+    find_folder_by_name, find_file_by_name, download_csv_as_dataframe, parse_and_load_vehicle_data
+)
+from services.transfer_data_service import list_folder_contents, prepare_catalog
+from services.copying_images_service import (
+    build_vehicle_tasks, list_source_folders, check_source, extract_folder_ids, SOURCE_BATCH_SIZE
+)
+from services.drive_mirror_service import mirrored_children
+from services.catalog_service import Catalog, diff_catalogs
+from services.quota_service import SYNC_QPS
+from services.tracing_service import start_trace, end_trace
+from services.auction_config_service import get_auction
+
+# Copy workers the pipeline runs side by side, for the latency-bound duration estimate
+PLAN_PARALLELISM = int(os.getenv('PLAN_PARALLELISM', '5'))
+# Assumed Drive round trip when the plan itself made no Drive calls to measure
+PLAN_DEFAULT_CALL_MS = float(os.getenv('PLAN_DEFAULT_CALL_MS', '150'))
+# Vehicle IDs listed per category in a plan; counts are always complete
+PLAN_MAX_IDS = int(os.getenv('PLAN_MAX_IDS', '100'))
+# Share of published rows changing at which a full sync is flagged as a likely accidental rebuild
+PLAN_REBUILD_RATIO = float(os.getenv('PLAN_REBUILD_RATIO', '0.9'))
+
+STRUCTURE_FOLDERS = ['Buffer', 'Images']
+STRUCTURE_FILES = ['buffer.csv', 'data.csv', 'images.json']
+
+def _as_csv_rows(df):
+    """The frame as it reads back from buffer.csv, so it compares like the sync's own check."""
+    return pd.read_csv(io.StringIO(df.to_csv(index=False)))
+
+def _ids(values):
+    # numpy scalars from the frames become plain ints for JSON
+    return [value.item() if hasattr(value, 'item') else value for value in sorted(values)[:PLAN_MAX_IDS]]
+
+def _find_structure(service, root_folder_name):
+    """IDs of the auction's folders and files, None for the ones the sync would create."""
+    root_folder_id = find_folder_by_name(service, root_folder_name)
+    found = {'root': root_folder_id}
+    for name in STRUCTURE_FOLDERS:
+        found[name] = find_folder_by_name(service, name, root_folder_id) if root_folder_id else None
+    for name in STRUCTURE_FILES:
+        found[name] = find_file_by_name(service, name, root_folder_id) if root_folder_id else None
+    return found
+
+def _diff_rows(sheet_df, published_df, vehicle_ids=None):
+    """Row changes keyed on ID, comparing every column but DRIVE LINK (it always points elsewhere)."""
+    def comparable(df):
+        df = df.drop(columns=['DRIVE LINK'], errors='ignore')
+        if vehicle_ids:
+            df = df[pd.to_numeric(df['ID'], errors='coerce').isin(vehicle_ids)]
+        return Catalog.from_frame(df)
+
+    sheet, published = comparable(sheet_df), comparable(published_df)
+    diff = diff_catalogs(published, sheet)
+    if diff is None:
+        raise ValueError("Sheet or data.csv has missing or duplicate IDs; rows cannot be compared")
+    changed, removed = diff
+    published_ids = set(published.frame['ID'])
+    added = {vehicle_id for vehicle_id in changed if vehicle_id not in published_ids}
+    return {
+        'sheet': len(sheet),
+        'published': len(published),
+        'added': len(added),
+        'removed': len(removed),
+        'changed': len(changed) - len(added),
+        'unchanged': len(sheet) - len(changed),
+        'added_ids': _ids(added),
+        'removed_ids': _ids(removed),
+        'changed_ids': _ids(changed - added)
+    }
+
+def plan_sync(auction=None, vehicle_ids=None):
+    """
+    Dry run of handle_sync_background: parse the sheet, compare it with the published
+    data.csv and list the source folders, without writing anything to Drive.
+    Returns the plan: rows added/removed/changed, images to copy, folders to
+    create/move/delete and the estimated Drive API calls and duration.
+    Listings made here are cached in the Drive mirror, so the sync that follows reuses them.
+    """
+    auction = auction or get_auction()
+    trace = start_trace(f"plan-{auction.name}")
+    try:
+        plan = _plan(auction, vehicle_ids)
+    finally:
+        summary = end_trace(trace)
+
+    calls = plan['api_calls']['estimated']
+    measured_ms = sum(method['total_ms'] for method in summary['methods'].values())
+    call_ms = measured_ms / summary['total_calls'] if summary['total_calls'] else PLAN_DEFAULT_CALL_MS
+    quota_seconds = calls / SYNC_QPS if SYNC_QPS > 0 else 0
+    latency_seconds = calls * call_ms / 1000 / PLAN_PARALLELISM
+    plan['api_calls']['made_by_plan'] = summary['total_calls']
+    plan['estimated_seconds'] = round(max(quota_seconds, latency_seconds), 1)
+    plan['estimate_basis'] = {
+        'drive_qps': SYNC_QPS,
+        'avg_call_ms': round(call_ms, 1),
+        'parallelism': PLAN_PARALLELISM,
+        # Counted before this plan listed them; the listings are now mirrored, so a sync
+        # started within the mirror's freshness window makes fewer calls than estimated
+        'list_sources_before_plan': plan['api_calls']['by_operation'].get('list_sources', 0),
+        'caveat': "list_sources counts source folders not mirrored before this plan, which then mirrored them"
+    }
+    return plan
+
+def _plan(auction, vehicle_ids):
+    service = get_drive_service()
+    structure = _find_structure(service, auction.root_folder)
+    missing = [name for name, file_id in structure.items() if not file_id]
+    calls = {'create_structure': len(missing)}
+    warnings = []
+    plan = {
+        'auction': auction.name,
+        'dry_run': True,
+        'kind': 'vehicles' if vehicle_ids else 'full',
+        'vehicle_ids': vehicle_ids,
+        'create_structure': missing
+    }
+
+    sheet_df = _as_csv_rows(prepare_catalog(parse_and_load_vehicle_data(
+        upload=False, sheet_url=auction.sheet_url, root_folder_name=auction.root_folder
+    )))
+    published_df = download_csv_as_dataframe(service, structure['data.csv']) if structure['data.csv'] else None
+    if published_df is None:
+        if vehicle_ids:
+            raise ValueError("data.csv is empty or unreadable; run a full sync before syncing single vehicles")
+        published_df = pd.DataFrame({'ID': pd.Series([], dtype='int64')})
+        warnings.append("No published data.csv: the sync builds the whole catalog")
+    else:
+        published_df = prepare_catalog(published_df)
+    plan['rows'] = _diff_rows(sheet_df, published_df, vehicle_ids)
+
+    if vehicle_ids:
+        plan['changes'] = True
+        plan['full_rebuild'] = False
+        calls['read_published'] = 3  # data.csv for the old folders and for the merge, images.json
+    else:
+        calls['upload_buffer'] = 1
+        calls['compare'] = 2
+        # The sync's own change check: the first 3 columns of buffer.csv and data.csv
+        plan['changes'] = not sheet_df.iloc[:, :3].equals(published_df.iloc[:, :3])
+        if not plan['changes']:
+            calls['clear_buffer'] = 1
+            plan.update(_empty_work())
+            plan['api_calls'] = {'estimated': sum(calls.values()), 'by_operation': calls}
+            plan['warnings'] = warnings
+            return plan
+
+        rows = plan['rows']
+        touched = rows['added'] + rows['removed'] + rows['changed']
+        plan['full_rebuild'] = True
+        if rows['published'] and (rows['changed'] + rows['removed']) >= rows['published'] * PLAN_REBUILD_RATIO:
+            warnings.append(
+                f"{rows['changed'] + rows['removed']} of {rows['published']} published rows change: "
+                "was the sheet reordered or replaced?"
+            )
+        elif touched < rows['sheet']:
+            warnings.append(
+                f"Only {touched} rows change, but a full sync re-copies all {rows['sheet']} vehicles; "
+                "a targeted sync of the changed IDs is cheaper"
+            )
+
+    # Source folders the sync would copy from
+    df = sheet_df
+    if vehicle_ids:
+        df = df[pd.to_numeric(df['ID'], errors='coerce').isin(vehicle_ids)]
+    tasks = build_vehicle_tasks(df)
+    folder_ids = [folder_id for _, folder_id in tasks if folder_id]
+    unlisted = sum(1 for folder_id in dict.fromkeys(folder_ids) if mirrored_children(service, folder_id) is None)
+    listings = list_source_folders(folder_ids)
+
+    vehicles_to_copy = images_to_copy = 0
+    skipped = []
+    for vehicle_index, source_folder_id in tasks:
+        vehicle_num = vehicle_index + 1
+        if not source_folder_id:
+            skipped.append({'vehicle_id': vehicle_num, 'reason': 'No valid drive link'})
+            continue
+        source = check_source(listings[source_folder_id])
+        if source['status'] == 'ok':
+            vehicles_to_copy += 1
+            images_to_copy += len(source['image_files'])
+        else:
+            skipped.append({'vehicle_id': vehicle_num, 'reason': source.get('reason') or source.get('error')})
+
+    # What the publish step replaces: all of Images, or the targeted vehicles' old folders
+    if vehicle_ids:
+        previous_folders = []
+        if 'DRIVE LINK' in published_df.columns:
+            linked = published_df[pd.to_numeric(published_df['ID'], errors='coerce').isin(vehicle_ids)]
+            previous_folders = [folder_id for folder_id in extract_folder_ids(linked['DRIVE LINK']) if folder_id]
+    else:
+        previous_folders = list_folder_contents(service, structure['Images']) if structure['Images'] else []
+    leftovers = list_folder_contents(service, structure['Buffer']) if structure['Buffer'] else []
+
+    plan['images'] = {
+        'vehicles_to_copy': vehicles_to_copy,
+        'images_to_copy': images_to_copy,
+        'vehicles_skipped': len(skipped),
+        'skipped': skipped[:PLAN_MAX_IDS]
+    }
+    plan['folders'] = {
+        'create': vehicles_to_copy,
+        'move_to_images': vehicles_to_copy,
+        'make_public': vehicles_to_copy,
+        'delete_from_images': len(previous_folders),
+        'delete_buffer_leftovers': len(leftovers)
+    }
+    if not vehicle_ids and vehicles_to_copy < len(previous_folders):
+        warnings.append(
+            f"Images has {len(previous_folders)} published folders but only {vehicles_to_copy} vehicles would be copied"
+        )
+
+    calls.update({
+        'delete_buffer_leftovers': len(leftovers),
+        # Drive counts every listing in a batch request; batches are one HTTP round trip per SOURCE_BATCH_SIZE
+        'list_sources': unlisted,
+        'create_folders': vehicles_to_copy,
+        'copy_images': images_to_copy,
+        'move_folders': vehicles_to_copy,
+        'make_public': vehicles_to_copy,
+        'publish': 2,
+        'delete_previous': len(previous_folders),
+        'clear_buffer': 1
+    })
+    plan['source_batches'] = math.ceil(unlisted / SOURCE_BATCH_SIZE)
+    plan['api_calls'] = {'estimated': sum(calls.values()), 'by_operation': calls}
+    plan['warnings'] = warnings
+    return plan
+
+def _empty_work():
+    return {
+        'full_rebuild': False,
+        'images': {'vehicles_to_copy': 0, 'images_to_copy': 0, 'vehicles_skipped': 0, 'skipped': []},
+        'folders': {
+            'create': 0, 'move_to_images': 0, 'make_public': 0, 'delete_from_images': 0, 'delete_buffer_leftovers': 0
+        },
+        'source_batches': 0
+    }
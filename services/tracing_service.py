@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import uuid
+import threading
+import logging
+from googleapiclient.http import HttpRequest
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv('DRIVE_TRACING', '1') != '0'
+TRACE_DIR = os.getenv('DRIVE_TRACE_DIR')
+
+# The trace a thread records into; syncs of different auctions run side by side
+_local = threading.local()
+
+class SyncTrace:
+    """Collects the Drive API spans recorded during one sync run."""
+
+    def __init__(self, name):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.step = None
+        self.start_time = time.time()
+        self.end_time = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add_span(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self):
+        """Aggregate spans per Drive method: call count, total/max latency, bytes and retries."""
+        with self._lock:
+            spans = list(self.spans)
+
+        methods = {}
+        for span in spans:
+            attrs = span['attributes']
+            entry = methods.setdefault(span['name'], {
+                'calls': 0,
+                'errors': 0,
+                'retries': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'response_bytes': 0
+            })
+            duration_ms = (span['end_time_unix_nano'] - span['start_time_unix_nano']) / 1e6
+            entry['calls'] += 1
+            entry['errors'] += 1 if span['status'] == 'ERROR' else 0
+            entry['retries'] += attrs.get('drive.retries', 0)
+            entry['total_ms'] += duration_ms
+            entry['max_ms'] = max(entry['max_ms'], duration_ms)
+            entry['response_bytes'] += attrs.get('http.response_size', 0)
+
+        for entry in methods.values():
+            entry['total_ms'] = round(entry['total_ms'], 1)
+            entry['max_ms'] = round(entry['max_ms'], 1)
+
+        return {
+            'trace_id': self.trace_id,
+            'total_calls': len(spans),
+            'methods': methods
+        }
+
+def start_trace(name='sync'):
+    """Start collecting spans for a sync on the calling thread."""
+    trace = SyncTrace(name)
+    bind_trace(trace)
+    return trace
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+def bind_trace(trace):
+    """Record this thread's Drive calls into trace (used by sync worker threads)."""
+    _local.trace = trace
+
+def set_step(step):
+    """Tag subsequent spans of the current trace with the sync step that issued them."""
+    trace = current_trace()
+    if trace:
+        trace.step = step
+
+def end_trace(trace):
+    """Stop collecting spans and dump them as JSONL when DRIVE_TRACE_DIR is set."""
+    if current_trace() is trace:
+        bind_trace(None)
+
+    trace.end_time = time.time()
+
+    if TRACE_DIR:
+        try:
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            stamp = time.strftime('%Y%m%d-%H%M%S', time.gmtime(trace.start_time))
+            path = os.path.join(TRACE_DIR, f"{trace.name}-{stamp}-{trace.trace_id[:8]}.jsonl")
+            with open(path, 'w') as trace_file:
+                for span in trace.spans:
+                    trace_file.write(json.dumps(span) + '\n')
+            logger.info(f"Wrote {len(trace.spans)} Drive API spans to {path}")
+        except Exception as e:
+            logger.error(f"Failed to write trace file: {str(e)}")
+
+    return trace.summary()
+
+def _begin_span(name):
+    trace = current_trace()
+    step = trace.step if trace else None
+
+    return {
+        'trace_id': trace.trace_id if trace else None,
+        'span_id': uuid.uuid4().hex[:16],
+        'name': name,
+        'start_time_unix_nano': time.time_ns(),
+        'end_time_unix_nano': None,
+        'status': 'OK',
+        'attributes': {
+            'sync.step': step,
+            'thread.name': threading.current_thread().name,
+            'drive.attempts': 0,
+            'drive.retries': 0,
+            'http.response_size': 0
+        },
+        '_trace': trace
+    }
+
+def _finish_span(span, error=None):
+    span['end_time_unix_nano'] = time.time_ns()
+    attrs = span['attributes']
+    attrs['drive.retries'] = max(attrs['drive.attempts'] - 1, 0)
+    if error is not None:
+        span['status'] = 'ERROR'
+        attrs['error.message'] = str(error)
+
+    trace = span.pop('_trace')
+    duration_ms = (span['end_time_unix_nano'] - span['start_time_unix_nano']) / 1e6
+    logger.debug(
+        f"{span['name']} {duration_ms:.1f}ms "
+        f"bytes={attrs['http.response_size']} retries={attrs['drive.retries']} step={attrs['sync.step']}"
+    )
+    if trace:
+        trace.add_span(span)
+
+def _span_name_for_uri(uri, method):
+    if 'alt=media' in uri:
+        return 'drive.files.get_media'
+    if '/batch/' in uri:
+        return 'drive.batch'
+    return f"HTTP {method}"
+
+class InstrumentedHttp:
+    """
+    Wraps the authorized httplib2 transport and records every HTTP attempt.
+    Attempts made inside a TracingHttpRequest.execute() are added to that span,
+    anything else (media downloads) gets a span of its own.
+    """
+
+    def __init__(self, http):
+        self._http = http
+
+    def request(self, uri, method='GET', *args, **kwargs):
+        span = getattr(_local, 'span', None)
+        owns_span = span is None
+        if owns_span:
+            span = _begin_span(_span_name_for_uri(uri, method))
+
+        attrs = span['attributes']
+        attrs['drive.attempts'] += 1
+        attrs['http.method'] = method
+
+        try:
+            resp, content = self._http.request(uri, method, *args, **kwargs)
+        except Exception as e:
+            if owns_span:
+                _finish_span(span, e)
+            raise
+
+        attrs['http.status_code'] = resp.status
+        attrs['http.response_size'] += len(content or b'')
+        if owns_span:
+            _finish_span(span, f"HTTP {resp.status}" if resp.status >= 400 else None)
+        return resp, content
+
+    def __getattr__(self, name):
+        return getattr(self._http, name)
+
+class TracingHttpRequest(HttpRequest):
+    """HttpRequest that opens a span named after the Drive method (e.g. drive.files.list)."""
+
+    def execute(self, http=None, num_retries=0):
+        if getattr(_local, 'span', None) is not None:
+            return super().execute(http=http, num_retries=num_retries)
+
+        span = _begin_span(self.methodId or _span_name_for_uri(self.uri, self.method))
+        _local.span = span
+        try:
+            result = super().execute(http=http, num_retries=num_retries)
+        except Exception as e:
+            _finish_span(span, e)
+            raise
+        finally:
+            _local.span = None
+
+        _finish_span(span)
+        return result
@@ -1,30 +1,22 @@
+import time
+import json
+import tempfile
 import pandas as pd
-from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
-import io
 from services.oauth_service import get_drive_service
-
-def find_folder_by_name(service, folder_name, parent_id=None):
-    """Find a folder by name, optionally within a parent folder."""
-    query = f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
-    if parent_id:
-        query += f" and '{parent_id}' in parents"
-    
-    results = service.files().list(q=query, fields='files(id, name)').execute()
-    files = results.get('files', [])
-    return files[0]['id'] if files else None
-
-def find_file_by_name(service, file_name, parent_id=None):
-    """Find a file by name, optionally within a parent folder."""
-    query = f"name='{file_name}' and trashed=false"
-    if parent_id:
-        query += f" and '{parent_id}' in parents"
-    
-    results = service.files().list(q=query, fields='files(id, name)').execute()
-    files = results.get('files', [])
-    return files[0]['id'] if files else None
+from services.drive_mirror_service import (
+    find_folder_by_name, find_file_by_name, mirrored_children, record_move, record_delete
+)
+from services.media_io_service import (
+    download_csv, download_json, upload_csv, upload_json, upload_file, clear_csv, iter_csv_chunks, upload_csv_chunks,
+    CHUNKED_CSV
+)
 
 def get_folders_in_folder(service, parent_folder_id):
     """Get all folders in a parent folder, sorted by name."""
+    folders = mirrored_children(service, parent_folder_id, folders_only=True)
+    if folders is not None:
+        return folders
+    
     query = f"'{parent_folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
     results = service.files().list(
         q=query,
@@ -34,18 +26,29 @@ def get_folders_in_folder(service, parent_folder_id):
     ).execute()
     return results.get('files', [])
 
-def delete_all_files_in_folder(service, folder_id):
-    """Delete all files and folders within a folder."""
+def list_folder_contents(service, folder_id):
+    """Get all files and folders within a folder."""
+    files = mirrored_children(service, folder_id)
+    if files is not None:
+        return files
+    
     query = f"'{folder_id}' in parents and trashed=false"
     results = service.files().list(
         q=query,
         fields='files(id, name)',
         pageSize=1000
     ).execute()
-    
-    files = results.get('files', [])
+    return results.get('files', [])
+
+def delete_files(service, files):
+    """Delete the given files and folders."""
     for file in files:
         service.files().delete(fileId=file['id']).execute()
+        record_delete([file['id']])
+
+def delete_all_files_in_folder(service, folder_id):
+    """Delete all files and folders within a folder."""
+    delete_files(service, list_folder_contents(service, folder_id))
 
 def move_file(service, file_id, new_parent_id, old_parent_id):
     """Move a file to a new parent folder."""
@@ -55,6 +58,7 @@ def move_file(service, file_id, new_parent_id, old_parent_id):
         removeParents=old_parent_id,
         fields='id, parents'
     ).execute()
+    record_move(file_id, new_parent_id)
 
 def make_folder_public(service, folder_id):
     """Make a folder publicly accessible (anyone with link can view)."""
@@ -68,29 +72,218 @@ def make_folder_public(service, folder_id):
         fields='id'
     ).execute()
 
+def publish_vehicle_folder(service, folder_id, images_folder_id, buffer_folder_id):
+    """Move a vehicle folder from Buffer to Images and make it public."""
+    move_file(service, folder_id, images_folder_id, buffer_folder_id)
+    make_folder_public(service, folder_id)
+
+def build_folder_map(folders):
+    """Map numbered folder names (vehicle IDs) to folder IDs, ignoring non-numeric names."""
+    names = pd.to_numeric(pd.Series([folder['name'] for folder in folders], dtype=object), errors='coerce')
+    folder_ids = pd.Series([folder['id'] for folder in folders], dtype=object)
+    numbered = names.notna() & (names == names.round())
+    return dict(zip(names[numbered].astype(int), folder_ids[numbered]))
+
+def build_drive_links(vehicle_ids, folder_map):
+    """
+    Build the DRIVE LINK column for a Series of vehicle IDs in one vectorized pass.
+    IDs without a folder in folder_map get an empty link.
+    """
+    ids = pd.to_numeric(vehicle_ids, errors='coerce')
+    folder_ids = ids.map(folder_map)
+    return ('https://drive.google.com/drive/folders/' + folder_ids.astype('string')).fillna('').astype(object)
+
+def build_image_manifest(image_results, vehicle_ids):
+    """
+    Build the images.json manifest from copy_images_from_buffer results.
+    Maps each vehicle ID (as a string) to its ordered list of image entries.
+    """
+    wanted = {str(vehicle_id) for vehicle_id in vehicle_ids}
+    vehicles = {}
+    for result in image_results or []:
+        vehicle_id = str(result['vehicle_num'])
+        if vehicle_id in wanted and result.get('images'):
+            vehicles[vehicle_id] = sorted(result['images'], key=lambda image: image['position'])
+    return {
+        'generated_at': time.time(),
+        'vehicles': vehicles
+    }
+
+class SpilledImageResults:
+    """
+    Copy results kept for the image manifest in a temporary file instead of in memory
+    (chunked mode): one JSON line per vehicle with images, read back one at a time.
+    """
+    
+    def __init__(self):
+        self._file = tempfile.TemporaryFile('w+', encoding='utf-8')
+    
+    def append(self, result):
+        if result.get('images'):
+            entry = {'vehicle_num': result['vehicle_num'], 'images': result['images']}
+            self._file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+    
+    def __iter__(self):
+        self._file.flush()
+        self._file.seek(0)
+        for line in self._file:
+            yield json.loads(line)
+        self._file.seek(0, 2)
+    
+    def close(self):
+        self._file.close()
+
+def upload_image_manifest(service, images_json_id, image_results, vehicle_ids):
+    """
+    Chunked version of upload_json(build_image_manifest(...)): images.json is written
+    one vehicle at a time into a temporary file and uploaded from there.
+    """
+    wanted = {str(vehicle_id) for vehicle_id in vehicle_ids}
+    with tempfile.TemporaryFile() as file_obj:
+        file_obj.write(b'{"generated_at":%s,"vehicles":{' % json.dumps(time.time()).encode('utf-8'))
+        separator = b''
+        for result in image_results or []:
+            vehicle_id = str(result['vehicle_num'])
+            if vehicle_id in wanted and result.get('images'):
+                images = sorted(result['images'], key=lambda image: image['position'])
+                entry = json.dumps({vehicle_id: images}, separators=(',', ':'))[1:-1]
+                file_obj.write(separator + entry.encode('utf-8'))
+                separator = b','
+        file_obj.write(b'}}')
+        upload_file(service, images_json_id, file_obj, 'application/json')
+
+def prepare_catalog(df, first_id=1):
+    """
+    Drop unnamed columns and make sure the ID column exists as the first column.
+    first_id numbers missing IDs when df is one chunk of a larger catalog.
+    """
+    # Remove unnamed columns
+    df = df[[col for col in df.columns if not str(col).startswith('Unnamed')]]
+    
+    # Ensure ID column exists as first column
+    if 'ID' not in df.columns:
+        df.insert(0, 'ID', range(first_id, first_id + len(df)))
+    return df
+
+def apply_drive_links(df, folder_map):
+    """Replace the DRIVE LINK column with links to the published Images folders."""
+    # Remove the DRIVE LINK column if it exists
+    if 'DRIVE LINK' in df.columns:
+        df = df.drop('DRIVE LINK', axis=1)
+    
+    # Create new DRIVE LINK column with Images folder links
+    df['DRIVE LINK'] = build_drive_links(df['ID'], folder_map)
+    return df
+
+def merge_vehicle_rows(existing_df, updated_df, removed_ids=()):
+    """
+    Replace rows of existing_df whose ID is in updated_df (appending unknown IDs) and drop
+    rows whose ID is in removed_ids, ordered by ID.
+    """
+    replaced = existing_df['ID'].isin(updated_df['ID']) | existing_df['ID'].isin(list(removed_ids))
+    merged = pd.concat([existing_df[~replaced], updated_df], ignore_index=True)
+    return merged.sort_values('ID', kind='stable').reset_index(drop=True)
+
+def merge_vehicle_row_chunks(existing_chunks, updated_df, removed_ids=()):
+    """
+    Chunked version of merge_vehicle_rows for a data.csv ordered by ID (as every sync
+    writes it): each chunk loses its replaced and removed rows and gains the updated
+    rows up to its last ID; updated IDs past the end are appended last.
+    """
+    replaced_ids = list(updated_df['ID']) + list(removed_ids)
+    pending = updated_df.sort_values('ID', kind='stable')
+    first_id = 1
+    for chunk in existing_chunks:
+        chunk = prepare_catalog(chunk, first_id)
+        first_id += len(chunk)
+        if len(chunk) == 0:
+            continue
+        due = pending['ID'] <= chunk['ID'].iloc[-1]
+        merged = pd.concat([chunk[~chunk['ID'].isin(replaced_ids)], pending[due]], ignore_index=True)
+        pending = pending[~due]
+        yield merged.sort_values('ID', kind='stable')
+    if len(pending):
+        yield pending
+
+def publish_data_csv(service, df, folder_map, data_csv_id, images_json_id=None, image_results=None):
+    """
+    Overwrite data.csv with the catalog, pointing DRIVE LINK at the published
+    Images folders, and write the image manifest next to it.
+    """
+    df = apply_drive_links(df, folder_map)
+    
+    # Upload to data.csv (override completely)
+    upload_csv(service, data_csv_id, df)
+    
+    # Publish the per-vehicle image manifest alongside data.csv
+    if images_json_id:
+        upload_json(service, images_json_id, build_image_manifest(image_results, df['ID'].tolist()))
+
+def publish_data_csv_chunks(service, chunks, folder_map, data_csv_id, images_json_id=None, image_results=None):
+    """
+    Chunked version of publish_data_csv: catalog chunks (e.g. from iter_csv_chunks)
+    are prepared and written to data.csv one at a time. Only the IDs of vehicles
+    with copy results are kept for the image manifest, which is streamed too.
+    """
+    result_ids = {str(result['vehicle_num']) for result in image_results or []}
+    manifest_ids = []
+    
+    def published_chunks(rows_written=0):
+        for chunk in chunks:
+            chunk = apply_drive_links(prepare_catalog(chunk, rows_written + 1), folder_map)
+            rows_written += len(chunk)
+            ids = chunk['ID'].astype(str)
+            manifest_ids.extend(ids[ids.isin(result_ids)])
+            yield chunk
+    
+    upload_csv_chunks(service, data_csv_id, published_chunks())
+    
+    if images_json_id:
+        upload_image_manifest(service, images_json_id, image_results, manifest_ids)
+
+def publish_vehicle_rows(service, df, folder_map, data_csv_id, images_json_id=None, image_results=None,
+                         removed_ids=()):
+    """
+    Replace only the rows of the vehicles in df in data.csv and their entries in images.json,
+    leaving every other vehicle as published before. removed_ids (vehicles no longer
+    in the sheet) are dropped from both, just as their Images folders are.
+    """
+    df = apply_drive_links(df, folder_map)
+    removed_ids = list(removed_ids)
+    
+    if CHUNKED_CSV:
+        # iter_csv_chunks reads from its own temporary copy, so data.csv can be overwritten meanwhile
+        upload_csv_chunks(service, data_csv_id, merge_vehicle_row_chunks(iter_csv_chunks(service, data_csv_id), df, removed_ids))
+    else:
+        existing_df = prepare_catalog(download_csv(service, data_csv_id))
+        upload_csv(service, data_csv_id, merge_vehicle_rows(existing_df, df, removed_ids))
+    
+    if images_json_id:
+        manifest = download_json(service, images_json_id) or {'vehicles': {}}
+        updated = build_image_manifest(image_results, df['ID'].tolist())
+        for vehicle_id in df['ID'].tolist() + removed_ids:
+            manifest['vehicles'].pop(str(vehicle_id), None)
+        manifest['vehicles'].update(updated['vehicles'])
+        manifest['generated_at'] = updated['generated_at']
+        upload_json(service, images_json_id, manifest)
+
 def clear_csv_file(service, file_id):
     """Clear the contents of a CSV file."""
-    csv_buffer = io.BytesIO()
-    csv_buffer.write(b'')
-    csv_buffer.seek(0)
-    
-    media = MediaIoBaseUpload(csv_buffer, mimetype='text/csv', resumable=True)
-    service.files().update(
-        fileId=file_id,
-        media_body=media
-    ).execute()
+    clear_csv(service, file_id)
 
-def transfer_buffer_to_data():
+def transfer_buffer_to_data(image_results=None, root_folder_name='Revive Auctions'):
     """
     Transfer buffer.csv to data.csv with new drive links.
     Clear buffer.csv and move all Buffer folder contents to Images folder.
+    Writes images.json next to data.csv from the image copy results, so galleries
+    can be rendered without listing Drive folders.
     """
     service = get_drive_service()
     
-    # Find Revive Auctions folder
-    root_folder_id = find_folder_by_name(service, 'Revive Auctions')
+    # Find the root folder
+    root_folder_id = find_folder_by_name(service, root_folder_name)
     if not root_folder_id:
-        raise ValueError("Revive Auctions folder not found")
+        raise ValueError(f"{root_folder_name} folder not found")
     
     # Find Buffer and Images folders
     buffer_folder_id = find_folder_by_name(service, 'Buffer', root_folder_id)
@@ -104,24 +297,8 @@ def transfer_buffer_to_data():
     if not buffer_csv_id or not data_csv_id:
         raise ValueError("buffer.csv or data.csv not found")
     
-    # Download buffer.csv
-    request = service.files().get_media(fileId=buffer_csv_id)
-    file_buffer = io.BytesIO()
-    downloader = MediaIoBaseDownload(file_buffer, request)
-    
-    done = False
-    while not done:
-        status, done = downloader.next_chunk()
-    
-    file_buffer.seek(0)
-    df = pd.read_csv(file_buffer)
-    
-    # Remove unnamed columns
-    df = df[[col for col in df.columns if not str(col).startswith('Unnamed')]]
-    
-    # Ensure ID column exists as first column
-    if 'ID' not in df.columns:
-        df.insert(0, 'ID', range(1, len(df) + 1))
+    # Download buffer.csv (streamed chunk by chunk while data.csv is written in chunked mode)
+    df = None if CHUNKED_CSV else prepare_catalog(download_csv(service, buffer_csv_id))
     
     # Clear Images folder (delete all contents)
     delete_all_files_in_folder(service, images_folder_id)
@@ -130,46 +307,20 @@ def transfer_buffer_to_data():
     buffer_folders = get_folders_in_folder(service, buffer_folder_id)
     
     # Create a mapping of folder number to folder ID (before moving)
-    folder_map = {}
-    for folder in buffer_folders:
-        try:
-            folder_num = int(folder['name'])
-            folder_map[folder_num] = folder['id']
-        except ValueError:
-            continue
+    folder_map = build_folder_map(buffer_folders)
     
     # Move all folders from Buffer to Images and make them public
     for item in buffer_folders:
-        move_file(service, item['id'], images_folder_id, buffer_folder_id)
-        make_folder_public(service, item['id'])
-    
-    # Remove the DRIVE LINK column if it exists
-    if 'DRIVE LINK' in df.columns:
-        df = df.drop('DRIVE LINK', axis=1)
+        publish_vehicle_folder(service, item['id'], images_folder_id, buffer_folder_id)
     
-    # Create new DRIVE LINK column with Images folder links
-    drive_links = []
-    for i in range(len(df)):
-        vehicle_id = int(df.iloc[i]['ID'])
-        if vehicle_id in folder_map:
-            folder_id = folder_map[vehicle_id]
-            drive_link = f"https://drive.google.com/drive/folders/{folder_id}"
-        else:
-            drive_link = ""
-        drive_links.append(drive_link)
-    
-    df['DRIVE LINK'] = drive_links
-    
-    # Upload to data.csv (override completely)
-    csv_buffer = io.BytesIO()
-    df.to_csv(csv_buffer, index=False, encoding='utf-8')
-    csv_buffer.seek(0)
-    
-    media = MediaIoBaseUpload(csv_buffer, mimetype='text/csv', resumable=True)
-    service.files().update(
-        fileId=data_csv_id,
-        media_body=media
-    ).execute()
+    # Write data.csv and images.json
+    images_json_id = find_file_by_name(service, 'images.json', root_folder_id)
+    if CHUNKED_CSV:
+        publish_data_csv_chunks(
+            service, iter_csv_chunks(service, buffer_csv_id), folder_map, data_csv_id, images_json_id, image_results
+        )
+    else:
+        publish_data_csv(service, df, folder_map, data_csv_id, images_json_id, image_results)
     
     # Clear buffer.csv
     clear_csv_file(service, buffer_csv_id)
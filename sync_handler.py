@@ -1,13 +1,46 @@
 from services.folder_structure_service import create_folders
-from services.downloading_csv_service import parse_and_load_vehicle_data, compare_buffer_and_data_csv, find_folder_by_name, find_file_by_name
-from services.copying_images_service import copy_images_from_buffer
-from services.transfer_data_service import transfer_buffer_to_data, clear_csv_file
+from services.downloading_csv_service import parse_and_load_vehicle_data, compare_buffer_and_data_csv
+from services.transfer_data_service import clear_csv_file
+from services.pipeline_service import run_sync_pipeline
+from services.tracing_service import start_trace, set_step, end_trace
+from services.events_service import publish
+from services.job_queue_service import SyncCancelledError, raise_if_cancelled
+from services.auction_config_service import get_auction
+from services.media_io_service import CHUNKED_CSV
 
-def handle_sync_background(status_dict):
+def _set_step(status_dict, step):
+    """Update the visible sync step and tag Drive API spans with it."""
+    status_dict["current_step"] = step
+    set_step(step)
+    publish('step', auction=status_dict.get("auction"), step=step)
+
+def handle_sync_background(status_dict, cancel_event=None, vehicle_ids=None, auction=None):
     """
     Handle sync in background thread with status updates.
     Returns result dict with success and changes info.
+    Every Drive API call made during the sync is traced; the per-method
+    summary is added to the result under "api_calls".
+    
+    Args:
+        status_dict: Shared status dict updated with the current step
+        cancel_event: Optional threading.Event checked between steps and by
+            worker threads; raises SyncCancelledError once set
+        vehicle_ids: Only re-sync these vehicle IDs (default: None for a full sync)
+        auction: Auction to sync, with its own sheet and folder tree
+            (default: None for the first configured auction)
     """
+    auction = auction or get_auction()
+    trace = start_trace(f"sync-{auction.name}")
+    try:
+        result = _run_sync(status_dict, cancel_event, vehicle_ids, auction)
+    finally:
+        summary = end_trace(trace)
+        print(f"Drive API calls during sync: {summary['total_calls']}")
+    
+    result["api_calls"] = summary
+    return result
+
+def _run_sync(status_dict, cancel_event, vehicle_ids, auction):
     from services.oauth_service import AuthenticationError, ConfigurationError
     
     folder_ids = None
@@ -15,8 +48,8 @@ def handle_sync_background(status_dict):
     
     # Step 1: Ensure folder structure exists
     try:
-        status_dict["current_step"] = "Step 1: Creating/verifying folder structure"
-        folder_ids = create_folders()
+        _set_step(status_dict, "Step 1: Creating/verifying folder structure")
+        folder_ids = create_folders(auction.root_folder)
         print("Step 1 complete: Folder structure created/verified")
     except AuthenticationError as e:
         print(f"Authentication error: {str(e)}")
@@ -28,10 +61,17 @@ def handle_sync_background(status_dict):
         print(f"Error creating folder structure: {str(e)}")
         raise Exception(f"Folder structure error: {str(e)}")
     
+    raise_if_cancelled(cancel_event)
+    
     # Step 2: Parse and load vehicle data to buffer.csv
     try:
-        status_dict["current_step"] = "Step 2: Loading vehicle data to buffer"
-        parse_and_load_vehicle_data()
+        _set_step(status_dict, "Step 2: Loading vehicle data to buffer")
+        # Targeted syncs leave buffer.csv alone; it belongs to full syncs
+        vehicle_df = parse_and_load_vehicle_data(
+            upload=not vehicle_ids,
+            sheet_url=auction.sheet_url,
+            root_folder_name=auction.root_folder
+        )
         print("Step 2 complete: Vehicle data loaded to buffer.csv")
     except AuthenticationError as e:
         print(f"Authentication error: {str(e)}")
@@ -43,52 +83,71 @@ def handle_sync_background(status_dict):
         print(f"Error parsing and loading vehicle data: {str(e)}")
         raise Exception(f"Data parsing error: {str(e)}")
     
-    # Check if buffer.csv is same as data.csv (first 3 columns only)
-    try:
-        status_dict["current_step"] = "Comparing data for changes"
-        if compare_buffer_and_data_csv():
-            print("Changes detected: No")
-            
-            # Clear buffer.csv since no changes detected
-            try:
-                from services.oauth_service import get_drive_service
-                service = get_drive_service()
-                root_folder_id = find_folder_by_name(service, 'Revive Auctions')
-                buffer_csv_id = find_file_by_name(service, 'buffer.csv', root_folder_id)
-                if buffer_csv_id:
-                    clear_csv_file(service, buffer_csv_id)
-            except Exception as e:
-                print(f"Warning: Failed to clear buffer.csv: {str(e)}")
-            
-            return {"success": True, "changes": False}
-        else:
-            changes_detected = True
-            print("Changes detected: Yes")
-    except Exception as e:
-        print(f"Error comparing CSVs: {str(e)}")
+    if CHUNKED_CSV and not vehicle_ids:
+        # Full syncs stream the catalog back from buffer.csv instead of holding the frame
+        vehicle_df = None
+    
+    raise_if_cancelled(cancel_event)
+    
+    if vehicle_ids:
+        # Targeted syncs always re-copy the requested vehicles
         changes_detected = True
-        print("Changes detected: Yes (comparison failed, proceeding)")
+        print(f"Targeted sync of vehicles {vehicle_ids}: skipping comparison")
+    else:
+        # Check if buffer.csv is same as data.csv (first 3 columns only)
+        try:
+            _set_step(status_dict, "Comparing data for changes")
+            if compare_buffer_and_data_csv(auction.root_folder):
+                print("Changes detected: No")
+                
+                # Clear buffer.csv since no changes detected
+                try:
+                    from services.oauth_service import get_drive_service
+                    service = get_drive_service()
+                    if folder_ids['buffer_csv_id']:
+                        clear_csv_file(service, folder_ids['buffer_csv_id'])
+                except Exception as e:
+                    print(f"Warning: Failed to clear buffer.csv: {str(e)}")
+                
+                return {"success": True, "changes": False}
+            else:
+                changes_detected = True
+                print("Changes detected: Yes")
+        except Exception as e:
+            print(f"Error comparing CSVs: {str(e)}")
+            changes_detected = True
+            print("Changes detected: Yes (comparison failed, proceeding)")
     
-    # Step 3: Copy images from drive links to buffer folders
-    try:
-        status_dict["current_step"] = "Step 3: Copying images to buffer folders"
-        results = copy_images_from_buffer()
-        print("Step 3 complete: Images copied to buffer folders")
-    except AuthenticationError as e:
-        print(f"Authentication error: {str(e)}")
-        raise Exception(f"Authentication required: {str(e)}")
-    except ConfigurationError as e:
-        print(f"Configuration error: {str(e)}")
-        raise Exception(f"Configuration error: {str(e)}")
-    except Exception as e:
-        print(f"Error copying images: {str(e)}")
-        raise Exception(f"Image copying error: {str(e)}")
+    raise_if_cancelled(cancel_event)
     
-    # Step 4: Transfer buffer.csv to data.csv with new drive links
+    # Steps 3-4: Create folders, copy images and publish to Images/data.csv as one pipeline
     try:
-        status_dict["current_step"] = "Step 4: Transferring data to data.csv"
-        transfer_buffer_to_data()
-        print("Step 4 complete: Data transferred to data.csv")
+        step = "Step 3: Copying images and publishing data (pipelined)"
+        _set_step(status_dict, step)
+        
+        def on_progress(done, total, result):
+            status_dict["current_step"] = f"{step} - {done}/{total} vehicles" if total else f"{step} - {done} vehicles"
+            publish(
+                'vehicle',
+                auction=auction.name,
+                vehicle_num=result['vehicle_num'],
+                status=result['status'],
+                images_copied=result.get('images_copied', 0),
+                error=result.get('error'),
+                done=done,
+                total=total
+            )
+        
+        run_sync_pipeline(
+            vehicle_df, folder_ids,
+            on_progress=on_progress,
+            vehicle_ids=vehicle_ids,
+            cancel_event=cancel_event
+        )
+        print("Steps 3-4 complete: Images copied and data published to data.csv")
+    except SyncCancelledError:
+        print("Sync cancelled")
+        raise
     except AuthenticationError as e:
         print(f"Authentication error: {str(e)}")
         raise Exception(f"Authentication required: {str(e)}")
@@ -96,8 +155,8 @@ def handle_sync_background(status_dict):
         print(f"Configuration error: {str(e)}")
         raise Exception(f"Configuration error: {str(e)}")
     except Exception as e:
-        print(f"Error transferring data: {str(e)}")
-        raise Exception(f"Data transfer error: {str(e)}")
+        print(f"Error in copy/publish pipeline: {str(e)}")
+        raise Exception(f"Image copying error: {str(e)}")
     
     return {"success": True, "changes": changes_detected}
 